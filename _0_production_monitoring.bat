@@ -2,7 +2,7 @@
 setlocal enabledelayedexpansion
 
 :: Configuration
-set PYTHON_SCRIPTS=_1_getTransparencyAPI.py _2_parser_csv.py _3_import_csv.py _4_ProductionReporting_Telegram_bot.py
+set PYTHON_SCRIPTS=_1_getTransparencyAPI.py _2_parser_csv.py _3_import_csv.py _3b_detect_unit_events.py _4_ProductionReporting_Telegram_bot.py
 set TARGET_MINUTE=50  :: Exécution à XX:50
 
 :main_loop
@@ -13,7 +13,10 @@ echo Démarrage du cycle de traitement...
 for %%S in (%PYTHON_SCRIPTS%) do (
     echo Exécution de %%S...
     python %%S
-    if errorlevel 1 (
+    set RC=!errorlevel!
+    if !RC! equ 2 (
+        echo Avertissement : %%S en échec partiel, cycle poursuivi
+    ) else if !RC! geq 1 (
         echo Erreur lors de l'exécution de %%S
         pause
         exit /b 1
@@ -4,7 +4,7 @@ color 1E
 setlocal enabledelayedexpansion
 
 :: Configuration
-set PYTHON_SCRIPTS=_1_getTransparencyAPI.py _2_parser_csv.py _3_import_csv.py _4_ProductionReporting_Telegram_bot.py
+set PYTHON_SCRIPTS=_1_getTransparencyAPI.py _2_parser_csv.py _3_import_csv.py _3b_detect_unit_events.py _4_ProductionReporting_Telegram_bot.py
 set TARGET_MINUTE=28
 set LAST_RUN_HOUR=-1
 
@@ -60,8 +60,8 @@ for %%S in (%PYTHON_SCRIPTS%) do (
         exit /b 1
     )
     
-    :: Add 60-second pause after the 4th Python script
-    if !SCRIPT_COUNT! EQU 4 (
+    :: Add 60-second pause after the 5th Python script
+    if !SCRIPT_COUNT! EQU 5 (
         echo.
         echo Pause de 1 secondes après l'exécution du dernier script...
         timeout /t 1 /nobreak >nul
@@ -1,13 +1,23 @@
 import os
+import sys
+import argparse
 import dotenv
-from entsoe import EntsoePandasClient
 import pytz
-import pandas as pd
 from datetime import datetime, timedelta
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-import requests
 import logging
-import glob # Added for finding files
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from high_water_marks import read_fleet_high_water_mark
+from pipeline_metrics import StageMetrics
+from raw_output import RAW_OUTPUT_FORMAT, raw_files_for_zone, read_raw_index, write_raw
+from startup_profile import PROFILE_OPTION, run_profiled
+from unit_unavailability import write_notices
+from zones import DEFAULT_ZONE, configured_zones
 
 # --- Configuration ---
 dotenv.load_dotenv()
@@ -15,19 +25,23 @@ token = os.getenv('API_TOKEN')
 DATA_DIRECTORY = os.getenv('DATA_DIRECTORY')
 
 # --- Mode Configuration ---
-HISTORY_MODE = True # Set to True to enable history filling mode
+HISTORY_MODE = os.getenv('HISTORY_MODE', 'true').lower() in ('1', 'true', 'yes') # Set to True to enable history filling mode
 GAP_THRESHOLD_HOURS = 3 # Minimum gap duration (in hours) to trigger history fill
 MAX_HISTORY_FETCH_HOURS = 240 # Maximum duration (in hours) to fetch in one history run
+ZONES = configured_zones() # Bidding zones to fetch (ENTSOE_ZONES, default FR)
+MAX_REQUESTS_PER_MINUTE = int(os.getenv('ENTSOE_MAX_REQUESTS_PER_MINUTE', '360')) # ENTSO-E allows 400 requests/min per token
+MAX_WORKERS = int(os.getenv('ENTSOE_MAX_WORKERS', '8')) # Maximum number of zones fetched concurrently
+NORMAL_MODE_OVERLAP_MINUTES = int(os.getenv('NORMAL_MODE_OVERLAP_MINUTES', '60')) # Normal mode re-fetches this much before the last imported data (late revisions)
+NORMAL_MODE_MIN_INTERVAL_MINUTES = int(os.getenv('NORMAL_MODE_MIN_INTERVAL_MINUTES', '15')) # Normal mode skips a zone successfully fetched less than this ago (one 15-min publication step)
+EXIT_PARTIAL_FAILURE = 2 # Exit code when only some of the queried zones failed (the others can still be processed)
+FETCH_UNAVAILABILITY = os.getenv('FETCH_UNAVAILABILITY', 'true').lower() in ('1', 'true', 'yes') # Also fetch generation unit unavailability notices (A80) for the same window
+db_path = 'production.db' # Database holding the high-water marks written by _3_import_csv.py
 # --- End Mode Configuration ---
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Check if DATA_DIRECTORY is set
-if not DATA_DIRECTORY:
-    logger.error("La variable d'environnement DATA_DIRECTORY n'est pas définie.")
-    exit() # Exit if the directory isn't specified
+# Mesures de l'étape (durées, latence API, relances, volumes), démarrées par main()
+metrics = StageMetrics('fetch', start=False)
 
 # --- ENTSO-e Client and Retry Strategy ---
 # Définir le nombre maximal de tentatives et le délai d'attente initial pour la stratégie de relance
@@ -36,36 +50,82 @@ INITIAL_WAIT = 1 # secondes
 
 # Définir une fonction pour vérifier si l'exception est une erreur de connexion
 def is_connection_error(exception):
+    import requests
     return isinstance(exception, requests.exceptions.ConnectionError) or \
            isinstance(exception, requests.exceptions.Timeout) or \
            isinstance(exception, requests.exceptions.ConnectTimeout)
 
+# Compter les relances pour les métriques avant chaque attente
+def count_retry(retry_state):
+    metrics.inc('api_retries')
+    logger.warning(f"Tentative {retry_state.attempt_number} échouée, nouvelle tentative dans {retry_state.next_action.sleep:.1f} s.")
+
 # Définir une stratégie de relance avec un délai exponentiel et un arrêt après un certain nombre de tentatives
-retry_strategy = retry(
-    retry=retry_if_exception_type(is_connection_error),
-    stop=stop_after_attempt(MAX_RETRIES),
-    wait=wait_exponential(multiplier=INITIAL_WAIT, min=INITIAL_WAIT, max=60), # Délai entre 1 et 60 secondes
-    reraise=True  # Important: relève l'exception après le nombre maximal de tentatives
-)
+# (tenacity n'est importé que lorsqu'une requête est effectuée)
+def retry_strategy(func):
+    from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+    return retry(
+        retry=retry_if_exception(is_connection_error),
+        stop=stop_after_attempt(MAX_RETRIES),
+        wait=wait_exponential(multiplier=INITIAL_WAIT, min=INITIAL_WAIT, max=60), # Délai entre 1 et 60 secondes
+        before_sleep=count_retry,
+        reraise=True  # Important: relève l'exception après le nombre maximal de tentatives
+    )(func)
+
+class RateLimiter:
+    """
+    Limiteur de débit à fenêtre glissante, partagé entre les threads de
+    récupération : au plus `max_calls` appels par période de `period` secondes.
+    """
+
+    def __init__(self, max_calls, period=60.0):
+        self.max_calls = max_calls
+        self.period = period
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] >= self.period:
+                    self.calls.popleft()
+                if len(self.calls) < self.max_calls:
+                    self.calls.append(now)
+                    return
+                wait = self.period - (now - self.calls[0])
+            metrics.inc('rate_limit_wait_seconds', wait)
+            time.sleep(wait)
+
+
+def create_client(limiter):
+    """
+    Crée le client entsoe-py (importé seulement si une requête est à effectuer)
+    sur une session HTTP appliquant le limiteur de débit à chaque requête, y
+    compris aux requêtes journalières émises par entsoe-py pour une même période.
+    """
+    import requests
+    from entsoe import EntsoePandasClient
+
+    class RateLimitedSession(requests.Session):
+        def request(self, *args, **kwargs):
+            limiter.acquire()
+            return super().request(*args, **kwargs)
 
-# Initialiser le client avec un timeout plus long (en secondes)
-client = EntsoePandasClient(api_key=token, timeout=120) # Increased timeout further
-logger.info("Client EntsoePandasClient initialisé.")
+    # Initialiser le client avec un timeout plus long (en secondes)
+    # retry_count=1 : les relances sont gérées uniquement par retry_strategy (et comptées dans les métriques)
+    client = EntsoePandasClient(api_key=token, timeout=120, retry_count=1, session=RateLimitedSession()) # Increased timeout further
+    logger.info(f"Client EntsoePandasClient initialisé (zones : {', '.join(ZONES)}).")
+    return client
+
+
+rate_limiter = RateLimiter(MAX_REQUESTS_PER_MINUTE)
 
 # --- File Handling ---
 script_name = os.path.basename(__file__) if '__file__' in locals() else 'interactive_script' # Handle interactive use
 timestamp_now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
 output_folder = DATA_DIRECTORY  # Nom du dossier
 
-# Vérifier si le dossier existe, sinon le créer
-if not os.path.exists(output_folder):
-    try:
-        os.makedirs(output_folder)
-        logger.info(f"Le dossier {output_folder} a été créé.")
-    except OSError as e:
-        logger.error(f"Erreur lors de la création du dossier {output_folder}: {e}")
-        exit() # Exit if directory creation fails
-
 output_filename_template = f"{output_folder}/{timestamp_now_str}_{script_name.replace('.py', '')}_output.csv"
 
 # --- Timezone ---
@@ -73,38 +133,63 @@ cet = pytz.timezone('Europe/Paris')
 
 # --- Helper Functions ---
 
-def get_start_time_normal_mode(output_folder):
+def get_start_time_normal_mode(output_folder, zone=DEFAULT_ZONE):
+    """
+    (Normal Mode) Détermine l'heure de début à partir de la marque de haute eau
+    de la zone enregistrée en base par l'import (dernier timestamp importé),
+    moins NORMAL_MODE_OVERLAP_MINUTES pour récupérer les révisions tardives.
+    Sans marque en base, se rabat sur le fichier brut le plus récent de la zone.
+    """
+    import pandas as pd
+    try:
+        high_water_mark = read_fleet_high_water_mark(db_path, zone)
+    except sqlite3.Error as e:
+        logger.warning(f"Mode normal: Lecture de la marque de haute eau {zone} impossible : {e}")
+        high_water_mark = None
+    if high_water_mark is None:
+        logger.info(f"Mode normal: Aucune marque de haute eau {zone} en base, recherche dans les fichiers bruts.")
+        return get_start_time_from_files(output_folder, zone)
+
+    # Heure locale de Paris sans fuseau : l'heure ambiguë du passage à l'heure d'hiver est prise au plus tôt
+    last_imported = pd.Timestamp(high_water_mark).tz_localize(cet, ambiguous=True, nonexistent='shift_forward')
+    new_start = last_imported + timedelta(minutes=1) - timedelta(minutes=NORMAL_MODE_OVERLAP_MINUTES)
+    logger.info(f"Mode normal: Dernier timestamp importé ({zone}) : {last_imported}, heure de début calculée "
+                f"avec {NORMAL_MODE_OVERLAP_MINUTES} min de recouvrement : {new_start}")
+    return new_start
+
+
+def get_start_time_from_files(output_folder, zone=DEFAULT_ZONE):
     """
     (Normal Mode) Détermine l'heure de début en fonction du fichier le plus récent
-    dans le dossier de sortie. Si aucun fichier n'est trouvé ou si une erreur
-    survient, retourne maintenant - 2 heures.
+    de la zone dans le dossier de sortie. Si aucun fichier n'est trouvé ou si une
+    erreur survient, retourne maintenant - 2 heures.
     """
+    import pandas as pd
     try:
         # Trouver le fichier le plus récent basé sur le nom (qui contient le timestamp)
-        list_of_files = glob.glob(os.path.join(output_folder, '*_output.csv'))
+        list_of_files = raw_files_for_zone(output_folder, zone)
         if not list_of_files:
-            logger.info("Aucun fichier CSV trouvé pour le mode normal. Utilisation de now - 2 heures.")
+            logger.info("Aucun fichier brut trouvé pour le mode normal. Utilisation de now - 2 heures.")
             return pd.Timestamp(datetime.now(cet) - timedelta(hours=2)).tz_convert(cet)
 
         latest_file = max(list_of_files, key=os.path.getctime) # Find by creation/modification time
         logger.info(f"Mode normal: Fichier le plus récent trouvé : {os.path.basename(latest_file)}")
 
-        # Lire la dernière date du fichier le plus récent
-        # Important: Assumer que la première colonne est l'index de temps
-        df_latest = pd.read_csv(latest_file, index_col=0, parse_dates=True)
-        if df_latest.empty:
+        # Lire la dernière date du fichier le plus récent (index de temps seul)
+        latest_index = read_raw_index(latest_file)
+        if latest_index.empty:
              logger.warning(f"Le fichier {latest_file} est vide. Utilisation de now - 2 heures.")
              return pd.Timestamp(datetime.now(cet) - timedelta(hours=2)).tz_convert(cet)
 
         # Assurer que l'index est de type DatetimeIndex et localisé
-        if not isinstance(df_latest.index, pd.DatetimeIndex):
-             raise ValueError("L'index du fichier CSV n'est pas un DatetimeIndex.")
-        if df_latest.index.tz is None:
-             df_latest.index = df_latest.index.tz_localize(cet, ambiguous='infer') # Localize if naive
+        if not isinstance(latest_index, pd.DatetimeIndex):
+             raise ValueError("L'index du fichier brut n'est pas un DatetimeIndex.")
+        if latest_index.tz is None:
+             latest_index = latest_index.tz_localize(cet, ambiguous='infer') # Localize if naive
         else:
-             df_latest.index = df_latest.index.tz_convert(cet) # Convert if different tz
+             latest_index = latest_index.tz_convert(cet) # Convert if different tz
 
-        last_timestamp_in_file = df_latest.index.max()
+        last_timestamp_in_file = latest_index.max()
         logger.info(f"Mode normal: Dernier timestamp trouvé dans {os.path.basename(latest_file)}: {last_timestamp_in_file}")
 
         # Le nouveau start est juste après le dernier timestamp trouvé
@@ -114,7 +199,7 @@ def get_start_time_normal_mode(output_folder):
         return new_start.tz_convert(cet) # Ensure timezone
 
     except FileNotFoundError:
-        logger.info("Aucun fichier CSV trouvé pour le mode normal (FileNotFound). Utilisation de now - 2 heures.")
+        logger.info("Aucun fichier brut trouvé pour le mode normal (FileNotFound). Utilisation de now - 2 heures.")
         return pd.Timestamp(datetime.now(cet) - timedelta(hours=2)).tz_convert(cet)
     except pd.errors.EmptyDataError:
          logger.warning(f"Le fichier {latest_file} semble vide (EmptyDataError). Utilisation de now - 2 heures.")
@@ -124,26 +209,27 @@ def get_start_time_normal_mode(output_folder):
         return pd.Timestamp(datetime.now(cet) - timedelta(hours=2)).tz_convert(cet)
 
 
-def load_all_timestamps(output_folder, tz):
+def load_all_timestamps(output_folder, tz, zone=DEFAULT_ZONE):
     """
-    (History Mode) Charge tous les timestamps uniques de tous les fichiers CSV
-    dans le dossier de sortie et les retourne triés.
+    (History Mode) Charge tous les timestamps uniques de tous les fichiers bruts
+    de la zone (tous formats) dans le dossier de sortie et les retourne triés.
     """
+    import pandas as pd
     all_timestamps = set()
-    csv_files = glob.glob(os.path.join(output_folder, '*_output.csv'))
-    logger.info(f"Mode historique: Recherche des fichiers CSV dans {output_folder}. Trouvé {len(csv_files)} fichiers.")
+    raw_files = raw_files_for_zone(output_folder, zone)
+    logger.info(f"Mode historique: Recherche des fichiers bruts {zone} dans {output_folder}. Trouvé {len(raw_files)} fichiers.")
 
-    for f in csv_files:
+    for f in raw_files:
         try:
-            # Lire seulement l'index (colonne 0) pour l'efficacité
-            df = pd.read_csv(f, index_col=0, parse_dates=True, usecols=[0])
-            if not df.empty:
+            # Lire seulement l'index pour l'efficacité
+            index = read_raw_index(f)
+            if not index.empty:
                  # Assurer la localisation/conversion du fuseau horaire
-                 if df.index.tz is None:
-                     df.index = df.index.tz_localize(tz, ambiguous='infer')
+                 if index.tz is None:
+                     index = index.tz_localize(tz, ambiguous='infer')
                  else:
-                     df.index = df.index.tz_convert(tz)
-                 all_timestamps.update(df.index.tolist())
+                     index = index.tz_convert(tz)
+                 all_timestamps.update(index.tolist())
             else:
                  logger.warning(f"Mode historique: Fichier vide ignoré: {os.path.basename(f)}")
 
@@ -155,7 +241,7 @@ def load_all_timestamps(output_folder, tz):
             logger.error(f"Mode historique: Erreur de lecture du fichier {os.path.basename(f)}: {e}. Fichier ignoré.")
 
     if not all_timestamps:
-        logger.info("Mode historique: Aucun timestamp n'a pu être chargé depuis les fichiers CSV.")
+        logger.info("Mode historique: Aucun timestamp n'a pu être chargé depuis les fichiers bruts.")
         return pd.Series([], dtype='datetime64[ns, Europe/Paris]') # Return empty Series with correct dtype and tz
 
     # Convertir en Series pandas, trier et supprimer les doublons (au cas où)
@@ -193,12 +279,12 @@ def find_first_gap(sorted_timestamps, gap_threshold_td):
         logger.info(f"Mode historique: Aucun écart supérieur à {gap_threshold_td} trouvé dans les données existantes.")
         return None, None
 
-@retry_strategy
-def query_data(country_code, start, end):
+def query_data(client, country_code, start, end):
     """
-    Récupère les données de production par unité pour un pays donné,
-    avec une stratégie de relance.
+    Récupère les données de production par unité pour un pays donné
+    (à appeler à travers retry_strategy).
     """
+    import pandas as pd
     # Ensure start/end have the correct timezone right before query
     start_aware = start.tz_convert('Europe/Paris')
     end_aware = end.tz_convert('Europe/Paris')
@@ -214,7 +300,8 @@ def query_data(country_code, start, end):
         return pd.DataFrame()
 
     try:
-        data = client.query_generation_per_plant(country_code=country_code, start=start_aware, end=end_aware)
+        with metrics.timer('api_request', zone=country_code):
+            data = client.query_generation_per_plant(country_code=country_code, start=start_aware, end=end_aware)
         logger.info(f"Requête réussie. {len(data) if data is not None else 0} lignes reçues.")
         # Ensure the resulting DataFrame index is timezone-aware
         if data is not None and not data.empty:
@@ -229,86 +316,240 @@ def query_data(country_code, start, end):
         raise
 
 
-# --- Main Logic ---
-start_fetch = None
-end_fetch = None
-df_result = None
+def query_unavailability(client, country_code, start, end):
+    """
+    Récupère les avis d'indisponibilité des unités de production d'un pays
+    sur la période (à appeler à travers retry_strategy). Retourne None si
+    ENTSO-E ne publie aucun avis pour la période.
+    """
+    from entsoe.exceptions import NoMatchingDataError
+    try:
+        with metrics.timer('unavailability_request', zone=country_code):
+            return client.query_unavailability_of_generation_units(
+                country_code=country_code, start=start.tz_convert('Europe/Paris'), end=end.tz_convert('Europe/Paris'))
+    except NoMatchingDataError:
+        return None
 
-if HISTORY_MODE:
-    logger.info("--- Mode Historique activé ---")
-    gap_threshold_td = timedelta(hours=GAP_THRESHOLD_HOURS)
-    max_fetch_td = timedelta(hours=MAX_HISTORY_FETCH_HOURS)
 
-    # 1. Charger tous les timestamps existants
-    all_timestamps = load_all_timestamps(output_folder, cet)
+def fetch_unavailability(client, zone, start_fetch, end_fetch, output_prefix):
+    """
+    Récupère et sauvegarde les avis d'indisponibilité d'une zone. Un échec est
+    journalisé sans faire échouer la récupération de la zone : les données de
+    production restent la référence du rapport.
+    """
+    try:
+        notices = retry_strategy(query_unavailability)(client, country_code=zone, start=start_fetch, end=end_fetch)
+        if notices is None or notices.empty:
+            metrics.set('unavailability_rows', 0, zone=zone)
+            logger.info(f"[{zone}] Aucun avis d'indisponibilité pour la période.")
+            return
+        notices_filename = write_notices(notices, output_prefix)
+    except Exception as e:
+        metrics.inc('unavailability_failed', zone=zone)
+        logger.error(f"[{zone}] Échec de la récupération des avis d'indisponibilité : {e}", exc_info=True)
+        return
+    metrics.set('unavailability_rows', len(notices), zone=zone)
+    logger.info(f"[{zone}] {notices['mrid'].nunique()} avis d'indisponibilité sauvegardés dans {notices_filename}")
 
-    if all_timestamps.empty:
-        # Cas où il n'y a AUCUNE donnée historique
-        logger.info("Mode historique: Aucune donnée existante trouvée. Tentative de récupération des dernières {} heures.".format(MAX_HISTORY_FETCH_HOURS))
-        end_fetch = pd.Timestamp(datetime.now(cet))
-        start_fetch = end_fetch - max_fetch_td
-        logger.info(f"Mode historique: Période initiale de récupération : Début={start_fetch}, Fin={end_fetch}")
-    else:
-        # 2. Trouver le premier écart significatif
-        gap_start, gap_end = find_first_gap(all_timestamps, gap_threshold_td)
-
-        if gap_start is not None and gap_end is not None:
-            # 3. Définir la période de récupération pour combler l'écart
-            start_fetch = gap_start + timedelta(seconds=1) # Start just after the last known data point before the gap
-            potential_end_fetch = gap_end - timedelta(seconds=1) # End just before the first known data point after the gap
-
-            # Limiter la durée de récupération à MAX_HISTORY_FETCH_HOURS
-            if (potential_end_fetch - start_fetch) > max_fetch_td:
-                end_fetch = start_fetch + max_fetch_td
-                logger.info(f"Mode historique: Durée de l'écart ({potential_end_fetch - start_fetch}) dépasse le maximum ({max_fetch_td}). Limite de la fin à {end_fetch}.")
-            else:
-                end_fetch = potential_end_fetch
 
-            logger.info(f"Mode historique: Période de récupération de l'écart : Début={start_fetch}, Fin={end_fetch}")
+def plan_fetch_window(zone):
+    """
+    Détermine la période à récupérer pour une zone selon le mode.
+    Retourne (start_fetch, end_fetch), ou (None, None) si rien n'est à récupérer.
+    """
+    import pandas as pd
+    start_fetch = None
+    end_fetch = None
+
+    if HISTORY_MODE:
+        gap_threshold_td = timedelta(hours=GAP_THRESHOLD_HOURS)
+        max_fetch_td = timedelta(hours=MAX_HISTORY_FETCH_HOURS)
+
+        # 1. Charger tous les timestamps existants
+        with metrics.timer('load_timestamps', zone=zone):
+            all_timestamps = load_all_timestamps(output_folder, cet, zone)
+
+        if all_timestamps.empty:
+            # Cas où il n'y a AUCUNE donnée historique
+            logger.info("Mode historique [{}]: Aucune donnée existante trouvée. Tentative de récupération des dernières {} heures.".format(zone, MAX_HISTORY_FETCH_HOURS))
+            end_fetch = pd.Timestamp(datetime.now(cet))
+            start_fetch = end_fetch - max_fetch_td
+            logger.info(f"Mode historique [{zone}]: Période initiale de récupération : Début={start_fetch}, Fin={end_fetch}")
         else:
-            logger.info("Mode historique: Aucun écart nécessitant un comblement n'a été trouvé. Le script va se terminer.")
-            # start_fetch et end_fetch restent None, donc pas de requête
+            # 2. Trouver le premier écart significatif
+            gap_start, gap_end = find_first_gap(all_timestamps, gap_threshold_td)
+
+            if gap_start is not None and gap_end is not None:
+                # 3. Définir la période de récupération pour combler l'écart
+                start_fetch = gap_start + timedelta(seconds=1) # Start just after the last known data point before the gap
+                potential_end_fetch = gap_end - timedelta(seconds=1) # End just before the first known data point after the gap
+
+                # Limiter la durée de récupération à MAX_HISTORY_FETCH_HOURS
+                if (potential_end_fetch - start_fetch) > max_fetch_td:
+                    end_fetch = start_fetch + max_fetch_td
+                    logger.info(f"Mode historique [{zone}]: Durée de l'écart ({potential_end_fetch - start_fetch}) dépasse le maximum ({max_fetch_td}). Limite de la fin à {end_fetch}.")
+                else:
+                    end_fetch = potential_end_fetch
+
+                logger.info(f"Mode historique [{zone}]: Période de récupération de l'écart : Début={start_fetch}, Fin={end_fetch}")
+            else:
+                logger.info(f"Mode historique [{zone}]: Aucun écart nécessitant un comblement n'a été trouvé.")
+                # start_fetch et end_fetch restent None, donc pas de requête
 
-else: # Normal Mode (History = False)
-    logger.info("--- Mode Normal activé ---")
-    start_fetch = get_start_time_normal_mode(output_folder)
-    end_fetch = pd.Timestamp(datetime.now(cet)).tz_convert(cet) # Ensure timezone
-    logger.info(f"Mode normal: Période de récupération : Début={start_fetch}, Fin={end_fetch}")
+    else: # Normal Mode (History = False)
+        with metrics.timer('start_time_lookup', zone=zone):
+            start_fetch = get_start_time_normal_mode(output_folder, zone)
+        end_fetch = pd.Timestamp(datetime.now(cet)).tz_convert(cet) # Ensure timezone
+        logger.info(f"Mode normal [{zone}]: Période de récupération : Début={start_fetch}, Fin={end_fetch}")
 
-# --- Exécution de la requête et sauvegarde (si une période a été définie) ---
-if start_fetch is not None and end_fetch is not None and start_fetch < end_fetch:
-    try:
-        # Exemple de requête pour obtenir les données de production par unité en France
-        df_result = query_data(country_code='FR', start=start_fetch, end=end_fetch)
-
-        if df_result is not None and not df_result.empty:
-            # Construire le nom de fichier final avec les dates réelles utilisées
-            start_str = start_fetch.strftime('%Y%m%d%H%M')
-            end_str = end_fetch.strftime('%Y%m%d%H%M')
-            mode_str = "HIST" if HISTORY_MODE else "NORM"
-            final_output_filename = f"{output_folder}/{script_name.replace('.py', '')}_{mode_str}_{start_str}_to_{end_str}.csv"
-
-            # Sauvegarder les données dans un fichier CSV
-            df_result.to_csv(final_output_filename)
-            logger.info(f"Les données ({len(df_result)} lignes) ont été sauvegardées dans {final_output_filename}")
-        elif df_result is not None and df_result.empty:
-             logger.info("La requête n'a retourné aucune donnée pour la période spécifiée.")
-        else:
-             logger.warning("La requête a retourné None.")
+    return start_fetch, end_fetch
 
-    except Exception as e:
-        # Log l'erreur finale si la requête échoue après les relances
-        logger.error(f"Échec final de la récupération des données après plusieurs tentatives : {e}", exc_info=True) # Log traceback
 
-elif start_fetch is not None and end_fetch is not None and start_fetch >= end_fetch:
-    logger.warning(f"Calcul de période invalide (début >= fin): Début={start_fetch}, Fin={end_fetch}. Aucune donnée récupérée.")
-else:
-    logger.info("Aucune période de récupération valide définie. Aucune requête effectuée.")
+def fetch_zone(client, zone):
+    """
+    Récupère et sauvegarde les données d'une zone. Retourne False si la
+    récupération a échoué après les relances, True sinon.
+    """
+    start_fetch, end_fetch = plan_fetch_window(zone)
+
+    # --- Exécution de la requête et sauvegarde (si une période a été définie) ---
+    if start_fetch is not None and end_fetch is not None and start_fetch < end_fetch:
+        metrics.set('window_seconds', (end_fetch - start_fetch).total_seconds(), zone=zone)
+        # Construire le nom de fichier final avec la zone et les dates réelles utilisées
+        start_str = start_fetch.strftime('%Y%m%d%H%M')
+        end_str = end_fetch.strftime('%Y%m%d%H%M')
+        mode_str = "HIST" if HISTORY_MODE else "NORM"
+        output_prefix = f"{output_folder}/{script_name.replace('.py', '')}_{zone}_{mode_str}_{start_str}_to_{end_str}"
+
+        # Les avis d'indisponibilité sont récupérés pendant la requête de production
+        # (même client, même limiteur de débit) : le cycle n'est pas allongé
+        notices_executor = ThreadPoolExecutor(max_workers=1) if FETCH_UNAVAILABILITY else None
+        if notices_executor is not None:
+            notices_future = notices_executor.submit(fetch_unavailability, client, zone, start_fetch, end_fetch, output_prefix)
+        try:
+            df_result = retry_strategy(query_data)(client, country_code=zone, start=start_fetch, end=end_fetch)
+
+            if df_result is not None and not df_result.empty:
+                # Sauvegarder les données au format configuré (RAW_OUTPUT_FORMAT)
+                with metrics.timer('write_output', zone=zone, format=RAW_OUTPUT_FORMAT):
+                    final_output_filename = write_raw(df_result, output_prefix)
+                metrics.set('rows_fetched', len(df_result), zone=zone)
+                metrics.set('columns_fetched', len(df_result.columns), zone=zone)
+                metrics.set('bytes_written', os.path.getsize(final_output_filename), zone=zone)
+                logger.info(f"[{zone}] Les données ({len(df_result)} lignes) ont été sauvegardées dans {final_output_filename}")
+            elif df_result is not None and df_result.empty:
+                 logger.info(f"[{zone}] La requête n'a retourné aucune donnée pour la période spécifiée.")
+            else:
+                 logger.warning(f"[{zone}] La requête a retourné None.")
+
+        except Exception as e:
+            # Log l'erreur finale si la requête échoue après les relances
+            logger.error(f"[{zone}] Échec final de la récupération des données après plusieurs tentatives : {e}", exc_info=True) # Log traceback
+            return False
+        finally:
+            if notices_executor is not None:
+                notices_future.result()
+                notices_executor.shutdown()
+
+    elif start_fetch is not None and end_fetch is not None and start_fetch >= end_fetch:
+        logger.warning(f"[{zone}] Calcul de période invalide (début >= fin): Début={start_fetch}, Fin={end_fetch}. Aucune donnée récupérée.")
+    else:
+        logger.info(f"[{zone}] Aucune période de récupération valide définie. Aucune requête effectuée.")
+    return True
+
 
+def last_normal_fetch_time(output_folder, zone=DEFAULT_ZONE):
+    """
+    (Normal Mode) Heure (secondes depuis l'epoch) de la dernière récupération
+    réussie de la zone en mode normal : date de modification de son dernier
+    fichier brut NORM, écrit seulement si la requête a retourné des données.
+    None si aucun fichier.
+    """
+    files = [f for f in raw_files_for_zone(output_folder, zone) if '_NORM_' in os.path.basename(f)]
+    return max(map(os.path.getmtime, files), default=None)
+
+
+def is_up_to_date(zone):
+    """
+    (Normal Mode) Vrai si la zone a été récupérée avec succès il y a moins de
+    NORMAL_MODE_MIN_INTERVAL_MINUTES : cette récupération couvrait déjà le
+    recouvrement de NORMAL_MODE_OVERLAP_MINUTES, et les pas publiés ou révisés
+    depuis sont récupérés par le premier cycle suivant cet intervalle. La zone
+    n'est pas interrogée (ni pandas ni entsoe-py importés).
+    """
+    last_fetch = last_normal_fetch_time(output_folder, zone)
+    if last_fetch is None:
+        return False
+    return time.time() - last_fetch < NORMAL_MODE_MIN_INTERVAL_MINUTES * 60
 
-logger.info("--- Fin du script ---")
 
-# En mode historique, on sort explicitement après une tentative (qu'elle ait réussi, échoué ou trouvé aucun gap)
-if HISTORY_MODE:
-    logger.info("Mode historique: Sortie du script après une tentative de comblement.")
-    # L'exécution se termine ici naturellement
\ No newline at end of file
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Récupération des données de production ENTSO-E")
+    parser.add_argument(PROFILE_OPTION, action='store_true',
+                        help="Exécute le script et affiche le coût des imports par module")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.profile_startup:
+        return run_profiled(os.path.abspath(__file__), [a for a in argv if a != PROFILE_OPTION])
+
+    # Configuration du logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    metrics.start()
+
+    # Check if DATA_DIRECTORY is set
+    if not DATA_DIRECTORY:
+        logger.error("La variable d'environnement DATA_DIRECTORY n'est pas définie.")
+        return 1
+
+    # Vérifier si le dossier existe, sinon le créer
+    if not os.path.exists(output_folder):
+        try:
+            os.makedirs(output_folder)
+            logger.info(f"Le dossier {output_folder} a été créé.")
+        except OSError as e:
+            logger.error(f"Erreur lors de la création du dossier {output_folder}: {e}")
+            return 1
+
+    logger.info(f"--- Mode {'Historique' if HISTORY_MODE else 'Normal'} activé ---")
+
+    zones = ZONES
+    if not HISTORY_MODE:
+        # Cycle rapproché : les zones à jour ne sont pas interrogées
+        zones = [zone for zone in ZONES if not is_up_to_date(zone)]
+        for zone in ZONES:
+            if zone not in zones:
+                logger.info(f"Mode normal [{zone}]: Dernière récupération réussie il y a moins de "
+                            f"{NORMAL_MODE_MIN_INTERVAL_MINUTES} min, aucune requête effectuée.")
+        metrics.set('zones_up_to_date', len(ZONES) - len(zones))
+
+    zone_results = {}
+    if zones:
+        client = create_client(rate_limiter)
+        # Les zones sont récupérées en parallèle ; le limiteur de débit partagé
+        # garantit le respect du quota ENTSO-E quel que soit le nombre de zones.
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(zones)))) as executor:
+            zone_results = dict(zip(zones, executor.map(partial(fetch_zone, client), zones)))
+
+    failed_zones = [zone for zone, succeeded in zone_results.items() if not succeeded]
+    if failed_zones:
+        logger.error(f"Échec de la récupération pour les zones : {', '.join(failed_zones)}")
+    metrics.set('zones', len(ZONES))
+    metrics.set('zones_failed', len(failed_zones))
+    metrics.finish(success=not failed_zones)
+    logger.info("--- Fin du script ---")
+
+    # En mode historique, on sort explicitement après une tentative (qu'elle ait réussi, échoué ou trouvé aucun gap)
+    if HISTORY_MODE:
+        logger.info("Mode historique: Sortie du script après une tentative de comblement.")
+    if failed_zones:
+        # Échec visible de l'ordonnanceur : code distinct si d'autres zones ont été récupérées
+        return 1 if len(failed_zones) == len(zone_results) else EXIT_PARTIAL_FAILURE
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,20 @@
-import pandas as pd
 import logging
-import numpy as np
 import os
+import sys
+import time
+import argparse
 from dotenv import load_dotenv  # Import dotenv
 
-# Configurer le logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s'  # Ajout du nom de fichier
-)
+from pipeline_metrics import StageMetrics
+from raw_output import most_recent_raw_file_per_zone, raw_format, read_raw_columns
+from startup_profile import PROFILE_OPTION, run_profiled
+from zones import configured_zones
+
 logger = logging.getLogger(__name__)
 
+# Mesures de l'étape, démarrées par main()
+metrics = StageMetrics('parse', start=False)
+
 # Répertoire contenant les fichiers CSV (codé en dur)
 
 DIRECTORY = "Grafana_Sqlite"
@@ -19,127 +23,246 @@ load_dotenv()
 DIRECTORY = os.getenv('DATA_DIRECTORY')
 
 
-# Fonction pour trouver le fichier CSV le plus récent dans un répertoire
-def get_most_recent_csv(directory):
+# Fonction pour trouver le fichier brut le plus récent de chaque zone dans un répertoire
+def get_most_recent_raw_file_per_zone(directory):
     try:
-        # Lister tous les fichiers dans le répertoire
-        all_files = os.listdir(directory)
-        # Filtrer les fichiers avec l'extension .csv
-        csv_files = [f for f in all_files if f.endswith('output.csv')]
-        if not csv_files:
-            raise FileNotFoundError(f"Aucun fichier CSV trouvé dans le répertoire {directory}.")
-
-        # Trier les fichiers par date de modification (du plus récent au plus ancien)
-        csv_files.sort(key=lambda x: os.path.getmtime(os.path.join(directory, x)), reverse=True)
-        # Retourner le chemin complet du fichier le plus récent
-        return os.path.join(directory, csv_files[0])
+        # Fichiers bruts (suffixe output.csv, output.parquet ou output.arrow) les plus récents par zone,
+        # selon leur date de modification
+        raw_files = most_recent_raw_file_per_zone(directory, configured_zones())
+        if not raw_files:
+            raise FileNotFoundError(f"Aucun fichier brut trouvé dans le répertoire {directory}.")
+        return raw_files
     except Exception as e:
-        logger.error(f"Erreur lors de la recherche du fichier CSV le plus récent : {e}")
+        logger.error(f"Erreur lors de la recherche du fichier brut le plus récent : {e}")
         raise
 
-# Obtenir le fichier CSV le plus récent
-try:
-    csv_file = get_most_recent_csv(DIRECTORY)
-    logger.info(f"Fichier CSV le plus récent sélectionné : {csv_file}")
-except FileNotFoundError as e:
-    logger.error(e)
-    exit(1)
-
-# Charger le fichier CSV
-logger.info("Chargement du fichier CSV...")
-df = pd.read_csv(csv_file)  # Utilisation du fichier CSV le plus récent
-
-# Vérifier si le DataFrame est vide
-if df.empty:
-    logger.error(f"Le fichier CSV {csv_file} est vide ou mal formaté")
-    exit(1)
-
-logger.info(f"Fichier CSV chargé avec {len(df)} lignes et {len(df.columns)} colonnes.")
-
-# Rajouter 'TIME' comme entête de la première colonne
-logger.info("Ajout de 'TIME' comme entête de la première colonne...")
-df.columns.values[0] = 'TIME'
-logger.info(f"Entêtes actuelles : {df.columns.tolist()}")
-
-# Identifier les colonnes où "nuclear" apparaît en seconde ligne
-logger.info("Identification des colonnes contenant 'nuclear' en seconde ligne...")
-try:
-    second_row = df.iloc[0]  # La seconde ligne (index 0 après l'entête)
-    columns_to_keep = [col for col in df.columns if 'nuclear' in str(second_row[col]).lower()]
-except IndexError:
-    logger.error("Le fichier CSV ne contient pas suffisamment de lignes pour l'analyse")
-    exit(1)
-
-# Ajouter la colonne 'TIME' aux colonnes à conserver
-if 'TIME' not in columns_to_keep:
-    columns_to_keep.insert(0, 'TIME')
-logger.info(f"Colonnes à conserver : {columns_to_keep}")
-
-# Filtrer le DataFrame pour ne garder que les colonnes identifiées
-logger.info("Filtrage des colonnes...")
-filtered_df = df[columns_to_keep]
-logger.info(f"DataFrame filtré avec {len(filtered_df.columns)} colonnes.")
-
-# Trier les colonnes après la première ('TIME') par ordre alphabétique
-logger.info("Tri des colonnes après la première par ordre alphabétique...")
-sorted_columns = ['TIME'] + sorted(filtered_df.columns[1:])
-filtered_df = filtered_df[sorted_columns]
-logger.info(f"Colonnes triées : {sorted_columns}")
-
-# Vérifier si la troisième ligne contient "Actual Consumption" et ajouter '-' devant les valeurs
-logger.info("Vérification de la présence de 'Actual Consumption' dans la troisième ligne...")
-third_row = filtered_df.iloc[1]  # Troisième ligne (index 1)
-# Afficher les valeurs de la troisième ligne pour déboguer
-logger.info(f"Valeurs de la troisième ligne :\n{third_row}")
-for col in filtered_df.columns:
-    # Ignorer la casse et les espaces
-    logger.info(f"Test sur'{str(third_row[col]).strip().lower()}' dans la colonne '{col}'")
-    if str(third_row[col]).strip().lower() == "actual consumption":
-        logger.info(f"Ajout du signe '-' devant les valeurs de la colonne '{col}' à partir de la 4ème ligne.")
-        # Ajouter '-' devant les valeurs à partir de la 4ème ligne (index 2)
-        filtered_df.loc[2:, col] = '-' + filtered_df.loc[2:, col].astype(str)
-    else:
-        logger.info(f"La colonne '{col}' ne contient pas 'Actual Consumption' dans la troisième ligne.")
-
-# Remplacer les espaces par la lettre 'T' dans la première colonne ('TIME')
-logger.info("Remplacement des espaces par 'T' dans la première colonne...")
-filtered_df['TIME'] = filtered_df['TIME'].str.replace(' ', 'T')
-logger.info("Espaces remplacés par 'T' dans la colonne 'TIME'.")
-
-# Supprimer la seconde et la troisième ligne (index 0 et 1 après l'entête)
-logger.info("Suppression de la seconde et troisième ligne...")
-filtered_df = filtered_df.drop([0, 1])  # Supprimer les lignes d'index 0 et 1
-logger.info(f"DataFrame après suppression des lignes, il reste {len(filtered_df)} lignes.")
-
-# Remplacer '-nan' par une chaîne vide dans tout le DataFrame
-logger.info("Remplacement des valeurs '-nan' par une chaîne vide...")
-filtered_df = filtered_df.replace('-nan', '', regex=True)
-logger.info("Valeurs '-nan' remplacées par une chaîne vide.")
-
-# Fusionner les colonnes avec des en-têtes similaires
-logger.info("Fusion des colonnes avec des en-têtes similaires...")
-columns_to_drop = []  # Liste pour stocker les colonnes à supprimer après fusion
-for i in range(len(filtered_df.columns) - 1):
-    current_col = filtered_df.columns[i]
-    next_col = filtered_df.columns[i + 1]
-    # Vérifier si l'en-tête de la colonne actuelle est contenu dans l'en-tête de la colonne suivante
-    if current_col in next_col:
-        logger.info(f"Fusion des colonnes '{current_col}' et '{next_col}'...")
-        # Parcourir chaque ligne de la colonne actuelle
-        for index, value in filtered_df[current_col].items():
-            # Si la valeur est vide ou NaN, remplacer par la valeur correspondante de la colonne suivante
-            if pd.isna(value) or value == '':
-                filtered_df.at[index, current_col] = filtered_df.at[index, next_col]
-        # Ajouter la colonne suivante à la liste des colonnes à supprimer
-        columns_to_drop.append(next_col)
-
-# Supprimer les colonnes fusionnées
-filtered_df = filtered_df.drop(columns=columns_to_drop)
-logger.info(f"Colonnes fusionnées et supprimées : {columns_to_drop}")
-
-# Sauvegarder le résultat dans un nouveau fichier CSV dans le répertoire Grafana_Sqlite
-output_filename = os.path.basename(csv_file).replace('.csv', '_filtered.csv')
-output_path = os.path.join(DIRECTORY, output_filename)
-logger.info(f"Sauvegarde du DataFrame filtré dans le fichier : {output_path}")
-filtered_df.to_csv(output_path, index=False)
-logger.info("Script terminé avec succès.")
\ No newline at end of file
+
+def filtered_path(raw_file):
+    """
+    Chemin du fichier `_filtered.csv` produit pour un fichier brut.
+    """
+    output_filename = os.path.splitext(os.path.basename(raw_file))[0] + '_filtered.csv'
+    return os.path.join(DIRECTORY, output_filename)
+
+
+def is_already_filtered(raw_file):
+    """
+    Vrai si le fichier brut a déjà été filtré (fichier `_filtered.csv` plus récent).
+    """
+    output_path = filtered_path(raw_file)
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(raw_file)
+
+
+def filter_csv(csv_file, zone):
+    """
+    Filtre les colonnes nucléaires d'un fichier brut et sauvegarde le résultat
+    dans un fichier `_filtered.csv`. Retourne le chemin du fichier produit, ou
+    None si le fichier brut est inexploitable.
+    """
+    if raw_format(csv_file) != 'csv':
+        return filter_columnar(csv_file, zone)
+    import pandas as pd
+
+    # Charger le fichier CSV
+    logger.info(f"[{zone}] Chargement du fichier CSV {csv_file}...")
+    with metrics.timer('read_input', zone=zone):
+        df = pd.read_csv(csv_file)  # Utilisation du fichier CSV le plus récent
+    metrics.set('bytes_read', os.path.getsize(csv_file), zone=zone)
+    metrics.set('rows_read', len(df), zone=zone)
+    metrics.set('columns_read', len(df.columns), zone=zone)
+
+    # Vérifier si le DataFrame est vide
+    if df.empty:
+        logger.error(f"Le fichier CSV {csv_file} est vide ou mal formaté")
+        return None
+
+    logger.info(f"Fichier CSV chargé avec {len(df)} lignes et {len(df.columns)} colonnes.")
+
+    # Rajouter 'TIME' comme entête de la première colonne
+    logger.info("Ajout de 'TIME' comme entête de la première colonne...")
+    df.columns.values[0] = 'TIME'
+    logger.info(f"Entêtes actuelles : {df.columns.tolist()}")
+
+    # Identifier les colonnes où "nuclear" apparaît en seconde ligne
+    logger.info("Identification des colonnes contenant 'nuclear' en seconde ligne...")
+    try:
+        second_row = df.iloc[0]  # La seconde ligne (index 0 après l'entête)
+        columns_to_keep = [col for col in df.columns if 'nuclear' in str(second_row[col]).lower()]
+    except IndexError:
+        logger.error("Le fichier CSV ne contient pas suffisamment de lignes pour l'analyse")
+        return None
+
+    # Ajouter la colonne 'TIME' aux colonnes à conserver
+    if 'TIME' not in columns_to_keep:
+        columns_to_keep.insert(0, 'TIME')
+    logger.info(f"Colonnes à conserver : {columns_to_keep}")
+
+    # Filtrer le DataFrame pour ne garder que les colonnes identifiées
+    logger.info("Filtrage des colonnes...")
+    filtered_df = df[columns_to_keep]
+    logger.info(f"DataFrame filtré avec {len(filtered_df.columns)} colonnes.")
+
+    # Trier les colonnes après la première ('TIME') par ordre alphabétique
+    logger.info("Tri des colonnes après la première par ordre alphabétique...")
+    sorted_columns = ['TIME'] + sorted(filtered_df.columns[1:])
+    filtered_df = filtered_df[sorted_columns]
+    logger.info(f"Colonnes triées : {sorted_columns}")
+
+    # Vérifier si la troisième ligne contient "Actual Consumption" et ajouter '-' devant les valeurs
+    logger.info("Vérification de la présence de 'Actual Consumption' dans la troisième ligne...")
+    third_row = filtered_df.iloc[1]  # Troisième ligne (index 1)
+    # Afficher les valeurs de la troisième ligne pour déboguer
+    logger.info(f"Valeurs de la troisième ligne :\n{third_row}")
+    for col in filtered_df.columns:
+        # Ignorer la casse et les espaces
+        logger.info(f"Test sur'{str(third_row[col]).strip().lower()}' dans la colonne '{col}'")
+        if str(third_row[col]).strip().lower() == "actual consumption":
+            logger.info(f"Ajout du signe '-' devant les valeurs de la colonne '{col}' à partir de la 4ème ligne.")
+            # Ajouter '-' devant les valeurs à partir de la 4ème ligne (index 2)
+            filtered_df.loc[2:, col] = '-' + filtered_df.loc[2:, col].astype(str)
+        else:
+            logger.info(f"La colonne '{col}' ne contient pas 'Actual Consumption' dans la troisième ligne.")
+
+    # Remplacer les espaces par la lettre 'T' dans la première colonne ('TIME')
+    logger.info("Remplacement des espaces par 'T' dans la première colonne...")
+    filtered_df['TIME'] = filtered_df['TIME'].str.replace(' ', 'T')
+    logger.info("Espaces remplacés par 'T' dans la colonne 'TIME'.")
+
+    # Supprimer la seconde et la troisième ligne (index 0 et 1 après l'entête)
+    logger.info("Suppression de la seconde et troisième ligne...")
+    filtered_df = filtered_df.drop([0, 1])  # Supprimer les lignes d'index 0 et 1
+    logger.info(f"DataFrame après suppression des lignes, il reste {len(filtered_df)} lignes.")
+
+    # Remplacer '-nan' par une chaîne vide dans tout le DataFrame
+    logger.info("Remplacement des valeurs '-nan' par une chaîne vide...")
+    filtered_df = filtered_df.replace('-nan', '', regex=True)
+    logger.info("Valeurs '-nan' remplacées par une chaîne vide.")
+
+    # Fusionner les colonnes avec des en-têtes similaires
+    logger.info("Fusion des colonnes avec des en-têtes similaires...")
+    merge_start = time.perf_counter()
+    columns_to_drop = []  # Liste pour stocker les colonnes à supprimer après fusion
+    for i in range(len(filtered_df.columns) - 1):
+        current_col = filtered_df.columns[i]
+        next_col = filtered_df.columns[i + 1]
+        # Vérifier si l'en-tête de la colonne actuelle est contenu dans l'en-tête de la colonne suivante
+        if current_col in next_col:
+            logger.info(f"Fusion des colonnes '{current_col}' et '{next_col}'...")
+            # Parcourir chaque ligne de la colonne actuelle
+            for index, value in filtered_df[current_col].items():
+                # Si la valeur est vide ou NaN, remplacer par la valeur correspondante de la colonne suivante
+                if pd.isna(value) or value == '':
+                    filtered_df.at[index, current_col] = filtered_df.at[index, next_col]
+            # Ajouter la colonne suivante à la liste des colonnes à supprimer
+            columns_to_drop.append(next_col)
+
+    # Supprimer les colonnes fusionnées
+    filtered_df = filtered_df.drop(columns=columns_to_drop)
+    metrics.set('merge_seconds', time.perf_counter() - merge_start, zone=zone)
+    metrics.set('columns_merged', len(columns_to_drop), zone=zone)
+    logger.info(f"Colonnes fusionnées et supprimées : {columns_to_drop}")
+
+    return save_filtered(filtered_df, csv_file, zone)
+
+
+def filter_columnar(raw_file, zone):
+    """
+    Équivalent de `filter_csv()` pour un fichier brut Parquet ou Arrow : seules
+    les colonnes nucléaires sont lues, déjà typées et indexées par l'horodatage.
+    Le fichier `_filtered.csv` produit est identique.
+    """
+    import pandas as pd
+    logger.info(f"[{zone}] Chargement des colonnes nucléaires du fichier {raw_file}...")
+    with metrics.timer('read_input', zone=zone):
+        df = read_raw_columns(raw_file, lambda unit, production_type, metric: 'nuclear' in production_type.lower())
+    metrics.set('bytes_read', os.path.getsize(raw_file), zone=zone)
+    metrics.set('rows_read', len(df), zone=zone)
+    metrics.set('columns_read', len(df.columns), zone=zone)
+
+    if df.empty:
+        logger.error(f"Le fichier {raw_file} ne contient aucune donnée nucléaire")
+        return None
+
+    # Une colonne par unité : production, complétée par la consommation (en négatif) quand elle manque
+    merge_start = time.perf_counter()
+    units = {}
+    columns_merged = 0
+    for (unit, _, metric), values in df.items():
+        if metric.strip().lower() == "actual consumption":
+            values = -values
+        if unit in units:
+            units[unit] = units[unit].fillna(values)
+            columns_merged += 1
+        else:
+            units[unit] = values
+    filtered_df = pd.DataFrame({unit: units[unit] for unit in sorted(units)})
+    filtered_df.insert(0, 'TIME', filtered_df.index.astype(str).str.replace(' ', 'T'))
+    metrics.set('merge_seconds', time.perf_counter() - merge_start, zone=zone)
+    metrics.set('columns_merged', columns_merged, zone=zone)
+    logger.info(f"{len(units)} unités nucléaires, {columns_merged} colonnes fusionnées.")
+
+    return save_filtered(filtered_df, raw_file, zone)
+
+
+def save_filtered(filtered_df, raw_file, zone):
+    """
+    Sauvegarde le DataFrame filtré à côté du fichier brut, avec le suffixe
+    `_filtered.csv`. Retourne le chemin du fichier produit.
+    """
+    # Sauvegarder le résultat dans un nouveau fichier CSV dans le répertoire Grafana_Sqlite
+    output_path = filtered_path(raw_file)
+    logger.info(f"Sauvegarde du DataFrame filtré dans le fichier : {output_path}")
+    with metrics.timer('write_output', zone=zone):
+        filtered_df.to_csv(output_path, index=False)
+    metrics.set('rows_written', len(filtered_df), zone=zone)
+    metrics.set('columns_written', len(filtered_df.columns), zone=zone)
+    metrics.set('bytes_written', os.path.getsize(output_path), zone=zone)
+    return output_path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Filtrage des colonnes nucléaires des fichiers bruts")
+    parser.add_argument(PROFILE_OPTION, action='store_true',
+                        help="Exécute le script et affiche le coût des imports par module")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.profile_startup:
+        return run_profiled(os.path.abspath(__file__), [a for a in argv if a != PROFILE_OPTION])
+
+    # Configurer le logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s'  # Ajout du nom de fichier
+    )
+    metrics.start()
+
+    # Obtenir le fichier brut le plus récent de chaque zone
+    try:
+        raw_files = get_most_recent_raw_file_per_zone(DIRECTORY)
+        for zone, raw_file in raw_files.items():
+            logger.info(f"[{zone}] Fichier brut le plus récent sélectionné : {raw_file}")
+    except FileNotFoundError as e:
+        logger.error(e)
+        return 1
+
+    # Aucune donnée nouvelle depuis le dernier filtrage : pandas n'est pas importé
+    pending = {zone: raw_file for zone, raw_file in raw_files.items() if not is_already_filtered(raw_file)}
+    for zone in raw_files.keys() - pending.keys():
+        logger.info(f"[{zone}] Fichier brut déjà filtré, ignoré.")
+    metrics.set('files_skipped', len(raw_files) - len(pending))
+
+    failed_zones = [zone for zone, raw_file in pending.items() if filter_csv(raw_file, zone) is None]
+    if failed_zones:
+        logger.error(f"Échec du filtrage pour les zones : {', '.join(failed_zones)}")
+        return 1
+    metrics.finish()
+    logger.info("Script terminé avec succès.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,63 +2,165 @@ import sqlite3
 import csv
 from dateutil import parser  # Utilisé pour analyser les dates ISO 8601
 import os
+import sys
+import time
+import argparse
+from datetime import datetime
 import dotenv
 
+from high_water_marks import ensure_high_water_marks_table, update_high_water_mark
+from pipeline_metrics import StageMetrics
+from report_cache import bump_generation, ensure_cache_tables
+from report_queries import ensure_indexes
+from startup_profile import PROFILE_OPTION, run_profiled
+from unit_registry import UnitRegistry, ensure_metadata_columns, load_reference
+from unit_unavailability import UNAVAILABILITY_SUFFIX, ensure_unavailability_table, import_notices
+from zones import DEFAULT_ZONE, configured_zones, most_recent_file_per_zone
+
 dotenv.load_dotenv()
 
 # Configuration
 db_path = 'production.db'  # Chemin vers votre base de données SQLite
 DIRECTORY = os.getenv('DATA_DIRECTORY')  # Répertoire contenant les fichiers CSV
 
-# Fonction pour trouver le fichier CSV le plus récent avec le suffixe _filtered.csv
-def get_most_recent_filtered_csv(directory):
+# Mesures de l'étape, démarrées par main()
+metrics = StageMetrics('import', db_path=db_path, start=False)
+
+# Fonction pour trouver le fichier CSV le plus récent de chaque zone avec le suffixe _filtered.csv
+def get_most_recent_filtered_csv_per_zone(directory):
     try:
-        # Lister tous les fichiers dans le répertoire
-        all_files = os.listdir(directory)
-        # Filtrer les fichiers avec l'extension .csv et le suffixe _filtered
-        filtered_files = [f for f in all_files if f.endswith('_filtered.csv')]
+        # Fichiers filtrés les plus récents par zone, selon leur date de modification
+        filtered_files = most_recent_file_per_zone(directory, '_filtered.csv', configured_zones())
         if not filtered_files:
             raise FileNotFoundError(f"Aucun fichier CSV avec le suffixe '_filtered.csv' trouvé dans {directory}.")
-        # Trier les fichiers par date de modification (du plus récent au plus ancien)
-        filtered_files.sort(key=lambda x: os.path.getmtime(os.path.join(directory, x)), reverse=True)
-        # Retourner le chemin complet du fichier le plus récent
-        return os.path.join(directory, filtered_files[0])
+        return filtered_files
     except Exception as e:
         print(f"Erreur lors de la recherche du fichier CSV le plus récent : {e}")
         raise
 
-# Connexion à la base de données
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
+# Colonnes de la table `units` (hors colonnes de métadonnées, voir unit_registry.py)
+UNITS_COLUMNS = ['id', 'zone', 'name', 'location', 'production_type', 'installation_date', 'characteristics']
 
-# Vérifier si la table "units" a une contrainte UNIQUE sur la colonne "name"
-try:
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS units (
+# Migrer une table `units` antérieure au multi-zones (nom UNIQUE sans zone)
+def migrate_units_zone(cursor):
+    columns = cursor.execute('PRAGMA table_info(units)').fetchall()  # (cid, name, type, notnull, dflt, pk)
+    if not columns or 'zone' in [c[1] for c in columns]:
+        return
+    print(f"[{os.path.basename(__file__)}] Migration de la table units : ajout de la zone (unités existantes rattachées à {DEFAULT_ZONE})")
+    # Conserver les colonnes supplémentaires (ex. nominal) avec leur type
+    extra_columns = [c for c in columns if c[1] not in UNITS_COLUMNS]
+    extra_definitions = ''.join(f',\n        {c[1]} {c[2]}' for c in extra_columns)
+    cursor.execute(f'''
+    CREATE TABLE units_migrated (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE,  -- Ajout de la contrainte UNIQUE ici
+        zone TEXT NOT NULL DEFAULT '{DEFAULT_ZONE}',
+        name TEXT,
         location TEXT,
         production_type TEXT,
         installation_date TEXT,
-        characteristics TEXT
+        characteristics TEXT{extra_definitions},
+        UNIQUE(zone, name)
     )
     ''')
-except sqlite3.OperationalError as e:
-    print(f"Erreur lors de la création/modification de la table units : {e}")
+    copied = ', '.join(c[1] for c in columns)
+    # Les id sont conservés : les lignes de `production` restent rattachées
+    cursor.execute(f"INSERT INTO units_migrated (zone, {copied}) SELECT '{DEFAULT_ZONE}', {copied} FROM units")
+    cursor.execute('DROP TABLE units')
+    cursor.execute('ALTER TABLE units_migrated RENAME TO units')
+
+# Créer ou migrer les tables et charger le référentiel des unités
+def prepare_database(cursor):
+    # Créer la table "units" : le nom d'une unité est unique au sein de sa zone
+    try:
+        migrate_units_zone(cursor)
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS units (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            zone TEXT NOT NULL DEFAULT '{DEFAULT_ZONE}',
+            name TEXT,
+            location TEXT,
+            production_type TEXT,
+            installation_date TEXT,
+            characteristics TEXT,
+            UNIQUE(zone, name)  -- Les unités sont identifiées par (zone, nom)
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Erreur lors de la création/modification de la table units : {e}")
+
+    # Métadonnées des unités (nominal, mise en service, site, palier) depuis le fichier de référence
+    try:
+        ensure_metadata_columns(cursor)
+        with metrics.timer('reference_load'):
+            reference_version = load_reference(cursor)
+        print(f"[{os.path.basename(__file__)}] Référentiel des unités chargé (version {reference_version}).")
+    except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+        print(f"[{os.path.basename(__file__)}] Erreur lors du chargement du référentiel des unités : {e}")
+
+    # Créer la table `production` si elle n'existe pas
+    try:
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS production (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unit_id INTEGER,
+            timestamp TEXT,
+            value REAL,
+            UNIQUE(unit_id, timestamp)  -- Contrainte pour éviter les doublons
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Erreur lors de la création/modification de la table production : {e}")
 
-# Créer la table `production` si elle n'existe pas
-try:
+    # Journal des valeurs révisées par ENTSO-E après leur première publication
+    ensure_revisions_table(cursor)
+
+    # Table de travail : lot de valeurs d'un fichier, comparé en une passe à la table `production`
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS production (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+    CREATE TEMP TABLE staging_production (
         unit_id INTEGER,
         timestamp TEXT,
         value REAL,
-        UNIQUE(unit_id, timestamp)  -- Contrainte pour éviter les doublons
+        PRIMARY KEY (unit_id, timestamp)
+    ) WITHOUT ROWID
+    ''')
+
+    # Index des requêtes du rapport (recherches par unité et par date)
+    with metrics.timer('ensure_indexes'):
+        ensure_indexes(cursor)
+
+    # Marques de haute eau lues par le mode normal de _1_getTransparencyAPI.py
+    ensure_high_water_marks_table(cursor)
+
+    # Avis d'indisponibilité des unités (type d'arrêt et retour prévu cités par le rapport)
+    ensure_unavailability_table(cursor)
+
+# Créer le journal des révisions ; son id croissant permet à _3b_detect_unit_events.py
+# de repérer les révisions pas encore analysées
+def ensure_revisions_table(cursor):
+    columns = [c[1] for c in cursor.execute('PRAGMA table_info(production_revisions)').fetchall()]
+    migrate = bool(columns) and 'id' not in columns
+    if migrate:
+        print(f"[{os.path.basename(__file__)}] Migration de la table production_revisions : ajout de l'id des révisions")
+        cursor.execute('ALTER TABLE production_revisions RENAME TO production_revisions_old')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS production_revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unit_id INTEGER,
+        timestamp TEXT,
+        revised_at TEXT,
+        old_value REAL,
+        new_value REAL,
+        UNIQUE(unit_id, timestamp, revised_at)
     )
     ''')
-except sqlite3.OperationalError as e:
-    print(f"Erreur lors de la création/modification de la table production : {e}")
+    if migrate:
+        cursor.execute('''
+        INSERT INTO production_revisions (unit_id, timestamp, revised_at, old_value, new_value)
+        SELECT unit_id, timestamp, revised_at, old_value, new_value
+        FROM production_revisions_old
+        ORDER BY revised_at, unit_id, timestamp
+        ''')
+        cursor.execute('DROP TABLE production_revisions_old')
 
 # Fonction pour formater les dates au format ISO 8601 (remplacer espace par 'T')
 def format_date(date_str):
@@ -70,75 +172,205 @@ def format_date(date_str):
     except ValueError:
         raise ValueError(f"Format de date invalide : {date_str}")
 
-# Obtenir le fichier CSV le plus récent avec le suffixe _filtered.csv
-try:
-    csv_file = get_most_recent_filtered_csv(DIRECTORY)
-    print(f"[{os.path.basename(__file__)}] Fichier CSV sélectionné : {csv_file}")
-except FileNotFoundError as e:
-    print(e)
-    exit(1)
-
-# Étape 1 : Lire le fichier CSV
-with open(csv_file, 'r', encoding='utf-8') as file:
-    reader = csv.DictReader(file)  # Lit le fichier CSV avec les en-têtes comme clés
-    headers = reader.fieldnames  # Récupère les en-têtes (première ligne)
-    # Les en-têtes contiennent "TIME" et les noms des unités
-    if 'TIME' not in headers:
-        raise ValueError("Le fichier CSV doit contenir une colonne 'TIME'.")
+# Fusionner le lot de `staging_production` dans `production`
+def merge_staging(cursor, revised_at):
+    """
+    Insère les valeurs nouvelles et met à jour les seules valeurs révisées,
+    dont l'ancienne et la nouvelle valeur sont enregistrées dans
+    `production_revisions`. Trois requêtes ensemblistes sur la clé
+    (unit_id, timestamp) : sans révision, le coût est celui d'une insertion en masse.
+
+    Returns:
+        tuple: (valeurs insérées, valeurs révisées).
+    """
+    cursor.execute('''
+    INSERT INTO production_revisions (unit_id, timestamp, revised_at, old_value, new_value)
+    SELECT s.unit_id, s.timestamp, ?, p.value, s.value
+    FROM staging_production s
+    JOIN production p ON p.unit_id = s.unit_id AND p.timestamp = s.timestamp
+    WHERE p.value IS NOT s.value
+    ''', (revised_at,))
+    revised = cursor.rowcount
+    if revised:
+        cursor.execute('''
+        UPDATE production SET value = s.value
+        FROM staging_production s
+        WHERE production.unit_id = s.unit_id AND production.timestamp = s.timestamp
+          AND production.value IS NOT s.value
+        ''')
+    # Pas d'UPSERT : un conflit consommerait un id AUTOINCREMENT par valeur déjà présente
+    cursor.execute('''
+    INSERT INTO production (unit_id, timestamp, value)
+    SELECT s.unit_id, s.timestamp, s.value
+    FROM staging_production s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM production p WHERE p.unit_id = s.unit_id AND p.timestamp = s.timestamp
+    )
+    ''')
+    return cursor.rowcount, revised
+
+# Importer un fichier filtré dans la base pour une zone donnée
+def import_csv(cursor, csv_file, zone):
+    # Étape 1 : Lire le fichier CSV
+    metrics.set('bytes_read', os.path.getsize(csv_file), zone=zone)
+    rows_read = 0
+    rows_invalid = 0
+    values = []  # (unit_id, timestamp, valeur)
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file)  # Lit le fichier CSV avec les en-têtes comme clés
+        headers = reader.fieldnames  # Récupère les en-têtes (première ligne)
+        # Les en-têtes contiennent "TIME" et les noms des unités
+        if 'TIME' not in headers:
+            raise ValueError("Le fichier CSV doit contenir une colonne 'TIME'.")
     
-    unit_names = headers[1:]  # Les noms des unités sont les autres colonnes
-    # Dictionnaire pour stocker les IDs des unités
-    units = {}
-    # Étape 2 : Insérer ou récupérer les unités dans la table `units`
-    for unit_name in unit_names:
-        cursor.execute('SELECT id FROM units WHERE name = ?', (unit_name,))
-        unit = cursor.fetchone()
-        if unit is None:
-            # L'unité n'existe pas, on l'insère
-            cursor.execute('''
-            INSERT INTO units (name, location, production_type, installation_date, characteristics)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (unit_name, 'Unknown', 'Unknown', '2023-01-01', '{}'))
-            unit_id = cursor.lastrowid  # Récupérer l'id de l'unité insérée
-            print(f"[{os.path.basename(__file__)}] [DEBUG] Unité '{unit_name}' insérée avec succès. Nouvel ID : {unit_id}")
-        else:
-            # L'unité existe déjà, on récupère son id
-            unit_id = unit[0]
-            print(f"[{os.path.basename(__file__)}] [DEBUG] Unité '{unit_name}' déjà existante. ID récupéré : {unit_id}")
-        
-        # Stocker l'id de l'unité pour utilisation ultérieure
-        units[unit_name] = unit_id
-
-    # Étape 3 : Insérer les données de production dans la table `production`
-    for row in reader:
-        timestamp = format_date(row['TIME'])  # Formatter la date
-        for unit_name in unit_names:
-            value = row[unit_name]
-            if value:  # Ignorer les valeurs vides
-                try:
-                    value = float(value)  # Convertir la valeur en nombre
-                except ValueError:
-                    print(f"[{os.path.basename(__file__)}] Valeur invalide ignorée : {value} pour {unit_name} à {timestamp}")
-                    continue
-                # Vérifier si le timestamp existe déjà pour cette unité
-                cursor.execute('''
-                SELECT id FROM production WHERE unit_id = ? AND timestamp = ?
-                ''', (units[unit_name], timestamp))
-                existing_record = cursor.fetchone()
-                if existing_record:
-                    print(f"[{os.path.basename(__file__)}] [DEBUG] Données déjà existantes pour {unit_name} à {timestamp}, ignorées.")
-                else:
-                    # Insérer la donnée de production
+        unit_names = headers[1:]  # Les noms des unités sont les autres colonnes
+        # Étape 2 : Résoudre les noms des unités en IDs (référentiel chargé en une requête)
+        unit_lookup_start = time.perf_counter()
+        registry = UnitRegistry(cursor, zone)
+        units = registry.resolve(unit_names)
+        metrics.set('unit_lookup_seconds', time.perf_counter() - unit_lookup_start, zone=zone)
+        metrics.set('units_created', len(registry.created), zone=zone)
+        metrics.set('units_renamed', len(registry.renamed), zone=zone)
+        metrics.set('units_without_nominal', len(set(units.values()) - set(registry.low_thresholds)), zone=zone)
+
+        # Étape 3 : Lire les valeurs du fichier
+        for row in reader:
+            rows_read += 1
+            timestamp = format_date(row['TIME'])  # Formatter la date
+            for unit_name in unit_names:
+                value = row[unit_name]
+                if value:  # Ignorer les valeurs vides
                     try:
-                        cursor.execute('''
-                        INSERT INTO production (unit_id, timestamp, value)
-                        VALUES (?, ?, ?)
-                        ''', (units[unit_name], timestamp, value))
-                        #print(f"[DEBUG] Données insérées pour {unit_name} à {timestamp} avec la valeur {value}.")
-                    except sqlite3.IntegrityError as e:
-                        print(f"[{os.path.basename(__file__)}] [DEBUG] Erreur lors de l'insertion des données pour {unit_name} à {timestamp}: {e}")
-
-# Validation et fermeture
-conn.commit()
-conn.close()
-print(f"[{os.path.basename(__file__)}] Importation terminée avec succès.")
\ No newline at end of file
+                        value = float(value)  # Convertir la valeur en nombre
+                    except ValueError:
+                        print(f"[{os.path.basename(__file__)}] Valeur invalide ignorée : {value} pour {unit_name} à {timestamp}")
+                        rows_invalid += 1
+                        continue
+                    values.append((units[unit_name], timestamp, value))
+
+    # Étape 4 : Charger le lot dans la table de travail puis le fusionner dans `production`
+    insert_start = time.perf_counter()
+    changes_before_staging = cursor.connection.total_changes
+    cursor.execute('DELETE FROM staging_production')
+    # Heure ambiguë du passage à l'heure d'hiver : la première valeur est conservée
+    cursor.executemany('INSERT OR IGNORE INTO staging_production (unit_id, timestamp, value) VALUES (?, ?, ?)', values)
+    staging_changes = cursor.connection.total_changes - changes_before_staging
+    staged = cursor.execute('SELECT COUNT(*) FROM staging_production').fetchone()[0]
+    rows_inserted, rows_revised = merge_staging(cursor, datetime.now().strftime('%Y-%m-%dT%H:%M:%S'))
+    rows_existing = staged - rows_inserted - rows_revised
+    metrics.set('insert_seconds', time.perf_counter() - insert_start, zone=zone)
+
+    # Dernier timestamp importé du parc (reprise du mode normal)
+    cursor.execute('SELECT MAX(timestamp) FROM staging_production')
+    update_high_water_mark(cursor, zone, cursor.fetchone()[0])
+
+    metrics.set('rows_read', rows_read, zone=zone)
+    metrics.set('values_inserted', rows_inserted, zone=zone)
+    metrics.set('values_revised', rows_revised, zone=zone)
+    metrics.set('values_existing', rows_existing, zone=zone)
+    metrics.set('values_invalid', rows_invalid, zone=zone)
+    print(f"[{os.path.basename(__file__)}] [{zone}] {rows_inserted} valeurs insérées, {rows_revised} révisées, "
+          f"{rows_existing} inchangées.")
+    return staging_changes
+
+# Importer les avis d'indisponibilité d'une zone (unités connues seulement)
+def import_unavailability(cursor, notices_file, zone):
+    registry = UnitRegistry(cursor, zone)
+    notices_read, notices_inserted, notices_unmatched = import_notices(cursor, notices_file, registry)
+    metrics.set('notices_read', notices_read, zone=zone)
+    metrics.set('notices_inserted', notices_inserted, zone=zone)
+    metrics.set('notices_unmatched', notices_unmatched, zone=zone)
+    print(f"[{os.path.basename(__file__)}] [{zone}] {notices_inserted} avis d'indisponibilité nouveaux sur {notices_read}, "
+          f"{notices_unmatched} hors référentiel ignorés.")
+
+# Fichier déjà importé : même date de modification que lors du dernier import de la zone (table `meta`)
+def imported_file_key(zone, kind='imported_file'):
+    return f'{kind}_mtime_ns:{zone}'
+
+def is_already_imported(cursor, zone, csv_file, kind='imported_file'):
+    cursor.execute('SELECT value FROM meta WHERE key = ?', (imported_file_key(zone, kind),))
+    row = cursor.fetchone()
+    return row is not None and row[0] == os.stat(csv_file).st_mtime_ns
+
+def mark_imported(cursor, zone, csv_file, kind='imported_file'):
+    cursor.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                   (imported_file_key(zone, kind), os.stat(csv_file).st_mtime_ns))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import des fichiers filtrés dans la base de production")
+    parser.add_argument(PROFILE_OPTION, action='store_true',
+                        help="Exécute le script et affiche le coût des imports par module")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.profile_startup:
+        return run_profiled(os.path.abspath(__file__), [a for a in argv if a != PROFILE_OPTION])
+    metrics.start()
+    if not DIRECTORY:
+        print(f"[{os.path.basename(__file__)}] Erreur : la variable d'environnement DATA_DIRECTORY n'est pas définie.")
+        return 1
+
+    # Connexion à la base de données
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        changes_at_start = conn.total_changes  # Pour détecter une modification des données
+        prepare_database(cursor)
+        ensure_cache_tables(cursor)
+
+        # Obtenir le fichier CSV le plus récent de chaque zone avec le suffixe _filtered.csv
+        try:
+            csv_files = get_most_recent_filtered_csv_per_zone(DIRECTORY)
+            for zone, csv_file in csv_files.items():
+                print(f"[{os.path.basename(__file__)}] [{zone}] Fichier CSV sélectionné : {csv_file}")
+        except FileNotFoundError as e:
+            print(e)
+            return 1
+
+        # Les écritures dans la table de travail ne modifient pas les données
+        staging_changes = 0
+        imported = []
+        for zone, csv_file in csv_files.items():
+            if is_already_imported(cursor, zone, csv_file):
+                print(f"[{os.path.basename(__file__)}] [{zone}] Fichier déjà importé, ignoré.")
+                continue
+            staging_changes += import_csv(cursor, csv_file, zone)
+            imported.append((zone, csv_file, 'imported_file'))
+        metrics.set('files_skipped', len(csv_files) - len(imported))
+
+        # Avis d'indisponibilité récupérés avec les données de production, importés après
+        # celles-ci pour être rattachés aux unités de la zone
+        notices_files = most_recent_file_per_zone(DIRECTORY, UNAVAILABILITY_SUFFIX, configured_zones())
+        for zone, notices_file in notices_files.items():
+            if is_already_imported(cursor, zone, notices_file, kind='imported_unavailability'):
+                continue
+            import_unavailability(cursor, notices_file, zone)
+            imported.append((zone, notices_file, 'imported_unavailability'))
+
+        # Nouvelle génération des données si l'import a modifié la base (invalide le cache du rapport)
+        if conn.total_changes - staging_changes > changes_at_start:
+            generation = bump_generation(cursor)
+            metrics.set('data_generation', generation)
+            print(f"[{os.path.basename(__file__)}] Données modifiées, génération {generation}.")
+        else:
+            print(f"[{os.path.basename(__file__)}] Aucune donnée nouvelle, génération inchangée.")
+        for zone, imported_file, kind in imported:
+            mark_imported(cursor, zone, imported_file, kind)
+
+        # Validation et fermeture
+        with metrics.timer('commit'):
+            conn.commit()
+    finally:
+        # Sortie anticipée : la transaction est annulée pour ne pas laisser la base
+        # verrouillée (les métriques sont enregistrées à la sortie du processus)
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+    metrics.finish()
+    print(f"[{os.path.basename(__file__)}] Importation terminée avec succès.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import sqlite3
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+import dotenv
+
+from pipeline_metrics import StageMetrics
+from report_cache import bump_generation
+from startup_profile import PROFILE_OPTION, run_profiled
+from unit_events import ensure_events_tables, latest_marks, process_unit
+from unit_registry import UnitRegistry
+from zones import configured_zones
+
+dotenv.load_dotenv()
+
+# Configuration
+db_path = 'production.db'  # Chemin vers votre base de données SQLite
+
+# Mesures de l'étape, démarrées par main()
+metrics = StageMetrics('events', db_path=db_path, start=False)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Détection des événements de production par unité")
+    parser.add_argument(PROFILE_OPTION, action='store_true',
+                        help="Exécute le script et affiche le coût des imports par module")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.profile_startup:
+        return run_profiled(os.path.abspath(__file__), [a for a in argv if a != PROFILE_OPTION])
+    metrics.start()
+
+    # Connexion à la base de données
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    ensure_events_tables(cursor)
+
+    detected_at = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+    # Lignes insérées et révisées jusqu'ici : celles d'id supérieur seront analysées à l'exécution suivante
+    production_id, revision_id = latest_marks(cursor)
+    total_events = 0
+    total_reanalyzed = 0
+    for zone in configured_zones():
+        # Seuils de production faible calculés une fois par zone (voir unit_registry.py)
+        registry = UnitRegistry(cursor, zone)
+        nominals = registry.nominals
+        start = time.perf_counter()
+        points = 0
+        events = 0
+        reanalyzed = 0
+        for unit_id, low_threshold in registry.low_thresholds.items():
+            unit_points, unit_events, restarted = process_unit(cursor, unit_id, nominals[unit_id], low_threshold,
+                                                               detected_at, production_id, revision_id)
+            points += unit_points
+            events += unit_events
+            reanalyzed += restarted
+        metrics.set('analysis_seconds', time.perf_counter() - start, zone=zone)
+        metrics.set('points_analyzed', points, zone=zone)
+        metrics.set('events_detected', events, zone=zone)
+        metrics.set('units_reanalyzed', reanalyzed, zone=zone)
+        metrics.set('units_skipped', len(nominals) - len(registry.low_thresholds), zone=zone)
+        total_events += events
+        total_reanalyzed += reanalyzed
+        print(f"[{os.path.basename(__file__)}] [{zone}] {points} points analysés, {events} événements détectés"
+              f" ({reanalyzed} unités réanalysées après un import de lignes antérieures).")
+
+    # Les événements sont cités par le rapport : invalider son cache s'ils ont changé
+    # (une réanalyse peut supprimer des événements sans en enregistrer de nouveaux)
+    if total_events or total_reanalyzed:
+        bump_generation(cursor)
+
+    # Validation et fermeture
+    with metrics.timer('commit'):
+        conn.commit()
+    conn.close()
+    metrics.finish()
+    print(f"[{os.path.basename(__file__)}] Détection des événements terminée avec succès.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,25 @@
 import os
+import sys
 import sqlite3
 import asyncio
-from telegram import Bot
+import argparse
 from dotenv import load_dotenv  
 import json
 import logging
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from pipeline_metrics import StageMetrics
+from report_cache import cached_report_data
+from startup_profile import PROFILE_OPTION, run_profiled
+from report_queries import (
+    LOW_PRODUCTION_UNITS_QUERY,
+    LOW_PRODUCTION_AGE_QUERY,
+    ensure_indexes,
+    fetch_report_data,
+    resolve_as_of,
+)
+from zones import DEFAULT_ZONE, configured_zones
 
 load_dotenv()
 
@@ -14,19 +27,52 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')  # Token du bot Telegram
 CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')               # ID du chat (utilisateur ou groupe)
 DB_PATH = 'production.db'                             # Chemin vers la base de données
+TELEGRAM_DRY_RUN = os.getenv('TELEGRAM_DRY_RUN', '').lower() in ('1', 'true', 'yes')  # Journalise le message au lieu de l'envoyer
+MAX_REPORTED_EVENTS = 10                              # Nombre maximal d'événements cités dans le rapport
+
+# Libellés des événements détectés par _3b_detect_unit_events.py
+EVENT_LABELS = {
+    'trip': 'déclenchement',
+    'ramp_down': 'baisse rapide',
+    'ramp_up': 'hausse rapide',
+    'flatline': 'données figées',
+}
+# Libellés des types d'indisponibilité publiés sur ENTSO-E (voir unit_unavailability.py)
+OUTAGE_LABELS = {
+    'Planned maintenance': 'arrêt programmé',
+    'Unplanned outage': 'arrêt fortuit',
+}
+REPORT_CACHE = os.getenv('REPORT_CACHE', 'true').lower() in ('1', 'true', 'yes')         # Sert le rapport depuis le cache si les données n'ont pas changé
 
 
-# Configuration du logger
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter(
-    f'%(asctime)s - {Path(__file__).name} - %(levelname)s - %(message)s'
-))
-logger.addHandler(handler)
 
-# Initialisation du bot Telegram
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
+# Mesures de l'étape, démarrées par main()
+metrics = StageMetrics('report', db_path=DB_PATH, start=False)
+
+# Bot Telegram, créé au premier envoi (python-telegram-bot n'est importé que pour envoyer)
+_bot = None
+
+def configure_logging():
+    """
+    Configuration du logger
+    """
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        f'%(asctime)s - {Path(__file__).name} - %(levelname)s - %(message)s'
+    ))
+    logger.addHandler(handler)
+
+def get_bot():
+    """
+    Retourne le bot Telegram, initialisé au premier appel.
+    """
+    global _bot
+    if _bot is None:
+        from telegram import Bot
+        _bot = Bot(token=TELEGRAM_BOT_TOKEN)
+    return _bot
 
 async def send_telegram_message(message):
     """
@@ -35,54 +81,30 @@ async def send_telegram_message(message):
     Args:
         message (str): Le message à envoyer.
     """
+    if TELEGRAM_DRY_RUN:
+        logger.info(f"TELEGRAM_DRY_RUN actif, message non envoyé :\n{message}")
+        return
     try:
-        await bot.send_message(chat_id=CHAT_ID, text=message)
+        with metrics.timer('telegram_send'):
+            await get_bot().send_message(chat_id=CHAT_ID, text=message)
         logger.info("Message envoyé avec succès")
     except Exception as e:
+        metrics.inc('telegram_errors')
         logger.error(f"Erreur lors de l'envoi du message : {e}")
 
-def query_low_production_units():
+def query_low_production_units(zone=DEFAULT_ZONE, as_of=None):
     """
-    Exécute la requête SQL optimisée pour les performances
+    Exécute la requête SQL optimisée pour les performances (dernières données,
+    ou données à la date `as_of`)
     """
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
         # Création d'index recommandés (à exécuter une seule fois)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_production_unit_time 
-            ON production(unit_id, timestamp DESC)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_units_nominal 
-            ON units(id, nominal)
-        """)
-        
-        query = """
-        WITH latest_prod AS (
-            SELECT 
-                unit_id, 
-                MAX(timestamp) as last_timestamp
-            FROM production
-            GROUP BY unit_id
-        )
-        SELECT
-            u.name,
-            p.value,
-            u.nominal
-        FROM units u
-        INNER JOIN latest_prod lp 
-            ON u.id = lp.unit_id
-        INNER JOIN production p 
-            ON p.unit_id = lp.unit_id 
-            AND p.timestamp = lp.last_timestamp
-        WHERE 
-            u.nominal > 0 
-            AND p.value < 0.2 * u.nominal
-        """
-        
-        cursor.execute(query)
+        ensure_indexes(cursor)
+
+        cursor.execute(LOW_PRODUCTION_UNITS_QUERY, {'zone': zone, 'as_of': resolve_as_of(cursor, zone, as_of)})
         results = cursor.fetchall()
         conn.close()
         return results
@@ -90,9 +112,16 @@ def query_low_production_units():
         logger.error(f"Erreur SQL : {e}")
         return []
 
-async def generate_production_report():
+async def generate_production_report(zone=DEFAULT_ZONE, show_zone=False, as_of=None, use_cache=True):
     """
-    Génère un rapport complet de production et retourne le message formaté
+    Génère un rapport complet de production d'une zone et retourne le message formaté
+
+    Args:
+        zone (str): Code de la zone (ex. 'FR').
+        show_zone (bool): Indiquer la zone dans le titre (plusieurs zones suivies).
+        as_of (datetime|str): Date du rapport (heure locale de Paris) ; None pour
+            les dernières données.
+        use_cache (bool): Lire et enregistrer le rapport dans le cache (si REPORT_CACHE).
     """
     try:
         # Chargement de l'état précédent
@@ -103,136 +132,19 @@ async def generate_production_report():
             previous_low_units = set()
 
         conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
 
-        # Requête pour obtenir la dernière valeur de production de FLAMANVILLE 3
-        flamanville_query = """
-        SELECT p.value
-        FROM production p
-        JOIN units u ON p.unit_id = u.id
-        WHERE u.name = 'FLAMANVILLE 3'
-        ORDER BY p.timestamp DESC
-        LIMIT 1;
-        """
-        cursor.execute(flamanville_query)
-        flamanville_result = cursor.fetchone()
-        flamanville_value = flamanville_result[0] if flamanville_result else 'N/A'
-
-        # Requête pour calculer l'âge moyen des unités < 20% de leur nominal
-        age_query = """
-        WITH latest_prod AS (
-            SELECT 
-                unit_id, 
-                MAX(timestamp) AS last_timestamp
-            FROM production
-            GROUP BY unit_id
-        ),
-        low_production_units AS (
-            SELECT 
-                u.id,
-                u.installation_date,
-                p.value,
-                u.nominal
-            FROM units u
-            INNER JOIN latest_prod lp 
-                ON u.id = lp.unit_id
-            INNER JOIN production p 
-                ON p.unit_id = lp.unit_id 
-                AND p.timestamp = lp.last_timestamp
-            WHERE 
-                u.nominal > 0 
-                AND p.value < 0.2 * u.nominal
-                AND u.installation_date IS NOT NULL
-        )
-        SELECT 
-            AVG((JULIANDAY('now') - JULIANDAY(u.installation_date)) / 365.25) AS avg_age_low,
-            COUNT(*) AS low_count,
-            (SELECT AVG((JULIANDAY('now') - JULIANDAY(u2.installation_date)) / 365.25)
-             FROM units u2
-             WHERE u2.installation_date IS NOT NULL
-               AND u2.id NOT IN (SELECT id FROM low_production_units)) AS avg_age_other,
-            (SELECT COUNT(*) 
-             FROM units u2
-             WHERE u2.installation_date IS NOT NULL
-               AND u2.id NOT IN (SELECT id FROM low_production_units)) AS other_count
-        FROM low_production_units u;
-        """
-        cursor.execute(age_query)
-        age_result = cursor.fetchone()
-        avg_age_low, low_count, avg_age_other, other_count = age_result
-
-        # Exécution de la requête complète
-        query = """
-        WITH 
-            latest_date AS (
-                SELECT MAX(timestamp) AS max_date FROM production
-            ),
-            total_production AS (
-                SELECT SUM(p.value) as total_prod
-                FROM production p
-                WHERE p.timestamp = (SELECT max_date FROM latest_date)
-            ),
-            total_nominal AS (
-                SELECT SUM(u.nominal) as total_nom
-                FROM units u
-            ),
-            low_production_units AS (
-                SELECT 
-                    u.id, 
-                    u.name, 
-                    p.value,
-                    u.nominal,
-                    CAST(JULIANDAY((SELECT max_date FROM latest_date)) - 
-                    JULIANDAY(COALESCE(
-                        (SELECT MAX(timestamp) 
-                         FROM production p3 
-                         WHERE p3.unit_id = u.id 
-                           AND p3.value >= 0.2 * u.nominal),
-                        (SELECT MIN(timestamp) 
-                         FROM production p4 
-                         WHERE p4.unit_id = u.id)
-                    )) AS REAL) AS days_since_above_20
-                FROM production p
-                JOIN units u ON p.unit_id = u.id
-                WHERE p.timestamp = (SELECT max_date FROM latest_date)
-                  AND p.value < 0.2 * u.nominal
-            ),
-            missing_units AS (
-                SELECT 
-                    u.id,
-                    u.name,
-                    (SELECT MAX(timestamp) 
-                     FROM production p2 
-                     WHERE p2.unit_id = u.id) AS last_record_date
-                FROM units u
-                WHERE NOT EXISTS (
-                    SELECT 1 
-                    FROM production p 
-                    WHERE p.unit_id = u.id
-                      AND p.timestamp >= datetime((SELECT max_date FROM latest_date), '-2 minute')
-                )
-            )
-        SELECT 
-            (SELECT max_date FROM latest_date) AS latest_date,
-            (SELECT total_prod FROM total_production) AS total_production,
-            (SELECT total_nom FROM total_nominal) AS total_nominal,
-            (SELECT COUNT(*) FROM low_production_units) AS low_production_count,
-            (SELECT json_group_array(json_object(
-                'id', id, 
-                'name', name, 
-                'value', value,
-                'nominal', nominal,
-                'days_since_above_20', days_since_above_20
-            )) FROM low_production_units) AS low_production_list,
-            (SELECT COUNT(*) FROM missing_units) AS missing_units_count,
-            (SELECT json_group_array(json_object('id', id, 'name', name, 'last_record_date', last_record_date))
-             FROM missing_units) AS missing_units_list;
-        """
-        
-        cursor.execute(query)
-        result = cursor.fetchone()
+        # Exécution des requêtes du rapport (voir report_queries.py), ou lecture
+        # du cache si aucun import n'a modifié les données depuis (voir report_cache.py)
+        if REPORT_CACHE and use_cache:
+            flamanville_value, age_result, result, events_result, unavailability_result = cached_report_data(
+                conn, zone=zone, as_of=as_of, timer=metrics.timer)
+        else:
+            flamanville_value, age_result, result, events_result, unavailability_result = fetch_report_data(
+                conn.cursor(), zone=zone, as_of=as_of, timer=metrics.timer)
         conn.close()
 
+        avg_age_low, low_count, avg_age_other, other_count = age_result
+
         # Extraction des résultats
         (latest_date, total_prod, total_nominal, 
          low_count, low_list, missing_count, missing_list) = result
@@ -243,14 +155,27 @@ async def generate_production_report():
             load_factor = (total_prod / total_nominal) * 100 if total_prod else 0
 
         # Formatage du message
-        message = f"📊 Rapport de production - {latest_date}\n\n"
-        message += f"🏭 Facteur de charge du parc : {load_factor:.1f}%\n\n"
-        message += f"🏭 FLAMANVILLE 3 : {flamanville_value} MW\n\n"
-        message += f"⚠️ Âge moyen des {low_count} unités < 20% de leur nominal : {avg_age_low:.2f} ans\n"
-        message += f"⚠️ Âge moyen des {other_count} autres unités : {avg_age_other:.2f} ans\n\n"
+        title = f"📊 Rapport de production {zone}" if show_zone else "📊 Rapport de production"
+        message = f"{title} - {latest_date}\n\n"
+        if total_nominal:
+            message += f"🏭 Facteur de charge du parc : {load_factor:.1f}%\n\n"
+        else:
+            # Zone absente de units_reference.json : pas de facteur de charge ni de seuil de 20%
+            message += ("ℹ️ Puissances nominales inconnues pour cette zone (absentes du référentiel "
+                        "des unités) : facteur de charge et unités < 20% non calculés\n\n")
+        if flamanville_value is not None:
+            message += f"🏭 FLAMANVILLE 3 : {flamanville_value} MW\n\n"
+        # Moyenne absente (None) quand le groupe d'unités est vide
+        if avg_age_low is not None:
+            message += f"⚠️ Âge moyen des {low_count} unités < 20% de leur nominal : {avg_age_low:.2f} ans\n"
+        if avg_age_other is not None:
+            message += f"⚠️ Âge moyen des {other_count} autres unités : {avg_age_other:.2f} ans\n"
+        if avg_age_low is not None or avg_age_other is not None:
+            message += "\n"
 
-        # Section unités sorties
+        # Section unités sorties, avec l'avis d'indisponibilité ENTSO-E en cours
         if low_count > 0:
+            unavailable = {a['id']: a for a in json.loads(unavailability_result[1])}
             low_units = []
             for u in json.loads(low_list):  # Utiliser les données de la requête principale
                 unit_name = u['name']
@@ -258,9 +183,29 @@ async def generate_production_report():
                 nominal = u['nominal']
                 percentage = (value / nominal) * 100
                 days = int(u['days_since_above_20'])
-                low_units.append(f"🔸 {unit_name} ({value} MW, {days} j)")
+                line = f"🔸 {unit_name} ({value} MW, {days} j)"
+                notice = unavailable.get(u['id'])
+                if notice is not None:
+                    label = OUTAGE_LABELS.get(notice['business_type'], notice['business_type'])
+                    expected_return = notice['expected_return'][:16].replace('T', ' ')
+                    line += f" – {label}, retour prévu le {expected_return}"
+                low_units.append(line)
             message += "\n".join(low_units) + "\n\n"
 
+        # Section événements détectés (déclenchements, variations rapides, données figées)
+        events_count, events_list = events_result
+        if events_count > 0:
+            message += f"⚡ Événements des dernières 24 h : {events_count}\n"
+            event_lines = []
+            for e in json.loads(events_list)[:MAX_REPORTED_EVENTS]:
+                label = EVENT_LABELS.get(e['event_type'], e['event_type'])
+                if e['event_type'] == 'flatline':
+                    detail = f"{e['value_before']:.0f} MW depuis {e['start']}"
+                else:
+                    detail = f"{e['start']}, {e['value_before']:.0f} → {e['value_after']:.0f} MW"
+                event_lines.append(f"🔹 {e['name']} : {label} ({detail})")
+            message += "\n".join(event_lines) + "\n\n"
+
         # Section unités manquantes
         message += f"🚨 Unités sans données : {missing_count}\n"
         if missing_count > 0:
@@ -274,47 +219,26 @@ async def generate_production_report():
         logger.error(f"Erreur génération rapport : {e}")
         return "❌ Erreur critique"
 
-def calculate_average_age_low_production_units():
+def calculate_average_age_low_production_units(zone=DEFAULT_ZONE, as_of=None):
     """
-    Calcule l'âge moyen des unités dont la production est < 20% de leur nominal.
+    Calcule l'âge moyen des unités d'une zone dont la production est < 20% de leur nominal
+    (dernières données, ou données et âge à la date `as_of`).
     """
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
 
         # Requête pour sélectionner les unités < 20% de leur nominal avec leur date d'installation
-        query = """
-        WITH latest_prod AS (
-            SELECT 
-                unit_id, 
-                MAX(timestamp) AS last_timestamp
-            FROM production
-            GROUP BY unit_id
-        )
-        SELECT 
-            u.name,
-            u.installation_date,
-            p.value,
-            u.nominal
-        FROM units u
-        INNER JOIN latest_prod lp 
-            ON u.id = lp.unit_id
-        INNER JOIN production p 
-            ON p.unit_id = lp.unit_id 
-            AND p.timestamp = lp.last_timestamp
-        WHERE 
-            u.nominal > 0 
-            AND p.value < 0.2 * u.nominal
-            AND u.installation_date IS NOT NULL
-        """
-        
-        cursor.execute(query)
+        latest_date = resolve_as_of(cursor, zone, as_of)
+        cursor.execute(LOW_PRODUCTION_AGE_QUERY, {'zone': zone, 'as_of': latest_date})
         results = cursor.fetchall()
+        cursor.execute('SELECT COUNT(nominal) FROM units WHERE zone = ?', (zone,))
+        has_nominals = cursor.fetchone()[0] > 0
 
         # Calcul de l'âge moyen
         total_age = 0
         count = 0
-        current_date = datetime.now()
+        current_date = datetime.fromisoformat(latest_date) if as_of is not None and latest_date else datetime.now()
 
         for row in results:
             name, installation_date, value, nominal = row
@@ -326,29 +250,94 @@ def calculate_average_age_low_production_units():
         conn.close()
 
         if count == 0:
-            print("Aucune unité avec une production < 20% de leur nominal.")
+            if not has_nominals:
+                print(f"[{zone}] Puissances nominales inconnues (absentes du référentiel des unités) : âge moyen non calculé.")
+                return
+            print(f"[{zone}] Aucune unité avec une production < 20% de leur nominal.")
             return
 
         average_age = total_age / count
-        print(f"L'âge moyen des unités < 20% de leur nominal est de {average_age:.2f} ans.")
+        print(f"[{zone}] L'âge moyen des unités < 20% de leur nominal est de {average_age:.2f} ans.")
 
     except Exception as e:
         print(f"Erreur : {e}")
 
-async def main():
+async def replay_reports(start, end, step_minutes=60):
     """
-    Fonction principale : génère et envoie le rapport
+    Génère les rapports « à date » de chaque zone suivie entre `start` et `end`
+    (inclus), toutes les `step_minutes` minutes, et les affiche sans les envoyer.
+    Les rapports rejoués ne seront pas relus : ils ne sont pas enregistrés dans le cache.
     """
-    try:
-        # Génération du rapport
-        report = await generate_production_report()
-        
-        # Envoi du rapport via Telegram
-        await send_telegram_message(report)
-        
-    except Exception as e:
-        logger.error(f"Erreur lors de l'exécution du rapport : {e}")
+    zones = configured_zones()
+    as_of = start
+    count = 0
+    while as_of <= end:
+        for zone in zones:
+            with metrics.timer('generate_report', zone=zone):
+                report = await generate_production_report(zone, show_zone=len(zones) > 1, as_of=as_of,
+                                                          use_cache=False)
+            print(report + "\n")
+            count += 1
+        as_of += timedelta(minutes=step_minutes)
+    logger.info(f"{count} rapports rejoués du {start} au {end}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rapport de production du parc nucléaire")
+    parser.add_argument('--as-of', type=datetime.fromisoformat,
+                        help="Affiche, sans l'envoyer, le rapport à cette date (ISO 8601, heure locale de Paris)")
+    parser.add_argument('--replay-start', type=datetime.fromisoformat,
+                        help="Début du rejeu des rapports à date (ISO 8601, heure locale de Paris)")
+    parser.add_argument('--replay-end', type=datetime.fromisoformat,
+                        help="Fin du rejeu (défaut : maintenant)")
+    parser.add_argument('--replay-step', type=int, default=60,
+                        help="Intervalle entre deux rapports rejoués, en minutes (défaut : 60)")
+    parser.add_argument(PROFILE_OPTION, action='store_true',
+                        help="Exécute le script et affiche le coût des imports par module")
+    return parser.parse_args(argv)
+
+async def send_reports():
+    """
+    Génère et envoie un rapport par zone suivie
+    """
+    zones = configured_zones()
+    for zone in zones:
+        try:
+            # Génération du rapport
+            with metrics.timer('generate_report', zone=zone):
+                report = await generate_production_report(zone, show_zone=len(zones) > 1)
+            metrics.set('message_bytes', len(report.encode('utf-8')), zone=zone)
+
+            # Envoi du rapport via Telegram
+            await send_telegram_message(report)
+
+        except Exception as e:
+            logger.error(f"Erreur lors de l'exécution du rapport {zone} : {e}")
+
+def main(argv=None):
+    """
+    Fonction principale : rejeu, rapport à date ou envoi des rapports de chaque zone
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.profile_startup:
+        return run_profiled(os.path.abspath(__file__), [a for a in argv if a != PROFILE_OPTION])
+    configure_logging()
+    metrics.start()
+
+    if args.replay_start:
+        # Rejeu des rapports horaires (analyse post-incident), sans envoi Telegram
+        asyncio.run(replay_reports(args.replay_start, args.replay_end or datetime.now(), args.replay_step))
+    elif args.as_of:
+        # Rapport à une date passée, affiché sans envoi Telegram
+        for zone in configured_zones():
+            print(asyncio.run(generate_production_report(zone, show_zone=True, as_of=args.as_of)) + "\n")
+            calculate_average_age_low_production_units(zone, as_of=args.as_of)
+    else:
+        asyncio.run(send_reports())
+        for zone in configured_zones():
+            calculate_average_age_low_production_units(zone)
+    metrics.finish()
+    return 0
 
 if __name__ == "__main__":
-    asyncio.run(main())
-    calculate_average_age_low_production_units()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+Benchmark de bout en bout du cycle fetch -> parse -> import -> report.
+
+Lance les étapes de `_1_getTransparencyAPI.py` à `_4_ProductionReporting_Telegram_bot.py`
+contre le serveur ENTSO-E local (`entsoe_stub_server.py`), avec Telegram
+désactivé (`TELEGRAM_DRY_RUN`), dans un répertoire de travail temporaire.
+Rapporte pour chaque étape la durée, le pic de mémoire (RSS) et le débit en
+lignes par seconde, en mode historique et en mode normal.
+
+Exemples :
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --modes normal --cycles 5 --latency 0.2 --error-rate 0.05
+    python benchmarks/bench_pipeline.py --modes history --zones FR BE CH ES FI SE_3 --latency 0.5
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import entsoe_stub_server  # noqa: E402
+
+RAW_FORMATS = ['csv', 'parquet', 'arrow']  # Valeurs de RAW_OUTPUT_FORMAT
+PARTIAL_FAILURE_CODE = 2  # Code de sortie de _1_getTransparencyAPI.py si une partie des zones seulement a échoué
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STAGES = [
+    ('fetch', '_1_getTransparencyAPI.py'),
+    ('parse', '_2_parser_csv.py'),
+    ('import', '_3_import_csv.py'),
+    ('events', '_3b_detect_unit_events.py'),
+    ('report', '_4_ProductionReporting_Telegram_bot.py'),
+]
+
+
+def seed_database(db_path, zones, unit_count=None):
+    """
+    Pré-crée `production.db` avec les unités servies par le stub et leur
+    puissance nominale, comme dans la base de production.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS units (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        zone TEXT NOT NULL DEFAULT 'FR',
+        name TEXT,
+        location TEXT,
+        production_type TEXT,
+        installation_date TEXT,
+        characteristics TEXT,
+        nominal REAL,
+        UNIQUE(zone, name)
+    )
+    ''')
+    for zone in zones:
+        units = entsoe_stub_server.units_for_zone(zone, unit_count)
+        cursor.executemany('''
+        INSERT OR IGNORE INTO units (zone, name, location, production_type, installation_date, characteristics, nominal)
+        VALUES (?, ?, 'Unknown', 'Nuclear', '1985-01-01', '{}', ?)
+        ''', [(zone, name, nominal) for name, nominal in units])
+    conn.commit()
+    conn.close()
+
+
+def count_production_rows(db_path):
+    if not os.path.exists(db_path):
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM production').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+def count_csv_rows(pattern, header_lines, since):
+    """
+    Nombre de lignes de données des fichiers correspondant au motif écrits
+    depuis `since` (horodatage epoch).
+    """
+    rows = 0
+    for path in glob.glob(pattern):
+        if os.path.getmtime(path) >= since:
+            with open(path, 'rb') as f:
+                rows += max(0, sum(1 for _ in f) - header_lines)
+    return rows
+
+
+def count_raw_rows(data_dir, since):
+    """
+    Nombre de lignes des fichiers bruts (tous formats) écrits depuis `since`.
+    """
+    # Trois lignes d'en-tête CSV : unité, type de production, métrique
+    rows = count_csv_rows(os.path.join(data_dir, '*_output.csv'), 3, since)
+    columnar = [path for pattern in ('*_output.parquet', '*_output.arrow')
+                for path in glob.glob(os.path.join(data_dir, pattern)) if os.path.getmtime(path) >= since]
+    if columnar:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        for path in columnar:
+            if path.endswith('.parquet'):
+                rows += pq.ParquetFile(path).metadata.num_rows
+            else:
+                with pa.memory_map(path) as source:
+                    rows += pa.ipc.open_file(source).read_all().num_rows
+    return rows
+
+
+def run_stage(script, env, cwd, log_file):
+    """
+    Exécute un script et retourne (code retour, durée en s, pic RSS en Mo ou None).
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, script)],
+                               cwd=cwd, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    peak_rss_mb = None
+    if hasattr(os, 'wait4'):
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss est en Ko sous Linux et en octets sous macOS
+        divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        peak_rss_mb = rusage.ru_maxrss / divisor
+    else:
+        try:
+            import psutil
+        except ImportError:
+            psutil = None
+        if psutil is not None:
+            proc = psutil.Process(process.pid)
+            peak_rss_mb = 0.0
+            while process.poll() is None:
+                try:
+                    peak_rss_mb = max(peak_rss_mb, proc.memory_info().rss / (1024 * 1024))
+                except psutil.Error:
+                    break
+                time.sleep(0.05)
+        process.wait()
+    return process.returncode, time.perf_counter() - start, peak_rss_mb
+
+
+def run_cycle(workdir, env, log_file):
+    """
+    Exécute les étapes du cycle et retourne leurs mesures.
+    """
+    data_dir = env['DATA_DIRECTORY']
+    db_path = os.path.join(workdir, 'production.db')
+    results = {}
+    imported_rows = 0
+    for stage, script in STAGES:
+        rows_before = count_production_rows(db_path)
+        stage_start = time.time()
+        returncode, duration, peak_rss_mb = run_stage(script, env, workdir, log_file)
+        if stage == 'fetch':
+            rows = count_raw_rows(data_dir, stage_start)
+        elif stage == 'parse':
+            rows = count_csv_rows(os.path.join(data_dir, '*_filtered.csv'), 1, stage_start)
+        elif stage == 'import':
+            rows = imported_rows = count_production_rows(db_path) - rows_before
+        elif stage == 'events':
+            rows = imported_rows  # La détection n'analyse que les lignes nouvelles
+        else:
+            rows = count_production_rows(db_path)
+        results[stage] = {
+            'returncode': returncode,
+            'wall_s': round(duration, 3),
+            'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+            'rows': rows,
+            'rows_per_s': round(rows / duration, 1) if duration > 0 else None,
+        }
+        logger.info(f"{stage:<7} {duration:7.2f} s  {rows:>8} lignes  RSS {results[stage]['peak_rss_mb']} Mo")
+        if returncode == PARTIAL_FAILURE_CODE:
+            # Les zones récupérées sont traitées par les étapes suivantes
+            logger.warning(f"Étape {stage} en échec partiel (code {returncode}), voir {log_file.name}")
+        elif returncode != 0:
+            logger.error(f"Étape {stage} en échec (code {returncode}), voir {log_file.name}")
+            break
+    results['total_wall_s'] = round(sum(s['wall_s'] for s in results.values()), 3)
+    return results
+
+
+def bench_mode(mode, args, api_url):
+    """
+    Mesure un mode dans un répertoire de travail neuf. Le mode normal est
+    précédé d'un cycle historique (non mesuré) pour disposer d'un historique.
+    """
+    workdir = tempfile.mkdtemp(prefix=f'bench_pipeline_{mode}_')
+    data_dir = os.path.join(workdir, 'data')
+    os.makedirs(data_dir)
+    seed_database(os.path.join(workdir, 'production.db'), args.zones, args.units)
+
+    env = dict(os.environ)
+    env.update({
+        'ENTSOE_ENDPOINT_URL': api_url,
+        'ENTSOE_ZONES': ','.join(args.zones),
+        'API_TOKEN': 'bench',
+        'DATA_DIRECTORY': data_dir,
+        'RAW_OUTPUT_FORMAT': args.raw_format,
+        'TELEGRAM_BOT_TOKEN': '123456:bench',
+        'TELEGRAM_CHAT_ID': '0',
+        'TELEGRAM_DRY_RUN': '1',
+        'PYTHONIOENCODING': 'utf-8',
+    })
+
+    cycles = []
+    log_path = os.path.join(workdir, 'pipeline.log')
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        if mode == 'normal':
+            logger.info("Mode normal : cycle historique préalable (non mesuré)...")
+            run_cycle(workdir, dict(env, HISTORY_MODE='true'), log_file)
+        env['HISTORY_MODE'] = 'true' if mode == 'history' else 'false'
+        for index in range(args.cycles):
+            logger.info(f"Mode {mode} : cycle {index + 1}/{args.cycles}")
+            cycles.append(run_cycle(workdir, env, log_file))
+
+    if args.keep:
+        logger.info(f"Répertoire de travail conservé : {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return cycles
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=['history', 'normal'], default=['history', 'normal'])
+    parser.add_argument('--cycles', type=int, default=1, help='Nombre de cycles mesurés par mode')
+    parser.add_argument('--zones', nargs='+', default=['FR'],
+                        help=f"Zones récupérées (défaut : FR ; disponibles : {' '.join(entsoe_stub_server.ZONE_EIC_CODES)})")
+    parser.add_argument('--units', type=int, help="Nombre d'unités nucléaires servies par zone (défaut : tout le parc)")
+    parser.add_argument('--latency', type=float, default=0.0, help='Latence moyenne du stub par requête (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variation aléatoire de la latence (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Proportion de réponses HTTP 503')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='Proportion de connexions coupées')
+    parser.add_argument('--recorded', help='Fichier XML enregistré à servir pour A73')
+    parser.add_argument('--seed', type=int, default=42, help='Graine du tirage des erreurs')
+    parser.add_argument('--raw-format', choices=RAW_FORMATS, default=os.getenv('RAW_OUTPUT_FORMAT', 'csv'),
+                        help='Format des fichiers bruts du fetch (RAW_OUTPUT_FORMAT)')
+    parser.add_argument('--keep', action='store_true', help='Conserver les répertoires de travail')
+    parser.add_argument('--output', help='Fichier JSON de résultats (défaut : sortie standard)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = entsoe_stub_server.StubConfig(args.latency, args.jitter, args.error_rate, args.reset_rate,
+                                           args.units, args.recorded, args.seed)
+    server, api_url = entsoe_stub_server.start_in_thread(config)
+    logger.info(f"Stub ENTSO-E démarré sur {api_url}")
+
+    results = {'stub': vars(args), 'modes': {}}
+    try:
+        for mode in args.modes:
+            results['modes'][mode] = bench_mode(mode, args, api_url)
+    finally:
+        server.shutdown()
+        server.server_close()
+    results['stub_requests'] = config.requests
+    results['stub_errors'] = config.errors
+
+    payload = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        logger.info(f"Résultats écrits dans {args.output}")
+    else:
+        print(payload)
+    failed = any(stage.get('returncode') for cycles in results['modes'].values()
+                 for cycle in cycles for stage in cycle.values() if isinstance(stage, dict))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
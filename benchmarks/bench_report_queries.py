@@ -0,0 +1,436 @@
+"""
+Benchmark des requêtes du rapport de production sur des bases synthétiques.
+
+Génère des fichiers `production.db` synthétiques (N unités x M années à une
+résolution de 15 minutes, avec arrêts programmés, arrêts fortuits, modulation
+et trous de données), chronomètre chaque requête de `report_queries.py` ainsi
+que le rapport complet, et capture les `EXPLAIN QUERY PLAN`. Mesure aussi le
+rejeu des rapports « à date » horaires du dernier mois de l'historique.
+
+Les bases générées sont mises en cache et jamais modifiées : chaque mesure
+porte sur une copie temporaire, dotée du jeu d'index choisi par `--indexes`
+(enregistré dans les résultats avec la liste des index effectivement présents).
+
+Les résultats sont écrits en JSON ; `--save-baseline` les enregistre comme
+référence et `--compare` signale les régressions par rapport à cette référence
+(mesurée avec le même jeu d'index).
+
+Exemples :
+    python benchmarks/bench_report_queries.py --years 1 5 10
+    python benchmarks/bench_report_queries.py --years 1 --save-baseline
+    python benchmarks/bench_report_queries.py --years 1 --compare
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import report_cache  # noqa: E402
+import report_queries  # noqa: E402
+import unit_events  # noqa: E402
+import unit_unavailability  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(BENCH_DIR, '.cache')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline_report_queries.json')
+DEFAULT_END = datetime(2025, 1, 1)
+
+# Paliers de puissance du parc (MW) : CP0/CPY, P4/P'4, N4, EPR
+NOMINAL_CLASSES = [(900, 0.55), (1300, 0.35), (1500, 0.07), (1620, 0.03)]
+
+# Zone des unités synthétiques
+BENCH_ZONE = 'FR'
+
+# Jeux d'index mesurables : `none` pour le seul schéma (contraintes UNIQUE),
+# `report` pour les index créés par `_3_import_csv.py` (report_queries.INDEX_STATEMENTS)
+INDEX_SETS = ('none', 'report')
+
+# Requêtes chronométrées individuellement
+BENCH_QUERIES = dict(report_queries.REPORT_QUERIES)
+BENCH_QUERIES['low_production_units'] = report_queries.LOW_PRODUCTION_UNITS_QUERY
+BENCH_QUERIES['low_production_age'] = report_queries.LOW_PRODUCTION_AGE_QUERY
+
+
+def _create_schema(cursor):
+    """
+    Crée le schéma tel que produit par `_3_import_csv.py`, complété de la
+    colonne `nominal` lue par le rapport.
+    """
+    cursor.execute('''
+    CREATE TABLE units (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        zone TEXT NOT NULL DEFAULT 'FR',
+        name TEXT,
+        location TEXT,
+        production_type TEXT,
+        installation_date TEXT,
+        characteristics TEXT,
+        nominal REAL,
+        UNIQUE(zone, name)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE production (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unit_id INTEGER,
+        timestamp TEXT,
+        value REAL,
+        UNIQUE(unit_id, timestamp)
+    )
+    ''')
+
+
+def _pick_nominal(rng):
+    roll = rng.random()
+    cumulative = 0.0
+    for nominal, weight in NOMINAL_CLASSES:
+        cumulative += weight
+        if roll <= cumulative:
+            return float(nominal)
+    return float(NOMINAL_CLASSES[-1][0])
+
+
+def _outage_mask(rng, n_points, points_per_day):
+    """
+    Retourne la liste des intervalles [début, fin[ (en nombre de points) pendant
+    lesquels l'unité est à l'arrêt : un arrêt programmé par an et quelques
+    arrêts fortuits.
+    """
+    outages = []
+    points_per_year = 365 * points_per_day
+    year_start = 0
+    while year_start < n_points:
+        # Arrêt programmé (rechargement / visite décennale) : 25 à 120 jours
+        start = year_start + rng.randrange(points_per_year)
+        outages.append((start, start + rng.randint(25, 120) * points_per_day))
+        # Arrêts fortuits : 0 à 3 par an, de quelques heures à 10 jours
+        for _ in range(rng.randint(0, 3)):
+            start = year_start + rng.randrange(points_per_year)
+            outages.append((start, start + rng.randint(points_per_day // 4, 10 * points_per_day)))
+        year_start += points_per_year
+    return sorted(outages)
+
+
+def _unit_rows(rng, unit_id, nominal, start, n_points, step, stop_reporting_at):
+    """
+    Génère les lignes (unit_id, timestamp, value) d'une unité.
+    """
+    points_per_day = int(timedelta(days=1) / step)
+    outages = _outage_mask(rng, n_points, points_per_day)
+    outage_idx = 0
+    level = nominal * rng.uniform(0.85, 1.0)
+    for i in range(min(n_points, stop_reporting_at)):
+        while outage_idx < len(outages) and outages[outage_idx][1] <= i:
+            outage_idx += 1
+        in_outage = outage_idx < len(outages) and outages[outage_idx][0] <= i
+        # Trous de données ponctuels (~0.1%)
+        if rng.random() < 0.001:
+            continue
+        if in_outage:
+            value = rng.uniform(-15.0, 5.0)  # Consommation des auxiliaires
+        else:
+            # Suivi de charge : marche aléatoire bornée entre 60% et 100% du nominal
+            level = min(nominal, max(0.6 * nominal, level + rng.uniform(-0.01, 0.01) * nominal))
+            value = round(level, 1)
+        yield unit_id, (start + i * step).strftime('%Y-%m-%dT%H:%M:%S'), value
+
+
+def generate_database(path, units, years, resolution_minutes, seed, end=DEFAULT_END):
+    """
+    Génère une base `production.db` synthétique au chemin donné.
+
+    Returns:
+        int: nombre de lignes insérées dans `production`.
+    """
+    rng = random.Random(seed)
+    step = timedelta(minutes=resolution_minutes)
+    n_points = int(timedelta(days=365 * years) / step)
+    start = end - n_points * step
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode = OFF')
+    cursor.execute('PRAGMA synchronous = OFF')
+    _create_schema(cursor)
+
+    total_rows = 0
+    for unit_index in range(units):
+        nominal = _pick_nominal(rng)
+        installation_date = datetime(rng.randint(1977, 1999), rng.randint(1, 12), 1).strftime('%Y-%m-%d')
+        cursor.execute('''
+        INSERT INTO units (name, location, production_type, installation_date, characteristics, nominal)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (f'UNIT {unit_index + 1:03d}', 'Synthetic', 'Nuclear', installation_date, '{}', nominal))
+        unit_id = cursor.lastrowid
+
+        # ~5% des unités cessent de publier avant la fin de la période
+        stop_reporting_at = n_points
+        if rng.random() < 0.05:
+            stop_reporting_at = n_points - rng.randint(4, 96 * 3)
+
+        rows = list(_unit_rows(rng, unit_id, nominal, start, n_points, step, stop_reporting_at))
+        cursor.executemany('INSERT INTO production (unit_id, timestamp, value) VALUES (?, ?, ?)', rows)
+        total_rows += len(rows)
+        conn.commit()
+
+    conn.commit()
+    conn.close()
+    return total_rows
+
+
+def get_database(units, years, resolution_minutes, seed, regenerate=False):
+    """
+    Retourne le chemin d'une base synthétique, générée si besoin et mise en cache.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f'production_{units}u_{years}y_{resolution_minutes}m_s{seed}.db')
+    if regenerate or not os.path.exists(path):
+        logger.info(f"Génération de la base synthétique {os.path.basename(path)}...")
+        start = time.perf_counter()
+        rows = generate_database(path, units, years, resolution_minutes, seed)
+        logger.info(f"Base générée : {rows} lignes en {time.perf_counter() - start:.1f} s")
+    return path
+
+
+def explain(cursor, query, params):
+    """
+    Retourne le plan d'exécution (EXPLAIN QUERY PLAN) d'une requête.
+    """
+    cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+    return [row[-1] for row in cursor.fetchall()]
+
+
+def time_callable(func, repeat):
+    """
+    Chronomètre `repeat` exécutions de `func` et retourne les statistiques.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {
+        'min_s': min(durations),
+        'median_s': statistics.median(durations),
+        'mean_s': statistics.fmean(durations),
+        'repeat': repeat,
+    }
+
+
+def replay_reports(cursor, end, days, step_minutes):
+    """
+    Génère les rapports « à date » de la zone à intervalle régulier sur les
+    `days` jours précédant `end` et retourne le nombre de rapports.
+    """
+    end = datetime.fromisoformat(end)
+    step = timedelta(minutes=step_minutes)
+    as_of = end - timedelta(days=days)
+    count = 0
+    while as_of <= end:
+        report_queries.fetch_report_data(cursor, BENCH_ZONE, as_of=as_of)
+        as_of += step
+        count += 1
+    return count
+
+
+def list_indexes(cursor):
+    """
+    Retourne les index présents dans la base, par table (index automatiques compris).
+    """
+    cursor.execute("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name")
+    return [f'{table}.{name}' for table, name in cursor.fetchall()]
+
+
+def bench_database(path, repeat, indexes, replay_days):
+    """
+    Chronomètre les requêtes du rapport, le rapport complet et le rejeu des
+    rapports horaires sur une copie temporaire de la base (la base en cache
+    n'est pas modifiée).
+    """
+    with tempfile.TemporaryDirectory(prefix='bench_report_queries_') as work_dir:
+        copy = os.path.join(work_dir, os.path.basename(path))
+        shutil.copyfile(path, copy)
+        return _bench_copy(copy, os.path.basename(path), repeat, indexes, replay_days)
+
+
+def reset_schema(cursor):
+    """
+    Supprime les index, le cache du rapport et la table `meta` de la copie mesurée.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'DROP INDEX "{name}"')
+    cursor.execute('DROP TABLE IF EXISTS report_cache')
+    cursor.execute('DROP TABLE IF EXISTS meta')
+
+
+def _bench_copy(path, label, repeat, indexes, replay_days):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    reset_schema(cursor)
+    # Tables des événements et des avis d'indisponibilité lues par le rapport (vides sur les bases synthétiques)
+    unit_events.ensure_events_tables(cursor)
+    unit_unavailability.ensure_unavailability_table(cursor)
+    if indexes == 'report':
+        report_queries.ensure_indexes(cursor)
+    conn.commit()
+    cursor.execute('ANALYZE')
+
+    cursor.execute('SELECT COUNT(*) FROM production')
+    rows = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM units')
+    units = cursor.fetchone()[0]
+
+    # Paramètres du rapport sur les dernières données
+    params = {'zone': BENCH_ZONE, 'as_of': report_queries.resolve_as_of(cursor, BENCH_ZONE)}
+
+    results = {'rows': rows, 'units': units, 'indexes': list_indexes(cursor), 'queries': {}}
+    for name, query in BENCH_QUERIES.items():
+        stats = time_callable(lambda: cursor.execute(query, params).fetchall(), repeat)
+        stats['plan'] = explain(cursor, query, params)
+        results['queries'][name] = stats
+        logger.info(f"{label} - {name} : médiane {stats['median_s'] * 1000:.1f} ms")
+
+    results['full_report'] = time_callable(lambda: report_queries.fetch_report_data(cursor, BENCH_ZONE), repeat)
+    logger.info(f"{label} - rapport complet : médiane {results['full_report']['median_s'] * 1000:.1f} ms")
+
+    # Rapport servi depuis le cache (données inchangées depuis le premier calcul)
+    report_cache.cached_report_data(conn, BENCH_ZONE)
+    results['cached_report'] = time_callable(lambda: report_cache.cached_report_data(conn, BENCH_ZONE), repeat)
+    logger.info(f"{label} - rapport en cache : médiane {results['cached_report']['median_s'] * 1000:.3f} ms")
+
+    if replay_days:
+        reports = []
+        results['replay'] = time_callable(
+            lambda: reports.append(replay_reports(cursor, params['as_of'], replay_days, 60)), 1)
+        results['replay']['reports'] = reports[0]
+        logger.info(f"{label} - rejeu de {reports[0]} rapports horaires : "
+                    f"{results['replay']['median_s']:.2f} s")
+    conn.close()
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compare les médianes aux valeurs de référence.
+
+    Returns:
+        list: messages décrivant les régressions détectées.
+    """
+    regressions = []
+    current_indexes = results['meta']['indexes']
+    reference_indexes = baseline.get('meta', {}).get('indexes')
+    if reference_indexes != current_indexes:
+        # Des jeux d'index différents ne mesurent pas le même schéma
+        return [f"jeu d'index de la référence ({reference_indexes}) différent de la mesure ({current_indexes}) : "
+                f"enregistrer une nouvelle référence avec --indexes {current_indexes}"]
+    for dataset, current in results['datasets'].items():
+        reference = baseline.get('datasets', {}).get(dataset)
+        if reference is None:
+            logger.warning(f"Pas de référence pour le jeu de données {dataset}")
+            continue
+        pairs = [(name, current['queries'][name], reference['queries'].get(name)) for name in current['queries']]
+        pairs.append(('full_report', current['full_report'], reference.get('full_report')))
+        if 'cached_report' in current:
+            pairs.append(('cached_report', current['cached_report'], reference.get('cached_report')))
+        if 'replay' in current:
+            pairs.append(('replay', current['replay'], reference.get('replay')))
+        for name, cur, ref in pairs:
+            if ref is None:
+                continue
+            ratio = cur['median_s'] / ref['median_s'] if ref['median_s'] > 0 else 1.0
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    f"{dataset}/{name} : {ref['median_s'] * 1000:.1f} ms -> {cur['median_s'] * 1000:.1f} ms (x{ratio:.2f})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--units', type=int, default=60, help="Nombre d'unités (défaut : 60)")
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10], help="Profondeurs d'historique en années")
+    parser.add_argument('--resolution', type=int, default=15, help='Résolution en minutes (défaut : 15)')
+    parser.add_argument('--seed', type=int, default=42, help='Graine du générateur aléatoire')
+    parser.add_argument('--repeat', type=int, default=5, help='Nombre de répétitions par requête')
+    parser.add_argument('--replay-days', type=int, default=30,
+                        help='Jours de rapports horaires rejoués (défaut : 30, 0 pour désactiver)')
+    parser.add_argument('--indexes', choices=INDEX_SETS, default='report',
+                        help="Index créés sur la copie mesurée : 'report' (défaut, index de "
+                             "report_queries.INDEX_STATEMENTS créés par l'import) ou 'none' (schéma seul)")
+    parser.add_argument('--regenerate', action='store_true', help='Régénérer les bases même si elles sont en cache')
+    parser.add_argument('--output', help='Fichier JSON de résultats (défaut : sortie standard)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Fichier JSON de référence')
+    parser.add_argument('--save-baseline', action='store_true', help='Enregistrer les résultats comme référence')
+    parser.add_argument('--compare', action='store_true', help='Comparer à la référence et échouer en cas de régression')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Dégradation relative tolérée avant de signaler une régression (défaut : 0.25)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    results = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'resolution_minutes': args.resolution,
+            'repeat': args.repeat,
+            'indexes': args.indexes,
+            'replay_days': args.replay_days,
+        },
+        'datasets': {},
+    }
+    for years in args.years:
+        path = get_database(args.units, years, args.resolution, args.seed, args.regenerate)
+        results['datasets'][f'{args.units}u_{years}y'] = bench_database(path, args.repeat, args.indexes, args.replay_days)
+
+    payload = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        logger.info(f"Résultats écrits dans {args.output}")
+    else:
+        print(payload)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        logger.info(f"Référence enregistrée dans {args.baseline}")
+
+    if args.compare:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            logger.error(f"Fichier de référence introuvable : {args.baseline}")
+            return 1
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            for message in regressions:
+                logger.error(f"Régression : {message}")
+            return 1
+        logger.info("Aucune régression par rapport à la référence.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+Serveur local remplaçant l'API ENTSO-E Transparency pour les benchmarks.
+
+Répond aux requêtes `query_generation_per_plant` (documentType A73) avec des
+documents GL_MarketDocument synthétiques (ou enregistrés) au format attendu
+par `entsoe-py`, pour la France et quelques autres parcs nucléaires européens
+(voir ZONE_EIC_CODES), avec une latence et des taux d'erreur configurables.
+Les requêtes `query_unavailability_of_generation_units` (documentType A80)
+reçoivent une archive ZIP d'avis d'indisponibilité cohérents avec les arrêts
+des unités dans les documents A73.
+
+Pour y connecter `_1_getTransparencyAPI.py`, définir avant son lancement :
+    ENTSOE_ENDPOINT_URL=http://127.0.0.1:<port>/api
+
+Exemple :
+    python benchmarks/entsoe_stub_server.py --port 8765 --latency 0.3 --error-rate 0.05
+"""
+import argparse
+import hashlib
+import io
+import logging
+import random
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Parc nucléaire français : (nom ENTSO-E, puissance nominale en MW)
+FR_NUCLEAR_UNITS = (
+    [(f'BELLEVILLE {i}', 1310) for i in (1, 2)]
+    + [(f'BLAYAIS {i}', 910) for i in (1, 2, 3, 4)]
+    + [(f'BUGEY {i}', 910 if i < 4 else 880) for i in (2, 3, 4, 5)]
+    + [(f'CATTENOM {i}', 1300) for i in (1, 2, 3, 4)]
+    + [(f'CHINON {i}', 905) for i in (1, 2, 3, 4)]
+    + [(f'CHOOZ {i}', 1500) for i in (1, 2)]
+    + [(f'CIVAUX {i}', 1495) for i in (1, 2)]
+    + [(f'CRUAS {i}', 915) for i in (1, 2, 3, 4)]
+    + [(f'DAMPIERRE {i}', 890) for i in (1, 2, 3, 4)]
+    + [(f'FLAMANVILLE {i}', 1330) for i in (1, 2)] + [('FLAMANVILLE 3', 1620)]
+    + [(f'GOLFECH {i}', 1310) for i in (1, 2)]
+    + [(f'GRAVELINES {i}', 910) for i in (1, 2, 3, 4, 5, 6)]
+    + [(f'NOGENT {i}', 1310) for i in (1, 2)]
+    + [(f'PALUEL {i}', 1330) for i in (1, 2, 3, 4)]
+    + [(f'PENLY {i}', 1330) for i in (1, 2)]
+    + [(f'ST ALBAN {i}', 1335) for i in (1, 2)]
+    + [(f'ST LAURENT {i}', 915) for i in (1, 2)]
+    + [(f'TRICASTIN {i}', 915) for i in (1, 2, 3, 4)]
+)
+
+# Autres parcs nucléaires européens : (nom, puissance nominale en MW)
+NUCLEAR_UNITS_BY_ZONE = {
+    'FR': FR_NUCLEAR_UNITS,
+    'BE': [('DOEL 1', 445), ('DOEL 2', 445), ('DOEL 3', 1006), ('DOEL 4', 1039),
+           ('TIHANGE 1', 962), ('TIHANGE 2', 1008), ('TIHANGE 3', 1038)],
+    'CH': [('BEZNAU 1', 365), ('BEZNAU 2', 365), ('GOESGEN', 1010), ('LEIBSTADT', 1233)],
+    'ES': [('ALMARAZ 1', 1011), ('ALMARAZ 2', 1006), ('ASCO 1', 995), ('ASCO 2', 997),
+           ('COFRENTES', 1064), ('VANDELLOS 2', 1045), ('TRILLO', 1003)],
+    'FI': [('OLKILUOTO 1', 890), ('OLKILUOTO 2', 890), ('OLKILUOTO 3', 1600), ('LOVIISA 1', 507), ('LOVIISA 2', 507)],
+    'SE_3': [('FORSMARK 1', 984), ('FORSMARK 2', 1120), ('FORSMARK 3', 1167),
+             ('OSKARSHAMN 3', 1400), ('RINGHALS 3', 1063), ('RINGHALS 4', 1104)],
+}
+
+# Codes EIC des zones servies (paramètre in_Domain des requêtes)
+ZONE_EIC_CODES = {
+    'FR': '10YFR-RTE------C',
+    'BE': '10YBE----------2',
+    'CH': '10YCH-SWISSGRIDZ',
+    'ES': '10YES-REE------0',
+    'FI': '10YFI-1--------U',
+    'SE_3': '10Y1001A1001A46L',
+}
+ZONES_BY_EIC_CODE = {code: zone for zone, code in ZONE_EIC_CODES.items()}
+
+# Quelques unités non nucléaires pour exercer le filtrage de `_2_parser_csv.py`
+OTHER_UNITS = [('GRAND MAISON', 'B10', 1800), ('CORDEMAIS 4', 'B05', 580), ('MARTIGUES 5', 'B04', 465)]
+
+NAMESPACE = 'urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0'
+OUTAGE_NAMESPACE = 'urn:iec62325.351:tc57wg16:451-6:outagedocument:3:0'
+RESOLUTION = timedelta(minutes=15)
+MAX_OUTAGE_DAYS = 60  # Recherche des bornes d'un arrêt autour de la période demandée
+
+ACKNOWLEDGEMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<Acknowledgement_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-1:acknowledgementdocument:7:0">
+    <mRID>stub</mRID>
+    <Reason>
+        <code>999</code>
+        <text>No matching data found for Data item Actual Generation per Generation Unit [16.1.A].</text>
+    </Reason>
+</Acknowledgement_MarketDocument>
+"""
+
+
+def _parse_period(value):
+    return datetime.strptime(value, '%Y%m%d%H%M').replace(tzinfo=timezone.utc)
+
+
+def _format_time(dt):
+    return dt.strftime('%Y-%m-%dT%H:%MZ')
+
+
+def _unit_state(name, nominal, timestamp):
+    """
+    Valeur déterministe d'une unité à un instant donné : les mêmes requêtes
+    renvoient les mêmes valeurs d'un appel à l'autre.
+    """
+    day_seed = int(hashlib.md5(f'{name}|{timestamp:%Y-%m-%d}'.encode()).hexdigest()[:8], 16)
+    # ~10% des unités-jours sont à l'arrêt
+    if day_seed % 10 == 0:
+        return 'off', -float(5 + day_seed % 15)
+    point_seed = int(hashlib.md5(f'{name}|{timestamp:%Y-%m-%dT%H:%M}'.encode()).hexdigest()[:8], 16)
+    return 'on', round(nominal * (0.7 + 0.3 * (point_seed % 1000) / 1000), 1)
+
+
+def units_for_zone(zone, unit_count=None):
+    """
+    Unités nucléaires servies pour une zone, limitées à `unit_count` si précisé.
+    """
+    units = NUCLEAR_UNITS_BY_ZONE.get(zone, [])
+    return units[:unit_count] if unit_count else units
+
+
+def _timeseries(mrid, name, psr_type, start, end, values, zone_code, consumption=False):
+    domain = 'outBiddingZone_Domain.mRID' if consumption else 'inBiddingZone_Domain.mRID'
+    points = ''.join(
+        f'<Point><position>{i + 1}</position><quantity>{value}</quantity></Point>'
+        for i, value in enumerate(values)
+    )
+    return (
+        f'<TimeSeries><mRID>{mrid}</mRID><businessType>A01</businessType>'
+        f'<objectAggregation>A06</objectAggregation>'
+        f'<{domain} codingScheme="A01">{zone_code}</{domain}>'
+        f'<quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name><curveType>A01</curveType>'
+        f'<MktPSRType><psrType>{psr_type}</psrType><PowerSystemResources>'
+        f'<mRID codingScheme="A01">17W{mrid:013d}</mRID><name>{name}</name>'
+        f'</PowerSystemResources></MktPSRType>'
+        f'<Period><timeInterval><start>{_format_time(start)}</start><end>{_format_time(end)}</end></timeInterval>'
+        f'<resolution>PT15M</resolution>{points}</Period></TimeSeries>'
+    )
+
+
+def _outage_bounds(name, nominal, day):
+    """
+    Bornes [début, fin[ (jours UTC entiers) de l'arrêt qui contient `day`.
+    """
+    first = day
+    while first - day < timedelta(days=MAX_OUTAGE_DAYS) and \
+            _unit_state(name, nominal, first - timedelta(days=1))[0] == 'off':
+        first -= timedelta(days=1)
+    last = day
+    while last - day < timedelta(days=MAX_OUTAGE_DAYS) and \
+            _unit_state(name, nominal, last + timedelta(days=1))[0] == 'off':
+        last += timedelta(days=1)
+    return first, last + timedelta(days=1)
+
+
+def _unavailability_document(name, nominal, zone_code, outage_start, outage_end):
+    mrid = hashlib.md5(f'{name}|{outage_start:%Y-%m-%d}'.encode()).hexdigest()[:20]
+    business_type = 'A54' if int(mrid[:8], 16) % 3 == 0 else 'A53'  # Un arrêt sur trois est fortuit
+    site = name.rstrip('0123456789').strip()
+    created = outage_start - timedelta(days=30 if business_type == 'A53' else 0)
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><Unavailability_MarketDocument xmlns="{OUTAGE_NAMESPACE}">'
+        f'<mRID>{mrid}</mRID><revisionNumber>1</revisionNumber><type>A80</type>'
+        f'<process.processType>A26</process.processType><createdDateTime>{_format_time(created)}</createdDateTime>'
+        f'<TimeSeries><mRID>1</mRID><businessType>{business_type}</businessType>'
+        f'<biddingZone_Domain.mRID codingScheme="A01">{zone_code}</biddingZone_Domain.mRID>'
+        f'<start_DateAndOrTime.date>{outage_start:%Y-%m-%d}</start_DateAndOrTime.date>'
+        f'<end_DateAndOrTime.date>{outage_end:%Y-%m-%d}</end_DateAndOrTime.date>'
+        f'<quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name><curveType>A03</curveType>'
+        f'<production_RegisteredResource.mRID codingScheme="A01">{mrid[:16]}</production_RegisteredResource.mRID>'
+        f'<production_RegisteredResource.name>{site}</production_RegisteredResource.name>'
+        f'<production_RegisteredResource.location.name>{site}</production_RegisteredResource.location.name>'
+        f'<production_RegisteredResource.pSRType.psrType>B14</production_RegisteredResource.pSRType.psrType>'
+        f'<production_RegisteredResource.pSRType.powerSystemResources.name>{name}'
+        f'</production_RegisteredResource.pSRType.powerSystemResources.name>'
+        f'<production_RegisteredResource.pSRType.powerSystemResources.nominalP unit="MAW">{nominal}'
+        f'</production_RegisteredResource.pSRType.powerSystemResources.nominalP>'
+        f'<Available_Period><timeInterval><start>{_format_time(outage_start)}</start>'
+        f'<end>{_format_time(outage_end)}</end></timeInterval><resolution>PT1M</resolution>'
+        f'<Point><position>1</position><quantity>0</quantity></Point></Available_Period>'
+        f'</TimeSeries></Unavailability_MarketDocument>'
+    )
+
+
+def build_unavailability_archive(start, end, zone='FR', unit_count=None):
+    """
+    Construit l'archive ZIP des avis d'indisponibilité (A80) des arrêts en
+    cours pendant [start, end[ pour une zone, ou None s'il n'y en a aucun.
+    """
+    zone_code = ZONE_EIC_CODES[zone]
+    documents = {}
+    for name, nominal in units_for_zone(zone, unit_count):
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < end:
+            if _unit_state(name, nominal, day)[0] == 'off':
+                outage_start, outage_end = _outage_bounds(name, nominal, day)
+                documents[(name, outage_start)] = _unavailability_document(
+                    name, nominal, zone_code, outage_start, outage_end)
+                day = outage_end
+            else:
+                day += timedelta(days=1)
+    if not documents:
+        return None
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for i, document in enumerate(documents.values()):
+            archive.writestr(f'outage_{i + 1}.xml', document)
+    return buffer.getvalue()
+
+
+def build_generation_document(start, end, zone='FR', unit_count=None):
+    """
+    Construit un document A73 synthétique couvrant [start, end[ pour une zone.
+    """
+    steps = []
+    current = start
+    while current < end:
+        steps.append(current)
+        current += RESOLUTION
+    if not steps:
+        return ACKNOWLEDGEMENT
+
+    units = units_for_zone(zone, unit_count)
+    if not units:
+        return ACKNOWLEDGEMENT
+    zone_code = ZONE_EIC_CODES[zone]
+    series = []
+    mrid = 1
+    for name, nominal in units:
+        states = [_unit_state(name, nominal, ts) for ts in steps]
+        series.append(_timeseries(mrid, name, 'B14', start, steps[-1] + RESOLUTION,
+                                  [value if state == 'on' else 0.0 for state, value in states], zone_code))
+        mrid += 1
+        # Les unités à l'arrêt publient la consommation de leurs auxiliaires
+        if any(state == 'off' for state, _ in states):
+            series.append(_timeseries(mrid, name, 'B14', start, steps[-1] + RESOLUTION,
+                                      [-value if state == 'off' else 0.0 for state, value in states],
+                                      zone_code, consumption=True))
+            mrid += 1
+    for name, psr_type, nominal in OTHER_UNITS:
+        series.append(_timeseries(mrid, name, psr_type, start, steps[-1] + RESOLUTION,
+                                  [round(nominal * 0.5, 1)] * len(steps), zone_code))
+        mrid += 1
+
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><GL_MarketDocument xmlns="{NAMESPACE}">'
+        f'<mRID>stub</mRID><revisionNumber>1</revisionNumber><type>A73</type>'
+        f'<process.processType>A16</process.processType>'
+        f'<time_Period.timeInterval><start>{_format_time(start)}</start><end>{_format_time(end)}</end>'
+        f'</time_Period.timeInterval>{"".join(series)}</GL_MarketDocument>'
+    )
+
+
+class StubConfig:
+    """
+    Paramètres du serveur, partagés entre les threads de requête.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, reset_rate=0.0,
+                 unit_count=None, recorded=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.unit_count = unit_count
+        self.recorded = recorded
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def draw(self):
+        with self.lock:
+            self.requests += 1
+            return self.random.random(), self.random.uniform(-self.jitter, self.jitter)
+
+
+class EntsoeStubHandler(BaseHTTPRequestHandler):
+    config = None  # Défini par make_server()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        config = self.config
+        roll, jitter = config.draw()
+        time.sleep(max(0.0, config.latency + jitter))
+
+        # Coupure de connexion : ConnectionError côté client (relancée par tenacity)
+        if roll < config.reset_rate:
+            with config.lock:
+                config.errors += 1
+            self.close_connection = True
+            self.connection.close()
+            return
+        # Erreur serveur : HTTPError côté client
+        if roll < config.reset_rate + config.error_rate:
+            with config.lock:
+                config.errors += 1
+            self._send(503, '<html><body>Service Unavailable</body></html>', 'text/html')
+            return
+
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        if params.get('documentType') == 'A80':
+            self._send_unavailability(params)
+            return
+        if params.get('documentType') != 'A73':
+            self._send(200, ACKNOWLEDGEMENT)
+            return
+        if config.recorded:
+            with open(config.recorded, 'r', encoding='utf-8') as f:
+                self._send(200, f.read())
+            return
+        try:
+            start = _parse_period(params['periodStart'])
+            end = _parse_period(params['periodEnd'])
+        except (KeyError, ValueError):
+            self._send(400, '<html><body>Bad Request</body></html>', 'text/html')
+            return
+        zone = ZONES_BY_EIC_CODE.get(params.get('in_Domain'))
+        if zone is None:
+            self._send(200, ACKNOWLEDGEMENT)
+            return
+        self._send(200, build_generation_document(start, end, zone, config.unit_count))
+
+    def _send_unavailability(self, params):
+        try:
+            start = _parse_period(params['periodStart'])
+            end = _parse_period(params['periodEnd'])
+        except (KeyError, ValueError):
+            self._send(400, '<html><body>Bad Request</body></html>', 'text/html')
+            return
+        zone = ZONES_BY_EIC_CODE.get(params.get('biddingZone_domain'))
+        # Tous les avis tiennent dans la première page (offset 0) de 200 documents
+        archive = None
+        if zone is not None and int(params.get('offset', 0)) == 0:
+            archive = build_unavailability_archive(start, end, zone, self.config.unit_count)
+        if archive is None:
+            self._send(200, ACKNOWLEDGEMENT)
+            return
+        self._send(200, archive, 'application/zip')
+
+    def _send(self, status, body, content_type='text/xml'):
+        payload = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_server(config, host='127.0.0.1', port=0):
+    """
+    Crée le serveur (port 0 : port libre choisi par le système).
+    """
+    handler = type('ConfiguredEntsoeStubHandler', (EntsoeStubHandler,), {'config': config})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_thread(config, host='127.0.0.1', port=0):
+    """
+    Démarre le serveur dans un thread et retourne (server, url de l'API).
+    """
+    server = make_server(config, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_address[1]}/api'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Latence moyenne par requête (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variation aléatoire de la latence (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Proportion de réponses HTTP 503')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='Proportion de connexions coupées')
+    parser.add_argument('--units', type=int, help="Nombre d'unités nucléaires servies (défaut : tout le parc)")
+    parser.add_argument('--recorded', help='Fichier XML enregistré à servir tel quel pour A73')
+    parser.add_argument('--seed', type=int, help='Graine du tirage des erreurs')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.reset_rate,
+                        args.units, args.recorded, args.seed)
+    server = make_server(config, args.host, args.port)
+    logger.info(f"Serveur ENTSO-E local sur http://{args.host}:{server.server_address[1]}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Arrêt du serveur : {config.requests} requêtes servies, {config.errors} erreurs injectées.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Marques de haute eau des données importées.
+
+`_3_import_csv.py` enregistre dans la table `high_water_marks`, pour chaque
+zone, le dernier timestamp importé du parc (ligne `unit_id` = FLEET_UNIT_ID,
+plus récent timestamp toutes unités confondues). En mode normal, `_1_getTransparencyAPI.py` reprend la récupération à la marque
+du parc moins un recouvrement (NORMAL_MODE_OVERLAP_MINUTES) qui permet de
+récupérer les valeurs révisées tardivement par ENTSO-E : une seule ligne lue
+par clé primaire, quel que soit le contenu du répertoire de données.
+
+Les timestamps sont en heure locale de Paris, sans fuseau horaire, comme dans
+la table `production`. Une marque ne recule jamais.
+"""
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from zones import DEFAULT_ZONE
+
+FLEET_UNIT_ID = 0  # Ligne du parc (les id de la table `units` commencent à 1)
+
+
+def ensure_high_water_marks_table(cursor):
+    """
+    Crée la table des marques. À sa création, elle est initialisée depuis la
+    table `production` (bases antérieures aux marques).
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'high_water_marks'")
+    if cursor.fetchone():
+        # Marques par unité écrites par les versions antérieures, jamais lues
+        cursor.execute('DELETE FROM high_water_marks WHERE unit_id <> ?', (FLEET_UNIT_ID,))
+        return
+    cursor.execute('''
+    CREATE TABLE high_water_marks (
+        zone TEXT,
+        unit_id INTEGER,
+        last_timestamp TEXT,
+        updated_at TEXT,
+        PRIMARY KEY (zone, unit_id)
+    )
+    ''')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'production'")
+    if cursor.fetchone():
+        cursor.execute('''
+        SELECT u.zone, MAX(p.timestamp)
+        FROM units u
+        JOIN production p ON p.unit_id = u.id
+        GROUP BY u.zone
+        ''')
+        for zone, last_timestamp in cursor.fetchall():
+            update_high_water_mark(cursor, zone, last_timestamp)
+
+
+def update_high_water_mark(cursor, zone, last_timestamp):
+    """
+    Avance la marque du parc de la zone, sans jamais la faire reculer.
+
+    Args:
+        cursor: curseur SQLite (à valider dans la transaction de l'import).
+        zone (str): zone du parc.
+        last_timestamp (str): dernier timestamp importé, ou None si rien n'a été importé.
+    """
+    if last_timestamp is None:
+        return
+    cursor.execute('''
+    INSERT INTO high_water_marks (zone, unit_id, last_timestamp, updated_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(zone, unit_id) DO UPDATE SET
+        last_timestamp = excluded.last_timestamp,
+        updated_at = excluded.updated_at
+    WHERE excluded.last_timestamp > high_water_marks.last_timestamp
+    ''', (zone, FLEET_UNIT_ID, last_timestamp, datetime.now().strftime('%Y-%m-%dT%H:%M:%S')))
+
+
+def read_fleet_high_water_mark(db_path, zone=DEFAULT_ZONE):
+    """
+    Retourne le dernier timestamp importé pour la zone (texte, heure locale
+    de Paris), ou None si la base n'existe pas ou ne contient pas encore de marque.
+
+    La base est ouverte en lecture seule : un fichier absent n'est pas créé vide.
+    """
+    try:
+        conn = sqlite3.connect(f'{Path(db_path).absolute().as_uri()}?mode=ro', uri=True)
+    except sqlite3.OperationalError:
+        # Base absente : aucun import encore effectué
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT last_timestamp FROM high_water_marks WHERE zone = ? AND unit_id = ?
+        ''', (zone, FLEET_UNIT_ID))
+        row = cursor.fetchone()
+    except sqlite3.OperationalError:
+        # Table absente : aucun import depuis l'introduction des marques
+        return None
+    finally:
+        conn.close()
+    return row[0] if row else None
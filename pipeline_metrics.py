@@ -0,0 +1,220 @@
+"""
+Instrumentation du cycle horaire.
+
+Chaque script du pipeline crée un `StageMetrics` pour son étape (fetch, parse,
+import, report), mesure ses durées, volumes et requêtes, puis appelle
+`finish()`. Les mesures sont enregistrées dans la table `metrics` de
+`production.db` et exportées au format texte Prometheus (textfile collector
+de node_exporter) dans le fichier `METRICS_TEXTFILE`. Les mesures plus
+anciennes que METRICS_RETENTION_DAYS jours sont supprimées à chaque
+enregistrement de l'étape.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+DB_PATH = 'production.db'                                              # Base de données du pipeline
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', 'rte_pipeline.prom')  # Fichier exporté pour Prometheus
+METRIC_PREFIX = 'rte_pipeline_'
+METRICS_RETENTION_DAYS = int(os.getenv('METRICS_RETENTION_DAYS', '30'))   # Durée de conservation de la table metrics
+
+logger = logging.getLogger(__name__)
+
+
+def current_cycle_id():
+    """
+    Identifiant du cycle : variable CYCLE_ID si définie par l'ordonnanceur,
+    sinon l'heure courante (un cycle par heure).
+    """
+    return os.getenv('CYCLE_ID') or datetime.now().strftime('%Y-%m-%dT%H')
+
+
+def peak_memory_bytes():
+    """
+    Pic de mémoire résidente du processus courant, ou None si indisponible.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss est en octets sous macOS et en Ko sous Linux
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+def ensure_metrics_table(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cycle_id TEXT,
+        stage TEXT,
+        name TEXT,
+        labels TEXT,
+        value REAL,
+        recorded_at TEXT
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metrics_cycle ON metrics(cycle_id, stage)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metrics_name ON metrics(stage, name, recorded_at)')
+    # Dernier enregistrement de chaque étape (export) et purge de rétention
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metrics_stage_time ON metrics(stage, recorded_at)')
+
+
+def _escape_label_value(value):
+    # Format texte Prometheus : barre oblique inverse, guillemet et saut de ligne échappés
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in sorted(labels.items()))
+
+
+class StageMetrics:
+    """
+    Mesures d'une étape du pipeline.
+
+    Toutes les mesures sont des jauges décrivant la dernière exécution :
+    `*_seconds` pour les durées, `*_count` pour les nombres d'appels,
+    `*_bytes` pour les volumes.
+
+    Avec `start=False` (mesures créées à l'import d'un script), la mesure de
+    l'étape ne commence qu'à l'appel de `start()` dans son point d'entrée.
+    """
+
+    def __init__(self, stage, db_path=DB_PATH, textfile=METRICS_TEXTFILE, start=True):
+        self.stage = stage
+        self.db_path = db_path
+        self.textfile = textfile
+        self.cycle_id = current_cycle_id()
+        self.values = {}
+        self._lock = threading.Lock()  # Mesures possibles depuis plusieurs threads
+        self._start = None
+        self._finished = False
+        if start:
+            self.start()
+
+    def start(self):
+        """
+        Démarre la mesure de l'étape ; elle est enregistrée en échec si le
+        processus se termine sans appel à `finish()`.
+        """
+        self._start = time.perf_counter()
+        atexit.register(self._finish_at_exit)
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.values[(name, _format_labels(labels))] = float(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _format_labels(labels))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Cumule la durée du bloc dans `<name>_seconds` et compte les appels
+        dans `<name>_count`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc(f'{name}_seconds', time.perf_counter() - start, **labels)
+            self.inc(f'{name}_count', 1, **labels)
+
+    def finish(self, success=True):
+        """
+        Enregistre les mesures de l'étape et met à jour l'export Prometheus.
+        """
+        if self._finished or self._start is None:
+            return
+        self._finished = True
+        self.set('duration_seconds', time.perf_counter() - self._start)
+        self.set('success', 1 if success else 0)
+        self.set('last_run_timestamp_seconds', time.time())
+        peak = peak_memory_bytes()
+        if peak is not None:
+            self.set('peak_memory_bytes', peak)
+        try:
+            self._persist()
+            self._export_textfile()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Impossible d'enregistrer les métriques de l'étape {self.stage} : {e}")
+
+    def _finish_at_exit(self):
+        # Sortie anticipée (exit()) sans appel explicite à finish()
+        if not self._finished:
+            self.finish(success=False)
+
+    def _persist(self):
+        recorded_at = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            ensure_metrics_table(cursor)
+            cursor.executemany('''
+            INSERT INTO metrics (cycle_id, stage, name, labels, value, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(self.cycle_id, self.stage, name, labels, value, recorded_at)
+                  for (name, labels), value in self.values.items()])
+            if METRICS_RETENTION_DAYS > 0:
+                cutoff = (datetime.now() - timedelta(days=METRICS_RETENTION_DAYS)).strftime('%Y-%m-%dT%H:%M:%S')
+                cursor.execute('DELETE FROM metrics WHERE stage = ? AND recorded_at < ?', (self.stage, cutoff))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _export_textfile(self):
+        if not self.textfile:
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            # Dernière valeur de chaque métrique pour chaque étape
+            cursor.execute('''
+            SELECT m.stage, m.name, m.labels, m.value
+            FROM metrics m
+            JOIN (
+                SELECT stage, MAX(recorded_at) AS recorded_at
+                FROM metrics
+                GROUP BY stage
+            ) last ON last.stage = m.stage AND last.recorded_at = m.recorded_at
+            ORDER BY m.name, m.stage, m.labels
+            ''')
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        lines = []
+        declared = set()
+        for stage, name, labels, value in rows:
+            metric = METRIC_PREFIX + name
+            if metric not in declared:
+                lines.append(f'# TYPE {metric} gauge')
+                declared.add(metric)
+            all_labels = _format_labels({'stage': stage}) + (f',{labels}' if labels else '')
+            lines.append(f'{metric}{{{all_labels}}} {value!r}')
+        # Durée du cycle : somme des dernières durées de chaque étape
+        stage_durations = [value for _, name, _, value in rows if name == 'duration_seconds']
+        if stage_durations:
+            lines.append(f'# TYPE {METRIC_PREFIX}cycle_duration_seconds gauge')
+            lines.append(f'{METRIC_PREFIX}cycle_duration_seconds {sum(stage_durations)!r}')
+
+        # Écriture atomique : le collecteur ne doit jamais lire un fichier partiel
+        tmp_path = f'{self.textfile}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.textfile)
@@ -0,0 +1,137 @@
+"""
+Fichiers bruts écrits par `_1_getTransparencyAPI.py`.
+
+Le format est choisi par la variable d'environnement RAW_OUTPUT_FORMAT :
+
+- `csv` (défaut) : CSV large à trois lignes d'en-tête (unité, type de
+  production, métrique), relu et réinterprété par chaque étape ;
+- `parquet` ou `arrow` (Arrow IPC) : formats colonnes typés qui conservent la
+  hiérarchie des colonnes et l'index horodaté avec son fuseau horaire. Les
+  étapes suivantes ne lisent que les colonnes utiles (l'index pour la
+  couverture, les colonnes nucléaires pour le filtrage), sans analyse de texte.
+  Les fichiers sont lus par projection mémoire (RAW_OUTPUT_MEMORY_MAP).
+
+Les fichiers des trois formats peuvent coexister dans le répertoire de données :
+les lecteurs les prennent tous en compte.
+
+pandas et pyarrow ne sont importés qu'à la lecture (pyarrow pour les seuls
+formats colonnes).
+"""
+import ast
+import os
+
+from zones import files_for_zone, most_recent_file_per_zone
+
+RAW_SUFFIXES = {
+    'csv': '_output.csv',
+    'parquet': '_output.parquet',
+    'arrow': '_output.arrow',
+}
+RAW_OUTPUT_FORMAT = os.getenv('RAW_OUTPUT_FORMAT', 'csv').strip().lower()
+MEMORY_MAP = os.getenv('RAW_OUTPUT_MEMORY_MAP', 'true').lower() in ('1', 'true', 'yes')
+
+if RAW_OUTPUT_FORMAT not in RAW_SUFFIXES:
+    raise ValueError(f"RAW_OUTPUT_FORMAT invalide : {RAW_OUTPUT_FORMAT} (attendu : {', '.join(RAW_SUFFIXES)})")
+
+
+def raw_format(path):
+    """
+    Format d'un fichier brut d'après son suffixe.
+    """
+    for fmt, suffix in RAW_SUFFIXES.items():
+        if path.endswith(suffix):
+            return fmt
+    raise ValueError(f"Fichier brut de format inconnu : {path}")
+
+
+def raw_files_for_zone(directory, zone):
+    """
+    Liste les fichiers bruts de la zone, tous formats confondus.
+    """
+    return [f for suffix in RAW_SUFFIXES.values() for f in files_for_zone(directory, suffix, zone)]
+
+
+def most_recent_raw_file_per_zone(directory, zones=None):
+    """
+    Retourne {zone: chemin} du fichier brut le plus récent de chaque zone, tous formats confondus.
+    """
+    latest = {}
+    for suffix in RAW_SUFFIXES.values():
+        for zone, path in most_recent_file_per_zone(directory, suffix, zones).items():
+            if zone not in latest or os.path.getmtime(path) > os.path.getmtime(latest[zone]):
+                latest[zone] = path
+    return latest
+
+
+def write_raw(df, path_prefix, fmt=RAW_OUTPUT_FORMAT):
+    """
+    Écrit le DataFrame brut (colonnes (unité, type, métrique), index horodaté)
+    dans `path_prefix` suivi du suffixe du format. Retourne le chemin écrit.
+    """
+    path = path_prefix + RAW_SUFFIXES[fmt]
+    if fmt == 'csv':
+        df.to_csv(path)
+    elif fmt == 'parquet':
+        df.to_parquet(path)
+    else:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df)
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return path
+
+
+def _read_columnar(path, columns):
+    # Lecture des seules colonnes demandées (noms Arrow), métadonnées pandas comprises
+    import pyarrow as pa
+    if raw_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=MEMORY_MAP).to_pandas()
+    source = pa.memory_map(path) if MEMORY_MAP else pa.OSFile(path)
+    with source:
+        # Projection mémoire : seules les pages des colonnes sélectionnées sont lues
+        return pa.ipc.open_file(source).read_all().select(columns).to_pandas()
+
+
+def _columnar_schema(path):
+    """
+    Retourne (nom Arrow de l'index, {nom Arrow: (unité, type, métrique)}).
+    """
+    import pyarrow as pa
+    if raw_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(path, memory_map=MEMORY_MAP)
+    else:
+        with pa.OSFile(path) as source:
+            schema = pa.ipc.open_file(source).schema
+    index_column = schema.pandas_metadata['index_columns'][0]
+    # pandas enregistre chaque colonne à plusieurs niveaux sous la forme du tuple en texte
+    columns = {name: ast.literal_eval(name) for name in schema.names if name != index_column}
+    return index_column, columns
+
+
+def read_raw_index(path):
+    """
+    Lit uniquement l'index horodaté d'un fichier brut. L'index d'un fichier
+    CSV est naïf ou porte un décalage horaire ; celui d'un fichier colonnes
+    conserve son fuseau horaire.
+    """
+    if raw_format(path) == 'csv':
+        import pandas as pd
+        return pd.read_csv(path, index_col=0, parse_dates=True, usecols=[0]).index
+    index_column, _ = _columnar_schema(path)
+    return _read_columnar(path, [index_column]).index
+
+
+def read_raw_columns(path, keep):
+    """
+    Lit les colonnes d'un fichier colonnes pour lesquelles `keep(unité, type,
+    métrique)` est vrai. Retourne un DataFrame à colonnes (unité, type,
+    métrique) indexé par l'horodatage (fuseau horaire conservé).
+    """
+    import pandas as pd
+    index_column, columns = _columnar_schema(path)
+    selected = [name for name, levels in columns.items() if keep(*levels)]
+    df = _read_columnar(path, selected + [index_column])
+    df.columns = pd.MultiIndex.from_tuples([columns[name] for name in selected])
+    return df
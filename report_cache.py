@@ -0,0 +1,122 @@
+"""
+Cache des résultats du rapport de production.
+
+`_3_import_csv.py` incrémente un compteur de génération des données (table
+`meta`) à chaque import qui modifie la base. Les sections du rapport calculées
+par `report_queries.fetch_report_data()` sont enregistrées dans la table
+`report_cache` avec la génération courante : tant qu'aucun import n'a modifié
+les données, le rapport est relu depuis le cache par deux recherches de clé
+primaire, sans exécuter les requêtes du rapport.
+"""
+import json
+import logging
+import sqlite3
+from contextlib import nullcontext
+from datetime import datetime
+
+from report_queries import fetch_report_data, format_timestamp
+from zones import DEFAULT_ZONE
+
+GENERATION_KEY = 'data_generation'
+LATEST_KEY = 'latest'                      # Clé as_of du rapport sur les dernières données
+SECTIONS = ('flamanville', 'age', 'report', 'events', 'unavailability')  # Sections retournées par fetch_report_data()
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_cache_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS report_cache (
+        zone TEXT,
+        as_of TEXT,
+        section TEXT,
+        generation INTEGER,
+        payload TEXT,
+        created_at TEXT,
+        PRIMARY KEY (zone, as_of, section)
+    )
+    ''')
+
+
+def get_generation(cursor):
+    """
+    Retourne la génération courante des données (0 si aucun import ne l'a incrémentée).
+    """
+    ensure_cache_tables(cursor)
+    cursor.execute('SELECT value FROM meta WHERE key = ?', (GENERATION_KEY,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def bump_generation(cursor):
+    """
+    Incrémente la génération des données, ce qui invalide le cache du rapport.
+    À appeler dans la transaction qui modifie les données.
+    """
+    ensure_cache_tables(cursor)
+    cursor.execute('''
+    INSERT INTO meta (key, value) VALUES (?, 1)
+    ON CONFLICT(key) DO UPDATE SET value = value + 1
+    ''', (GENERATION_KEY,))
+    return get_generation(cursor)
+
+
+def _cache_key(as_of):
+    return LATEST_KEY if as_of is None else format_timestamp(as_of)
+
+
+def cached_report_data(conn, zone=DEFAULT_ZONE, as_of=None, timer=None):
+    """
+    Équivalent de `fetch_report_data()` servi depuis le cache quand la
+    génération des données n'a pas changé depuis le dernier calcul.
+
+    Args:
+        conn: connexion SQLite (le cache est écrit et validé sur cette connexion).
+        zone, as_of, timer: voir `report_queries.fetch_report_data()`.
+
+    Returns:
+        tuple: voir `report_queries.fetch_report_data()`.
+    """
+    def timed(step):
+        if timer is None:
+            return nullcontext()
+        return timer('report_cache', step=step)
+
+    cursor = conn.cursor()
+    key = _cache_key(as_of)
+    with timed('lookup'):
+        generation = get_generation(cursor)
+        cursor.execute('''
+        SELECT section, payload FROM report_cache
+        WHERE zone = ? AND as_of = ? AND generation = ?
+        ''', (zone, key, generation))
+        cached = {section: json.loads(payload) for section, payload in cursor.fetchall()}
+    if len(cached) == len(SECTIONS):
+        # Les lignes SQL sont relues du JSON sous forme de listes
+        return tuple(value if section == 'flamanville' or value is None else tuple(value)
+                     for section, value in ((section, cached[section]) for section in SECTIONS))
+
+    # Génération modifiée ou rapport jamais calculé : exécution des requêtes
+    with timed('miss'):
+        data = fetch_report_data(cursor, zone=zone, as_of=as_of, timer=timer)
+        created_at = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        try:
+            # Les entrées des générations précédentes ne seront plus jamais servies
+            cursor.execute('DELETE FROM report_cache WHERE generation < ?', (generation,))
+            cursor.executemany('''
+            INSERT OR REPLACE INTO report_cache (zone, as_of, section, generation, payload, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(zone, key, section, generation, json.dumps(value), created_at)
+                  for section, value in zip(SECTIONS, data)])
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            # Base verrouillée ou en lecture seule : le rapport reste valide, sans cache
+            conn.rollback()
+            logger.warning(f"Impossible d'enregistrer le rapport {zone} ({key}) dans le cache : {e}")
+    return data
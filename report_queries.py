@@ -0,0 +1,393 @@
+"""
+Requêtes SQL du rapport de production.
+
+Les requêtes sont regroupées ici pour être partagées entre
+`_4_ProductionReporting_Telegram_bot.py` et les benchmarks
+(`benchmarks/bench_report_queries.py`), sans dépendre du bot Telegram.
+Elles portent sur une zone, passée par le paramètre nommé `:zone`, et décrivent
+l'état du parc à une date donnée, passée par le paramètre nommé `:as_of`
+(rapport « à date », voir `fetch_report_data()`).
+"""
+from contextlib import nullcontext
+from datetime import datetime
+
+from zones import DEFAULT_ZONE
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'  # Format des timestamps de la table production
+LATEST = '9999-12-31T23:59:59'          # Borne :as_of du rapport sur les dernières données
+
+# Dernier timestamp de la zone à la date :as_of, par une recherche d'index
+# par unité plutôt qu'un parcours complet de la table production
+LATEST_TIMESTAMP_QUERY = """
+SELECT MAX((
+    SELECT p.timestamp
+    FROM production p
+    WHERE p.unit_id = u.id
+      AND p.timestamp <= :as_of
+    ORDER BY p.timestamp DESC
+    LIMIT 1
+)) AS latest_date
+FROM units u
+WHERE u.zone = :zone;
+"""
+
+# Valeur de production de FLAMANVILLE 3 à la date :as_of
+FLAMANVILLE_QUERY = """
+SELECT p.value
+FROM production p
+JOIN units u ON p.unit_id = u.id
+WHERE u.zone = 'FR' AND u.name = 'FLAMANVILLE 3'
+  AND p.timestamp <= :as_of
+ORDER BY p.timestamp DESC
+LIMIT 1;
+"""
+
+# Âge moyen, à la date :as_of, des unités < 20% de leur nominal (dernière
+# valeur de chaque unité avant :as_of) et des autres unités de la zone
+AGE_QUERY = """
+WITH latest_prod AS (
+    SELECT
+        u.id,
+        u.installation_date,
+        u.nominal,
+        (SELECT p.value
+         FROM production p
+         WHERE p.unit_id = u.id
+           AND p.timestamp <= :as_of
+         ORDER BY p.timestamp DESC
+         LIMIT 1) AS value
+    FROM units u
+    WHERE u.zone = :zone
+),
+low_production_units AS (
+    SELECT
+        id,
+        installation_date,
+        value,
+        nominal
+    FROM latest_prod
+    WHERE
+        nominal > 0
+        AND value < 0.2 * nominal
+        AND installation_date IS NOT NULL
+)
+SELECT
+    AVG((JULIANDAY(:as_of) - JULIANDAY(u.installation_date)) / 365.25) AS avg_age_low,
+    COUNT(*) AS low_count,
+    (SELECT AVG((JULIANDAY(:as_of) - JULIANDAY(u2.installation_date)) / 365.25)
+     FROM units u2
+     WHERE u2.zone = :zone
+       AND u2.installation_date IS NOT NULL
+       AND u2.id NOT IN (SELECT id FROM low_production_units)) AS avg_age_other,
+    (SELECT COUNT(*)
+     FROM units u2
+     WHERE u2.zone = :zone
+       AND u2.installation_date IS NOT NULL
+       AND u2.id NOT IN (SELECT id FROM low_production_units)) AS other_count
+FROM low_production_units u;
+"""
+
+# Requête complète d'une zone au timestamp :as_of (voir LATEST_TIMESTAMP_QUERY) :
+# facteur de charge, unités < 20% et unités sans données
+REPORT_QUERY = """
+WITH
+    latest_date AS (
+        SELECT :as_of AS max_date
+    ),
+    total_production AS (
+        SELECT SUM(p.value) as total_prod
+        FROM production p
+        JOIN units u ON u.id = p.unit_id
+        WHERE u.zone = :zone
+          AND p.timestamp = (SELECT max_date FROM latest_date)
+    ),
+    total_nominal AS (
+        SELECT SUM(u.nominal) as total_nom
+        FROM units u
+        WHERE u.zone = :zone
+    ),
+    low_production_units AS (
+        SELECT
+            u.id,
+            u.name,
+            p.value,
+            u.nominal,
+            CAST(JULIANDAY((SELECT max_date FROM latest_date)) -
+            JULIANDAY(COALESCE(
+                (SELECT p3.timestamp
+                 FROM production p3
+                 WHERE p3.unit_id = u.id
+                   AND p3.timestamp <= (SELECT max_date FROM latest_date)
+                   AND p3.value >= 0.2 * u.nominal
+                 ORDER BY p3.timestamp DESC
+                 LIMIT 1),
+                (SELECT MIN(timestamp)
+                 FROM production p4
+                 WHERE p4.unit_id = u.id)
+            )) AS REAL) AS days_since_above_20
+        FROM production p
+        JOIN units u ON p.unit_id = u.id
+        WHERE u.zone = :zone
+          AND p.timestamp = (SELECT max_date FROM latest_date)
+          AND p.value < 0.2 * u.nominal
+    ),
+    missing_units AS (
+        SELECT
+            u.id,
+            u.name,
+            (SELECT p2.timestamp
+             FROM production p2
+             WHERE p2.unit_id = u.id
+               AND p2.timestamp <= (SELECT max_date FROM latest_date)
+             ORDER BY p2.timestamp DESC
+             LIMIT 1) AS last_record_date
+        FROM units u
+        WHERE u.zone = :zone
+          AND NOT EXISTS (
+            SELECT 1
+            FROM production p
+            WHERE p.unit_id = u.id
+              -- Même format que les timestamps stockés (datetime() sépare la date par un espace)
+              AND p.timestamp >= strftime('%Y-%m-%dT%H:%M:%S', (SELECT max_date FROM latest_date), '-2 minute')
+              AND p.timestamp <= (SELECT max_date FROM latest_date)
+        )
+    )
+SELECT
+    (SELECT max_date FROM latest_date) AS latest_date,
+    (SELECT total_prod FROM total_production) AS total_production,
+    (SELECT total_nom FROM total_nominal) AS total_nominal,
+    (SELECT COUNT(*) FROM low_production_units) AS low_production_count,
+    (SELECT json_group_array(json_object(
+        'id', id,
+        'name', name,
+        'value', value,
+        'nominal', nominal,
+        'days_since_above_20', days_since_above_20
+    )) FROM low_production_units) AS low_production_list,
+    (SELECT COUNT(*) FROM missing_units) AS missing_units_count,
+    (SELECT json_group_array(json_object('id', id, 'name', name, 'last_record_date', last_record_date))
+     FROM missing_units) AS missing_units_list;
+"""
+
+# Unités < 20% de leur nominal à leur dernier timestamp avant :as_of
+LOW_PRODUCTION_UNITS_QUERY = """
+WITH latest_prod AS (
+    SELECT
+        u.name,
+        u.nominal,
+        (SELECT p.value
+         FROM production p
+         WHERE p.unit_id = u.id
+           AND p.timestamp <= :as_of
+         ORDER BY p.timestamp DESC
+         LIMIT 1) AS value
+    FROM units u
+    WHERE u.zone = :zone
+)
+SELECT
+    name,
+    value,
+    nominal
+FROM latest_prod
+WHERE
+    nominal > 0
+    AND value < 0.2 * nominal
+"""
+
+# Unités < 20% de leur nominal avant :as_of avec leur date d'installation
+LOW_PRODUCTION_AGE_QUERY = """
+WITH latest_prod AS (
+    SELECT
+        u.name,
+        u.installation_date,
+        u.nominal,
+        (SELECT p.value
+         FROM production p
+         WHERE p.unit_id = u.id
+           AND p.timestamp <= :as_of
+         ORDER BY p.timestamp DESC
+         LIMIT 1) AS value
+    FROM units u
+    WHERE u.zone = :zone
+)
+SELECT
+    name,
+    installation_date,
+    value,
+    nominal
+FROM latest_prod
+WHERE
+    nominal > 0
+    AND value < 0.2 * nominal
+    AND installation_date IS NOT NULL
+"""
+
+# Événements détectés par _3b_detect_unit_events.py (voir unit_events.py) en cours
+# pendant les 24 heures précédant :as_of, du plus récent au plus ancien
+RECENT_EVENTS_QUERY = """
+SELECT
+    COUNT(*) AS events_count,
+    json_group_array(json_object(
+        'name', name,
+        'event_type', event_type,
+        'start', start_timestamp,
+        'end', end_timestamp,
+        'value_before', value_before,
+        'value_after', value_after
+    )) AS events_list
+FROM (
+    SELECT u.name, e.event_type, e.start_timestamp, e.end_timestamp, e.value_before, e.value_after
+    FROM unit_events e
+    JOIN units u ON u.id = e.unit_id
+    WHERE u.zone = :zone
+      AND e.end_timestamp > strftime('%Y-%m-%dT%H:%M:%S', :as_of, '-1 day')
+      AND e.start_timestamp <= :as_of
+    ORDER BY e.start_timestamp DESC
+);
+"""
+
+# Avis d'indisponibilité ENTSO-E (voir unit_unavailability.py) en cours à :as_of,
+# dernière révision de chaque avis publiée à :as_of (un rapport rejoué ne voit pas
+# les révisions ultérieures), hors avis annulés ou retirés. Une ligne par
+# unité : l'avis dont le retour prévu est le plus tardif (colonnes nues de MAX())
+UNAVAILABILITY_QUERY = """
+SELECT
+    COUNT(*) AS unavailable_count,
+    json_group_array(json_object(
+        'id', unit_id,
+        'business_type', business_type,
+        'expected_return', expected_return,
+        'avail_qty', avail_qty
+    )) AS unavailable_list
+FROM (
+    SELECT a.unit_id, a.business_type, MAX(a.end_timestamp) AS expected_return, a.avail_qty
+    FROM unit_unavailability a
+    JOIN units u ON u.id = a.unit_id
+    WHERE u.zone = :zone
+      AND a.end_timestamp > :as_of
+      AND a.start_timestamp <= :as_of
+      AND a.created_at <= :as_of
+      AND COALESCE(a.docstatus, '') NOT IN ('Cancelled', 'Withdrawn')
+      AND a.revision = (
+          SELECT MAX(a2.revision) FROM unit_unavailability a2
+          WHERE a2.mrid = a.mrid AND a2.created_at <= :as_of
+      )
+    GROUP BY a.unit_id
+);
+"""
+
+# Requêtes exécutées par generate_production_report(), dans l'ordre
+REPORT_QUERIES = {
+    'latest_timestamp': LATEST_TIMESTAMP_QUERY,
+    'flamanville': FLAMANVILLE_QUERY,
+    'age': AGE_QUERY,
+    'report': REPORT_QUERY,
+    'events': RECENT_EVENTS_QUERY,
+    'unavailability': UNAVAILABILITY_QUERY,
+}
+
+# Index recommandés (création idempotente). L'index couvrant (unit_id, timestamp,
+# value) répond aux recherches par unité sans lire la table ; il remplace
+# idx_production_unit_time, redondant avec la contrainte UNIQUE(unit_id, timestamp).
+INDEX_STATEMENTS = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_production_unit_time_value
+    ON production(unit_id, timestamp, value)
+    """,
+    """
+    DROP INDEX IF EXISTS idx_production_unit_time
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_units_nominal
+    ON units(id, nominal)
+    """,
+]
+
+
+def ensure_indexes(cursor):
+    """
+    Crée les index utilisés par les requêtes du rapport s'ils n'existent pas.
+    """
+    for statement in INDEX_STATEMENTS:
+        cursor.execute(statement)
+
+
+def format_timestamp(value):
+    """
+    Convertit une date (datetime ou chaîne ISO 8601) au format des timestamps
+    stockés ('YYYY-MM-DDTHH:MM:SS', heure locale de Paris sans fuseau).
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def resolve_as_of(cursor, zone=DEFAULT_ZONE, as_of=None):
+    """
+    Retourne le dernier timestamp de production de la zone antérieur ou égal
+    à `as_of` (le dernier timestamp connu si `as_of` vaut None), ou None si
+    la zone n'a aucune donnée.
+    """
+    bound = format_timestamp(as_of) if as_of is not None else LATEST
+    cursor.execute(LATEST_TIMESTAMP_QUERY, {'zone': zone, 'as_of': bound})
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def fetch_report_data(cursor, zone=DEFAULT_ZONE, as_of=None, timer=None):
+    """
+    Exécute les requêtes du rapport d'une zone et retourne les résultats bruts.
+
+    Args:
+        cursor: curseur SQLite.
+        zone: code de la zone (ex. 'FR').
+        as_of: date du rapport (datetime ou chaîne ISO 8601, heure locale de
+            Paris) ; None pour le dernier timestamp connu.
+        timer: fabrique optionnelle de gestionnaires de contexte chronométrant
+            chaque requête (ex. `StageMetrics.timer`).
+
+    Returns:
+        tuple: (flamanville_value, age_result, report_result, events_result,
+        unavailability_result) ; flamanville_value vaut None hors de la zone
+        FR, events_result vaut (0, '[]') si la détection des événements n'a
+        jamais été exécutée, unavailability_result vaut (0, '[]') si aucun
+        avis d'indisponibilité n'a été importé.
+    """
+    def timed(name):
+        if timer is None:
+            return nullcontext()
+        return timer('db_query', query=name)
+
+    with timed('latest_timestamp'):
+        params = {'zone': zone, 'as_of': resolve_as_of(cursor, zone, as_of)}
+
+    flamanville_value = None
+    if zone == 'FR':
+        with timed('flamanville'):
+            cursor.execute(FLAMANVILLE_QUERY, params)
+            flamanville_result = cursor.fetchone()
+        flamanville_value = flamanville_result[0] if flamanville_result else 'N/A'
+
+    with timed('age'):
+        cursor.execute(AGE_QUERY, params)
+        age_result = cursor.fetchone()
+
+    with timed('report'):
+        cursor.execute(REPORT_QUERY, params)
+        report_result = cursor.fetchone()
+
+    events_result = (0, '[]')
+    with timed('events'):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'unit_events'")
+        if cursor.fetchone():
+            cursor.execute(RECENT_EVENTS_QUERY, params)
+            events_result = cursor.fetchone()
+
+    unavailability_result = (0, '[]')
+    with timed('unavailability'):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'unit_unavailability'")
+        if cursor.fetchone():
+            cursor.execute(UNAVAILABILITY_QUERY, params)
+            unavailability_result = cursor.fetchone()
+
+    return flamanville_value, age_result, report_result, events_result, unavailability_result
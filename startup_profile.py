@@ -0,0 +1,58 @@
+"""
+Profil du démarrage à froid des scripts du pipeline (option --profile-startup).
+
+Le script est relancé dans un sous-processus avec `python -X importtime` et
+les mêmes arguments : le cycle s'exécute normalement, puis le coût des imports
+(temps propre cumulé par paquet de premier niveau) est affiché, avec la durée
+totale du processus. Les dépendances lourdes (pandas, entsoe-py, pyarrow,
+NumPy, python-telegram-bot) n'étant importées que par les chemins qui en ont
+besoin, le profil montre ce que coûte réellement le chemin suivi.
+"""
+import os
+import subprocess
+import sys
+import time
+
+PROFILE_OPTION = '--profile-startup'
+TOP_PACKAGES = 15  # Nombre de paquets affichés
+
+
+def parse_importtime(lines):
+    """
+    Agrège les lignes `import time: self [us] | cumulative | package` par
+    paquet de premier niveau. Retourne {paquet: temps propre en secondes}.
+    """
+    packages = {}
+    for line in lines:
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # Ligne d'en-tête
+        package = parts[2].strip().split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(parts[0]) / 1e6
+    return packages
+
+
+def run_profiled(script, argv):
+    """
+    Exécute `script` avec `argv` (sans l'option de profil) sous `-X importtime`,
+    affiche le profil des imports et retourne le code retour du script.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', script] + list(argv),
+                               stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+    importtime = []
+    for line in process.stderr:
+        if line.startswith('import time:'):
+            importtime.append(line)
+        else:
+            sys.stderr.write(line)  # Journaux du script
+    returncode = process.wait()
+    wall = time.perf_counter() - start
+
+    packages = parse_importtime(importtime)
+    total = sum(packages.values())
+    print(f"\nProfil de démarrage de {os.path.basename(script)} : "
+          f"{total * 1000:.0f} ms d'imports ({len(importtime) - 1} modules), {wall * 1000:.0f} ms au total")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:TOP_PACKAGES]:
+        print(f"  {package:<30} {seconds * 1000:8.1f} ms")
+    return returncode
@@ -0,0 +1,67 @@
+"""
+Tests des marques de haute eau (high_water_marks.py).
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from high_water_marks import (FLEET_UNIT_ID, ensure_high_water_marks_table, read_fleet_high_water_mark,  # noqa: E402
+                              update_high_water_mark)
+
+
+class HighWaterMarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.db_path = os.path.join(self.tempdir.name, 'production.db')
+        self.conn = sqlite3.connect(self.db_path)
+        self.addCleanup(self.conn.close)
+        self.cursor = self.conn.cursor()
+        self.cursor.execute('CREATE TABLE units (id INTEGER PRIMARY KEY, zone TEXT, name TEXT)')
+        self.cursor.execute('CREATE TABLE production (id INTEGER PRIMARY KEY, unit_id INTEGER, timestamp TEXT, value REAL)')
+        self.cursor.executemany('INSERT INTO units (id, zone, name) VALUES (?, ?, ?)',
+                                [(1, 'FR', 'CHINON 1'), (2, 'FR', 'CRUAS 1'), (3, 'BE', 'DOEL 1')])
+        self.cursor.executemany('INSERT INTO production (unit_id, timestamp, value) VALUES (?, ?, 900)',
+                                [(1, '2026-01-01T10:00:00'), (2, '2026-01-01T11:00:00'), (3, '2026-01-01T09:00:00')])
+
+    def marks(self):
+        self.cursor.execute('SELECT zone, unit_id, last_timestamp FROM high_water_marks ORDER BY zone')
+        return self.cursor.fetchall()
+
+    def test_table_is_initialised_from_production(self):
+        ensure_high_water_marks_table(self.cursor)
+        self.assertEqual(self.marks(), [('BE', FLEET_UNIT_ID, '2026-01-01T09:00:00'),
+                                        ('FR', FLEET_UNIT_ID, '2026-01-01T11:00:00')])
+
+    def test_mark_never_moves_backwards(self):
+        ensure_high_water_marks_table(self.cursor)
+        update_high_water_mark(self.cursor, 'FR', '2026-01-01T12:00:00')
+        # Réimport d'un fichier plus ancien (mode historique) : la marque reste en place
+        update_high_water_mark(self.cursor, 'FR', '2026-01-01T08:00:00')
+        update_high_water_mark(self.cursor, 'FR', None)
+        self.conn.commit()
+        self.assertEqual(read_fleet_high_water_mark(self.db_path, 'FR'), '2026-01-01T12:00:00')
+
+    def test_unit_marks_of_older_versions_are_removed(self):
+        ensure_high_water_marks_table(self.cursor)
+        self.cursor.execute("INSERT INTO high_water_marks VALUES ('FR', 1, '2026-01-01T10:00:00', NULL)")
+        ensure_high_water_marks_table(self.cursor)
+        self.assertEqual([unit_id for _, unit_id, _ in self.marks()], [FLEET_UNIT_ID, FLEET_UNIT_ID])
+
+    def test_database_without_marks_returns_none(self):
+        self.conn.commit()
+        self.assertIsNone(read_fleet_high_water_mark(self.db_path, 'FR'))
+
+    def test_missing_database_returns_none_without_creating_it(self):
+        missing_path = os.path.join(self.tempdir.name, 'absente.db')
+        self.assertIsNone(read_fleet_high_water_mark(missing_path, 'FR'))
+        self.assertFalse(os.path.exists(missing_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests de la fusion du lot importé dans `production` (_3_import_csv.merge_staging)
+sur une base en mémoire.
+"""
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _3_import_csv import ensure_revisions_table, merge_staging  # noqa: E402
+
+REVISED_AT = '2026-01-02T10:00:00'
+
+
+class MergeStagingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute('''
+        CREATE TABLE production (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unit_id INTEGER,
+            timestamp TEXT,
+            value REAL,
+            UNIQUE(unit_id, timestamp)
+        )
+        ''')
+        ensure_revisions_table(self.cursor)
+        self.cursor.execute('''
+        CREATE TEMP TABLE staging_production (
+            unit_id INTEGER,
+            timestamp TEXT,
+            value REAL,
+            PRIMARY KEY (unit_id, timestamp)
+        ) WITHOUT ROWID
+        ''')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def merge(self, values, revised_at=REVISED_AT):
+        self.cursor.execute('DELETE FROM staging_production')
+        self.cursor.executemany('INSERT INTO staging_production (unit_id, timestamp, value) VALUES (?, ?, ?)', values)
+        return merge_staging(self.cursor, revised_at)
+
+    def production(self):
+        self.cursor.execute('SELECT id, unit_id, timestamp, value FROM production ORDER BY id')
+        return self.cursor.fetchall()
+
+    def revisions(self):
+        self.cursor.execute('''
+        SELECT unit_id, timestamp, revised_at, old_value, new_value FROM production_revisions ORDER BY id
+        ''')
+        return self.cursor.fetchall()
+
+    def test_new_values_are_inserted(self):
+        self.assertEqual(self.merge([(1, '2026-01-01T00:00:00', 900), (2, '2026-01-01T00:00:00', 850)]), (2, 0))
+        self.assertEqual(self.production(), [(1, 1, '2026-01-01T00:00:00', 900), (2, 2, '2026-01-01T00:00:00', 850)])
+        self.assertEqual(self.revisions(), [])
+
+    def test_unchanged_values_are_left_untouched(self):
+        batch = [(1, '2026-01-01T00:00:00', 900), (1, '2026-01-01T00:15:00', 910)]
+        self.merge(batch)
+        changes = self.conn.total_changes
+        self.assertEqual(merge_staging(self.cursor, REVISED_AT), (0, 0))
+        self.assertEqual(self.conn.total_changes, changes)
+        self.assertEqual(self.production(), [(1, 1, '2026-01-01T00:00:00', 900), (2, 1, '2026-01-01T00:15:00', 910)])
+        self.assertEqual(self.revisions(), [])
+        # Aucun id AUTOINCREMENT consommé par les valeurs déjà présentes
+        self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'production'")
+        self.assertEqual(self.cursor.fetchone()[0], 2)
+
+    def test_revised_values_are_updated_and_logged(self):
+        self.merge([(1, '2026-01-01T00:00:00', 900), (1, '2026-01-01T00:15:00', 910)], '2026-01-01T01:00:00')
+        inserted, revised = self.merge([(1, '2026-01-01T00:00:00', 905), (1, '2026-01-01T00:15:00', 910),
+                                        (1, '2026-01-01T00:30:00', 920)])
+        self.assertEqual((inserted, revised), (1, 1))
+        self.assertEqual(self.production(), [(1, 1, '2026-01-01T00:00:00', 905), (2, 1, '2026-01-01T00:15:00', 910),
+                                             (3, 1, '2026-01-01T00:30:00', 920)])
+        self.assertEqual(self.revisions(), [(1, '2026-01-01T00:00:00', REVISED_AT, 900, 905)])
+
+    def test_value_revised_from_missing_is_logged(self):
+        self.merge([(1, '2026-01-01T00:00:00', None)], '2026-01-01T01:00:00')
+        self.assertEqual(self.merge([(1, '2026-01-01T00:00:00', 880)]), (0, 1))
+        self.assertEqual(self.revisions(), [(1, '2026-01-01T00:00:00', REVISED_AT, None, 880)])
+
+    def test_revision_log_without_id_is_migrated(self):
+        self.cursor.execute('DROP TABLE production_revisions')
+        self.cursor.execute('''
+        CREATE TABLE production_revisions (
+            unit_id INTEGER,
+            timestamp TEXT,
+            revised_at TEXT,
+            old_value REAL,
+            new_value REAL,
+            PRIMARY KEY (unit_id, timestamp, revised_at)
+        ) WITHOUT ROWID
+        ''')
+        self.cursor.execute("INSERT INTO production_revisions VALUES (1, '2026-01-01T00:00:00', '2026-01-01T02:00:00', 2, 3)")
+        self.cursor.execute("INSERT INTO production_revisions VALUES (2, '2026-01-01T00:00:00', '2026-01-01T01:00:00', 1, 2)")
+        ensure_revisions_table(self.cursor)
+        self.cursor.execute('SELECT id, unit_id, revised_at FROM production_revisions ORDER BY id')
+        self.assertEqual(self.cursor.fetchall(), [(1, 2, '2026-01-01T01:00:00'), (2, 1, '2026-01-01T02:00:00')])
+
+
+if __name__ == '__main__':
+    unittest.main()
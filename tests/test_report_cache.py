@@ -0,0 +1,76 @@
+"""
+Tests du cache du rapport (report_cache.py) sur une base en mémoire.
+"""
+import os
+import sqlite3
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_cache  # noqa: E402
+from report_cache import SECTIONS, bump_generation, cached_report_data, ensure_cache_tables  # noqa: E402
+
+# Résultat de fetch_report_data() : une valeur par section
+REPORT_DATA = (
+    1290.5,
+    (12.5, 2, 30.1, 54),
+    ('2026-01-01T12:00:00', 52000.0, 61000.0, 2, '[]', 0, '[]'),
+    (0, '[]'),
+    (1, '[{"id": 3}]'),
+)
+
+
+class CachedReportDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        ensure_cache_tables(self.cursor)
+        patcher = mock.patch.object(report_cache, 'fetch_report_data', return_value=REPORT_DATA)
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def cached_generations(self):
+        self.cursor.execute('SELECT DISTINCT generation FROM report_cache ORDER BY generation')
+        return [generation for (generation,) in self.cursor.fetchall()]
+
+    def test_second_report_is_served_from_cache(self):
+        self.assertEqual(cached_report_data(self.conn, zone='FR'), REPORT_DATA)
+        self.assertEqual(cached_report_data(self.conn, zone='FR'), REPORT_DATA)
+        self.assertEqual(self.fetch.call_count, 1)
+        self.cursor.execute('SELECT COUNT(*) FROM report_cache')
+        self.assertEqual(self.cursor.fetchone()[0], len(SECTIONS))
+
+    def test_reports_are_cached_per_zone_and_date(self):
+        cached_report_data(self.conn, zone='FR')
+        cached_report_data(self.conn, zone='BE')
+        cached_report_data(self.conn, zone='FR', as_of='2026-01-01T12:00:00')
+        self.assertEqual(self.fetch.call_count, 3)
+
+    def test_generation_bump_invalidates_cache(self):
+        cached_report_data(self.conn, zone='FR')
+        bump_generation(self.cursor)
+        self.conn.commit()
+        self.assertEqual(cached_report_data(self.conn, zone='FR'), REPORT_DATA)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_older_generations_are_evicted(self):
+        cached_report_data(self.conn, zone='FR')
+        cached_report_data(self.conn, zone='BE')
+        self.assertEqual(self.cached_generations(), [0])
+        generation = bump_generation(self.cursor)
+        self.conn.commit()
+        cached_report_data(self.conn, zone='FR')
+        # Les entrées de la génération précédente, toutes zones confondues, sont supprimées
+        self.assertEqual(self.cached_generations(), [generation])
+        self.cursor.execute('SELECT DISTINCT zone FROM report_cache')
+        self.assertEqual(self.cursor.fetchall(), [('FR',)])
+
+
+if __name__ == '__main__':
+    unittest.main()
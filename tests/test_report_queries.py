@@ -0,0 +1,69 @@
+"""
+Tests de la requête des indisponibilités du rapport (report_queries.py) sur une
+base en mémoire.
+"""
+import json
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_queries import UNAVAILABILITY_QUERY  # noqa: E402
+from unit_unavailability import ensure_unavailability_table  # noqa: E402
+
+
+class UnavailabilityQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute('CREATE TABLE units (id INTEGER PRIMARY KEY, zone TEXT, name TEXT)')
+        self.cursor.executemany('INSERT INTO units (id, zone, name) VALUES (?, ?, ?)',
+                                [(1, 'FR', 'CHINON 1'), (2, 'FR', 'CRUAS 1'), (3, 'BE', 'DOEL 1')])
+        ensure_unavailability_table(self.cursor)
+        # CHINON 1 : arrêt annoncé jusqu'au 10, prolongé jusqu'au 20 par une révision publiée le 8
+        self.notice('m1', 1, 1, '2025-12-20T00:00:00', '2026-01-10T00:00:00', '2025-12-20T09:00:00')
+        self.notice('m1', 2, 1, '2025-12-20T00:00:00', '2026-01-20T00:00:00', '2026-01-08T09:00:00')
+        # CRUAS 1 : arrêt annulé par sa deuxième révision
+        self.notice('m2', 1, 2, '2026-01-01T00:00:00', '2026-01-15T00:00:00', '2025-12-28T09:00:00')
+        self.notice('m2', 2, 2, '2026-01-01T00:00:00', '2026-01-15T00:00:00', '2026-01-06T09:00:00', 'Cancelled')
+        # Unité d'une autre zone
+        self.notice('m3', 1, 3, '2025-12-20T00:00:00', '2026-01-31T00:00:00', '2025-12-20T09:00:00')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def notice(self, mrid, revision, unit_id, start, end, created_at, docstatus=None):
+        self.cursor.execute('''
+        INSERT INTO unit_unavailability (mrid, revision, unit_id, business_type, docstatus,
+                                         start_timestamp, end_timestamp, avail_qty, nominal_power, created_at)
+        VALUES (?, ?, ?, 'A53', ?, ?, ?, 0, 900, ?)
+        ''', (mrid, revision, unit_id, docstatus, start, end, created_at))
+
+    def unavailable(self, as_of, zone='FR'):
+        self.cursor.execute(UNAVAILABILITY_QUERY, {'zone': zone, 'as_of': as_of})
+        count, unavailable_list = self.cursor.fetchone()
+        units = {unit['id']: unit['expected_return'] for unit in json.loads(unavailable_list)}
+        self.assertEqual(count, len(units))
+        return units
+
+    def test_revision_published_before_as_of_is_used(self):
+        self.assertEqual(self.unavailable('2026-01-09T00:00:00'), {1: '2026-01-20T00:00:00'})
+
+    def test_revision_published_after_as_of_is_ignored(self):
+        self.assertEqual(self.unavailable('2026-01-05T06:00:00'),
+                         {1: '2026-01-10T00:00:00', 2: '2026-01-15T00:00:00'})
+
+    def test_revision_published_in_the_same_second_is_used(self):
+        self.assertEqual(self.unavailable('2026-01-08T09:00:00'), {1: '2026-01-20T00:00:00'})
+
+    def test_notice_published_after_as_of_is_ignored(self):
+        self.assertEqual(self.unavailable('2025-12-31T00:00:00', zone='BE'), {3: '2026-01-31T00:00:00'})
+        self.assertEqual(self.unavailable('2025-12-31T00:00:00'), {1: '2026-01-10T00:00:00'})
+        self.assertEqual(self.unavailable('2025-12-19T00:00:00'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
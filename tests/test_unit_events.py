@@ -0,0 +1,129 @@
+"""
+Tests de la détection des événements (unit_events.py) sur une base en mémoire.
+"""
+import os
+import sqlite3
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unit_events import FLATLINE_MIN_STEPS, ensure_events_tables, latest_marks, process_unit  # noqa: E402
+
+UNIT_ID = 1
+NOMINAL = 1000.0
+LOW_THRESHOLD = 200.0
+START = datetime(2026, 1, 1)
+
+
+def timestamp(step):
+    return (START + timedelta(minutes=15 * step)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class ProcessUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute('''
+        CREATE TABLE production (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unit_id INTEGER,
+            timestamp TEXT,
+            value REAL,
+            UNIQUE(unit_id, timestamp)
+        )
+        ''')
+        self.cursor.execute('''
+        CREATE TABLE production_revisions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unit_id INTEGER,
+            timestamp TEXT,
+            revised_at TEXT,
+            old_value REAL,
+            new_value REAL,
+            UNIQUE(unit_id, timestamp, revised_at)
+        )
+        ''')
+        ensure_events_tables(self.cursor)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def insert(self, steps, value):
+        self.cursor.executemany('INSERT INTO production (unit_id, timestamp, value) VALUES (?, ?, ?)',
+                                [(UNIT_ID, timestamp(step), value) for step in steps])
+
+    def revise(self, step, value, revised_at):
+        self.cursor.execute('''
+        INSERT INTO production_revisions (unit_id, timestamp, revised_at, old_value, new_value)
+        SELECT unit_id, timestamp, ?, value, ? FROM production WHERE unit_id = ? AND timestamp = ?
+        ''', (revised_at, value, UNIT_ID, timestamp(step)))
+        self.cursor.execute('UPDATE production SET value = ? WHERE unit_id = ? AND timestamp = ?',
+                            (value, UNIT_ID, timestamp(step)))
+
+    def process(self, detected_at):
+        production_id, revision_id = latest_marks(self.cursor)
+        return process_unit(self.cursor, UNIT_ID, NOMINAL, LOW_THRESHOLD, detected_at, production_id, revision_id)
+
+    def events(self):
+        self.cursor.execute('''
+        SELECT event_type, start_timestamp, end_timestamp FROM unit_events
+        WHERE unit_id = ? ORDER BY start_timestamp, event_type
+        ''', (UNIT_ID,))
+        return self.cursor.fetchall()
+
+    def test_new_rows_are_analysed_incrementally(self):
+        self.insert(range(0, 10), 900)
+        self.process('2026-01-02T00:00:00')
+        self.insert(range(10, 20), 900)
+        points, _, restarted = self.process('2026-01-02T01:00:00')
+        self.assertEqual((points, restarted), (10, False))
+        self.assertEqual(self.events(), [('flatline', timestamp(0), timestamp(19))])
+
+    def test_gap_filled_behind_last_point_is_analysed(self):
+        # Trou de 5 pas : les deux plateaux, trop courts, ne sont pas des événements
+        self.insert(range(0, 8), 900)
+        self.insert(range(13, 21), 900)
+        self.process('2026-01-02T00:00:00')
+        self.assertEqual(self.events(), [])
+
+        # Le mode historique comble le trou avec un déclenchement
+        self.insert(range(8, 13), 100)
+        _, _, restarted = self.process('2026-01-02T01:00:00')
+        self.assertTrue(restarted)
+        self.assertEqual(self.events(), [('trip', timestamp(7), timestamp(8)),
+                                         ('ramp_up', timestamp(12), timestamp(13))])
+
+    def test_revision_behind_last_point_updates_events(self):
+        steps = 2 * FLATLINE_MIN_STEPS
+        self.insert(range(0, steps), 900)
+        self.process('2026-01-02T00:00:00')
+        self.assertEqual(self.events(), [('flatline', timestamp(0), timestamp(steps - 1))])
+
+        # Valeur révisée au milieu du plateau : le plateau est coupé en deux, trop courts
+        self.revise(FLATLINE_MIN_STEPS, 850, '2026-01-02T00:30:00')
+        points, _, restarted = self.process('2026-01-02T01:00:00')
+        self.assertTrue(restarted)
+        self.assertEqual(points, steps)
+        self.assertEqual(self.events(), [])
+
+        # Révision déjà analysée : seules les nouvelles lignes sont lues
+        self.insert([steps], 900)
+        points, _, restarted = self.process('2026-01-02T02:00:00')
+        self.assertEqual((points, restarted), (1, False))
+
+    def test_revision_logged_in_the_same_second_is_analysed(self):
+        self.insert(range(0, 4), 900)
+        self.process('2026-01-02T00:00:00')
+
+        # Révision du dernier point analysé, journalisée dans la seconde où l'analyse démarre
+        self.revise(3, 100, '2026-01-02T01:00:00')
+        _, _, restarted = self.process('2026-01-02T01:00:00')
+        self.assertTrue(restarted)
+        self.assertEqual(self.events(), [('trip', timestamp(2), timestamp(3))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests du référentiel des unités (unit_registry.py) sur une base en mémoire.
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unit_registry import UnitRegistry, ensure_metadata_columns, load_reference  # noqa: E402
+
+REFERENCE = {
+    'version': 'test',
+    'units': [
+        {'zone': 'FR', 'name': 'CHINON 1', 'site': 'CHINON', 'reactor_type': 'CP2', 'nominal_mw': 905,
+         'commissioning_date': '1982-11-30', 'aliases': ['CHINON B1']},
+        {'zone': 'FR', 'name': 'CRUAS 1', 'site': 'CRUAS', 'reactor_type': 'CP2', 'nominal_mw': 915,
+         'commissioning_date': '1983-04-29'},
+    ],
+}
+
+
+class LoadReferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.reference_path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            json.dump(REFERENCE, f)
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        # Schéma d'une base antérieure au référentiel : unités sous leur nom ENTSO-E
+        self.cursor.execute('''
+        CREATE TABLE units (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            zone TEXT NOT NULL DEFAULT 'FR',
+            name TEXT,
+            location TEXT,
+            production_type TEXT,
+            installation_date TEXT,
+            characteristics TEXT,
+            nominal REAL,
+            UNIQUE(zone, name)
+        )
+        ''')
+        self.cursor.execute('''
+        CREATE TABLE production (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unit_id INTEGER,
+            timestamp TEXT,
+            value REAL,
+            UNIQUE(unit_id, timestamp)
+        )
+        ''')
+        self.cursor.execute('''
+        INSERT INTO units (zone, name, location, production_type, installation_date, characteristics, nominal)
+        VALUES ('FR', 'CHINON B1', 'Unknown', 'Nuclear', '2023-01-01', '{}', 900)
+        ''')
+        self.legacy_id = self.cursor.lastrowid
+        self.cursor.execute("INSERT INTO production (unit_id, timestamp, value) VALUES (?, '2025-01-01T00:00:00', 880)",
+                            (self.legacy_id,))
+        ensure_metadata_columns(self.cursor)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.reference_path)
+
+    def units(self):
+        self.cursor.execute('SELECT id, name, nominal, installation_date FROM units ORDER BY id')
+        return self.cursor.fetchall()
+
+    def test_alias_named_legacy_unit_is_updated_not_duplicated(self):
+        load_reference(self.cursor, self.reference_path)
+        units = self.units()
+        self.assertEqual(units[0], (self.legacy_id, 'CHINON B1', 905, '1982-11-30'))
+        self.assertEqual([name for _, name, _, _ in units], ['CHINON B1', 'CRUAS 1'])
+
+    def test_reload_is_idempotent(self):
+        load_reference(self.cursor, self.reference_path)
+        changes = self.conn.total_changes
+        load_reference(self.cursor, self.reference_path)
+        self.assertEqual(self.conn.total_changes, changes)
+
+    def test_duplicate_without_production_is_removed(self):
+        # Doublon inséré sous le nom de référence par une version antérieure du chargement
+        self.cursor.execute("INSERT INTO units (zone, name, nominal) VALUES ('FR', 'CHINON 1', 905)")
+        load_reference(self.cursor, self.reference_path)
+        units = self.units()
+        self.assertEqual([unit_id for unit_id, name, _, _ in units if name.startswith('CHINON')], [self.legacy_id])
+        self.assertEqual(units[0][2:], (905, '1982-11-30'))
+
+    def test_registry_resolves_reference_name_and_alias_to_legacy_unit(self):
+        load_reference(self.cursor, self.reference_path)
+        registry = UnitRegistry(self.cursor, 'FR', self.reference_path)
+        self.assertEqual(registry.resolve(['CHINON B1', 'CHINON 1']),
+                         {'CHINON B1': self.legacy_id, 'CHINON 1': self.legacy_id})
+        self.assertEqual(registry.created, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,293 @@
+"""
+Détection des événements de production par unité.
+
+Analyse vectorisée (NumPy) de la série de chaque unité dans la table
+`production` pour repérer :
+
+- les déclenchements (`trip`) : passage en un pas de plus de TRIP_FROM_RATIO du
+  nominal à moins du seuil de production faible ;
+- les variations rapides (`ramp_up`, `ramp_down`) : variation d'au moins
+  RAMP_RATIO_PER_HOUR du nominal par heure, les pas consécutifs de même sens
+  étant regroupés en un seul événement ;
+- les données figées (`flatline`) : valeur strictement identique pendant au
+  moins FLATLINE_MIN_STEPS pas consécutifs, hors arrêt (valeur supérieure au
+  seuil de production faible).
+
+Seules les lignes postérieures au dernier timestamp analysé sont lues : l'état
+de chaque unité (dernier point, plateau et variation en cours) est conservé dans la table
+`unit_event_state` d'une exécution à l'autre. Les lignes antérieures à ce
+timestamp touchées par un import (trou comblé en mode historique, valeur révisée
+par ENTSO-E) sont repérées par les plus grands id de `production` et de
+`production_revisions` déjà analysés : l'analyse reprend
+alors avant le plateau ou l'événement en cours au premier point modifié. Les
+événements sont écrits dans la table indexée `unit_events`, citée par le
+rapport Telegram. NumPy n'est importé que si de nouveaux points sont à analyser.
+"""
+import os
+import sqlite3
+
+FLATLINE_MIN_STEPS = int(os.getenv('EVENTS_FLATLINE_MIN_STEPS', '12'))            # 12 pas de 15 min : 3 h
+RAMP_RATIO_PER_HOUR = float(os.getenv('EVENTS_RAMP_RATIO_PER_HOUR', '1.0'))       # Fraction du nominal par heure
+TRIP_FROM_RATIO = float(os.getenv('EVENTS_TRIP_FROM_RATIO', '0.5'))               # Production avant déclenchement
+MAX_STEP_MINUTES = 60  # Au-delà, deux points consécutifs sont séparés par un trou de données
+
+
+def ensure_events_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS unit_event_state (
+        unit_id INTEGER PRIMARY KEY,
+        last_timestamp TEXT,
+        last_value REAL,
+        flat_since TEXT,          -- Début du plateau en cours au dernier point (NULL si aucun)
+        flat_steps INTEGER,       -- Nombre de pas du plateau en cours
+        ramp_type TEXT,           -- Variation rapide en cours au dernier point (NULL si aucune)
+        ramp_since TEXT,
+        ramp_from REAL,           -- Valeur au début de la variation en cours
+        production_id INTEGER,    -- Plus grand id de `production` analysé
+        revision_id INTEGER       -- Plus grand id de `production_revisions` analysé
+    )
+    ''')
+    # Table créée avant le suivi des lignes importées après coup
+    existing = {c[1] for c in cursor.execute('PRAGMA table_info(unit_event_state)').fetchall()}
+    for column, column_type in (('production_id', 'INTEGER'), ('revision_id', 'INTEGER')):
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE unit_event_state ADD COLUMN {column} {column_type}')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS unit_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unit_id INTEGER,
+        event_type TEXT,
+        start_timestamp TEXT,
+        end_timestamp TEXT,
+        value_before REAL,
+        value_after REAL,
+        magnitude REAL,           -- Variation en MW (trip, ramp) ou nombre de pas (flatline)
+        detected_at TEXT,
+        UNIQUE(unit_id, event_type, start_timestamp)
+    )
+    ''')
+    # Événements en cours ou terminés après une date (rapport)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_unit_events_end ON unit_events(end_timestamp)')
+
+
+def _runs(mask):
+    """
+    Retourne les tableaux (débuts, fins) des suites consécutives de True de
+    `mask` (fins exclues).
+    """
+    import numpy as np
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return edges[::2], edges[1::2]
+
+
+def detect_events(timestamps, values, nominal, low_threshold, state=None):
+    """
+    Détecte les événements d'une unité sur ses nouveaux points.
+
+    Args:
+        timestamps (list[str]): timestamps des nouveaux points, triés.
+        values (list[float]): valeurs correspondantes (MW).
+        nominal (float): puissance nominale de l'unité (MW).
+        low_threshold (float): seuil de production faible de l'unité (MW).
+        state (tuple|None): (last_timestamp, last_value, flat_since, flat_steps,
+            ramp_type, ramp_since, ramp_from) de l'exécution précédente.
+
+    Returns:
+        tuple: (événements, nouvel état). Chaque événement est un tuple
+        (event_type, start, end, value_before, value_after, magnitude).
+    """
+    import numpy as np
+    flat_since, flat_steps = None, 0
+    ramp_type, ramp_since, ramp_from = None, None, None
+    if state is not None:
+        last_timestamp, last_value, flat_since, flat_steps, ramp_type, ramp_since, ramp_from = state
+        timestamps = [last_timestamp] + list(timestamps)
+        values = [last_value] + list(values)
+        flat_steps = flat_steps or 0
+    ts = np.array(timestamps, dtype='datetime64[s]')
+    v = np.asarray(values, dtype=float)
+    events = []
+    if len(v) < 2:
+        return events, (timestamps[-1], float(v[-1]), flat_since, flat_steps, ramp_type, ramp_since, ramp_from)
+
+    # Pas i : du point i au point i + 1
+    step_minutes = np.diff(ts).astype(np.int64) / 60.0
+    dv = np.diff(v)
+    contiguous = step_minutes <= MAX_STEP_MINUTES
+
+    trip = contiguous & (v[:-1] >= TRIP_FROM_RATIO * nominal) & (v[1:] < low_threshold)
+    for i in np.flatnonzero(trip):
+        events.append(('trip', timestamps[i], timestamps[i + 1], v[i], v[i + 1], dv[i]))
+
+    # Variations : la première peut prolonger celle de l'exécution précédente
+    fast = contiguous & ~trip & (np.abs(dv) >= RAMP_RATIO_PER_HOUR * nominal * step_minutes / 60.0)
+    new_ramp = (None, None, None)
+    for event_type, mask in (('ramp_up', fast & (dv > 0)), ('ramp_down', fast & (dv < 0))):
+        starts, ends = _runs(mask)
+        for start, end in zip(starts, ends):
+            since, value_from = timestamps[start], v[start]
+            if start == 0 and ramp_type == event_type:
+                since, value_from = ramp_since, ramp_from
+            events.append((event_type, since, timestamps[end], value_from, v[end], v[end] - value_from))
+            if end == len(mask):
+                new_ramp = (event_type, since, float(value_from))
+
+    # Plateaux : le premier peut prolonger celui de l'exécution précédente (pas 0 depuis le dernier point)
+    flat = contiguous & (dv == 0) & (v[1:] >= low_threshold)
+    starts, ends = _runs(flat)
+    new_flat_since, new_flat_steps = None, 0
+    for start, end in zip(starts, ends):
+        steps = end - start
+        since = timestamps[start]
+        if start == 0 and flat_since is not None:
+            steps += flat_steps
+            since = flat_since
+        if steps >= FLATLINE_MIN_STEPS:
+            events.append(('flatline', since, timestamps[end], v[start], v[end], steps))
+        if end == len(flat):
+            new_flat_since, new_flat_steps = since, int(steps)
+
+    new_state = (timestamps[-1], float(v[-1]), new_flat_since, new_flat_steps, *new_ramp)
+    return events, new_state
+
+
+def latest_marks(cursor):
+    """
+    Plus grands id de `production` et de `production_revisions`. Celui des
+    révisions est None tant que l'import n'a pas ajouté l'id au journal : les
+    révisions ne sont alors pas suivies pendant cette exécution.
+    """
+    production_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM production').fetchone()[0]
+    try:
+        revision_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM production_revisions').fetchone()[0]
+    except sqlite3.OperationalError:
+        revision_id = None
+    return production_id, revision_id
+
+
+def _changed_from(cursor, unit_id, last_timestamp, marks, last_marks):
+    """
+    Premier timestamp, au plus tard `last_timestamp`, d'une ligne insérée ou
+    révisée depuis la dernière analyse ; None si aucune. Les lignes concernées
+    sont celles dont l'id, dans `production` puis dans `production_revisions`,
+    est compris entre `last_marks` et `marks`.
+    """
+    changed = []
+    for table, last_id, max_id in zip(('production', 'production_revisions'), last_marks, marks):
+        if max_id is None:
+            continue
+        # Parcours des seuls ids nouveaux (clé primaire) plutôt que de l'index (unit_id, timestamp)
+        cursor.execute(f'''
+        SELECT MIN(timestamp) FROM {table}
+        WHERE id > ? AND id <= ? AND +unit_id = ? AND timestamp <= ?
+        ''', (last_id, max_id, unit_id, last_timestamp))
+        changed.append(cursor.fetchone()[0])
+    return min(filter(None, changed), default=None)
+
+
+def _restart_timestamp(cursor, unit_id, changed_from):
+    """
+    Point de reprise de l'analyse d'une unité dont la série a changé à partir
+    de `changed_from` : FLATLINE_MIN_STEPS points plus tôt (plateau en cours,
+    pas encore enregistré), puis au début des événements en cours à ce point.
+    """
+    cursor.execute('''
+    SELECT MIN(timestamp) FROM (
+        SELECT timestamp FROM production
+        WHERE unit_id = ? AND timestamp < ?
+        ORDER BY timestamp DESC LIMIT ?
+    )
+    ''', (unit_id, changed_from, FLATLINE_MIN_STEPS))
+    restart = cursor.fetchone()[0] or changed_from
+    while True:
+        cursor.execute('''
+        SELECT MIN(start_timestamp) FROM unit_events
+        WHERE unit_id = ? AND start_timestamp < ? AND end_timestamp > ?
+        ''', (unit_id, restart, restart))
+        start = cursor.fetchone()[0]
+        if start is None:
+            return restart
+        restart = start
+
+
+def process_unit(cursor, unit_id, nominal, low_threshold, detected_at, production_id, revision_id):
+    """
+    Analyse les nouveaux points d'une unité, enregistre ses événements et son état.
+
+    Si des lignes antérieures au dernier point analysé ont été insérées ou
+    révisées, l'analyse reprend sans état à partir de `_restart_timestamp()`
+    jusqu'au dernier point, et les événements qui n'y sont plus détectés sont supprimés.
+
+    Args:
+        production_id (int): plus grand id de la table `production` à l'ouverture de l'analyse.
+        revision_id (int): plus grand id de la table `production_revisions` à l'ouverture de l'analyse.
+
+    Returns:
+        tuple: (nombre de points lus, nombre d'événements enregistrés, reprise de l'analyse).
+    """
+    cursor.execute('''
+    SELECT last_timestamp, last_value, flat_since, flat_steps, ramp_type, ramp_since, ramp_from,
+           production_id, revision_id
+    FROM unit_event_state WHERE unit_id = ?
+    ''', (unit_id,))
+    row = cursor.fetchone()
+    state = row[:7] if row else None
+    restart = None
+    if row:
+        # État enregistré avant le suivi des lignes importées après coup : suivi à partir de maintenant
+        marks = (production_id, revision_id)
+        last_marks = tuple(mark if last is None else last for mark, last in zip(marks, row[7:]))
+        changed_from = _changed_from(cursor, unit_id, state[0], marks, last_marks)
+        if changed_from is not None:
+            restart = _restart_timestamp(cursor, unit_id, changed_from)
+
+    if restart is None:
+        cursor.execute('''
+        SELECT timestamp, value FROM production
+        WHERE unit_id = ? AND timestamp > ?
+        ORDER BY timestamp
+        ''', (unit_id, state[0] if state else ''))
+    else:
+        state = None
+        cursor.execute('''
+        SELECT timestamp, value FROM production
+        WHERE unit_id = ? AND timestamp >= ?
+        ORDER BY timestamp
+        ''', (unit_id, restart))
+    rows = cursor.fetchall()
+    if not rows:
+        if row and tuple(row[7:]) != (production_id, revision_id):
+            cursor.execute('UPDATE unit_event_state SET production_id = ?, revision_id = ? WHERE unit_id = ?',
+                           (production_id, revision_id, unit_id))
+        return 0, 0, False
+
+    timestamps, values = zip(*rows)
+    events, new_state = detect_events(timestamps, values, nominal, low_threshold, state)
+    if restart is not None:
+        # Événements de la période réanalysée qui ne sont plus détectés (valeurs révisées)
+        detected = {(event_type, start) for event_type, start, *_ in events}
+        cursor.execute('''
+        SELECT id, event_type, start_timestamp FROM unit_events
+        WHERE unit_id = ? AND start_timestamp >= ?
+        ''', (unit_id, restart))
+        cursor.executemany('DELETE FROM unit_events WHERE id = ?',
+                           [(event_id,) for event_id, event_type, start in cursor.fetchall()
+                            if (event_type, start) not in detected])
+    # Un plateau ou une variation prolongés mettent à jour la fin de l'événement déjà enregistré
+    cursor.executemany('''
+    INSERT INTO unit_events (unit_id, event_type, start_timestamp, end_timestamp,
+                             value_before, value_after, magnitude, detected_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(unit_id, event_type, start_timestamp) DO UPDATE SET
+        end_timestamp = excluded.end_timestamp,
+        value_before = excluded.value_before,
+        value_after = excluded.value_after,
+        magnitude = excluded.magnitude
+    ''', [(unit_id, event_type, start, end, float(before), float(after), float(magnitude), detected_at)
+          for event_type, start, end, before, after, magnitude in events])
+    cursor.execute('''
+    INSERT OR REPLACE INTO unit_event_state (unit_id, last_timestamp, last_value, flat_since, flat_steps,
+                                             ramp_type, ramp_since, ramp_from, production_id, revision_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (unit_id, *new_state, production_id, revision_id))
+    return len(rows), len(events), restart is not None
@@ -0,0 +1,245 @@
+"""
+Référentiel des unités de production.
+
+Charge en masse les métadonnées des unités (puissance nominale, date de mise en
+service, site, palier) depuis le fichier de référence versionné
+`units_reference.json`, et résout les noms de colonnes des fichiers ENTSO-E en
+identifiants de la table `units` à partir d'une correspondance chargée une
+seule fois par exécution. Les noms inconnus (unités renommées par ENTSO-E) sont
+rapprochés des unités existantes par leur nom normalisé puis par similarité.
+"""
+import difflib
+import json
+import logging
+import os
+import re
+import sqlite3
+import unicodedata
+
+from zones import DEFAULT_ZONE
+
+REFERENCE_FILE = os.getenv('UNITS_REFERENCE_FILE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), 'units_reference.json'))
+LOW_PRODUCTION_RATIO = 0.2  # Seuil de production faible, en fraction du nominal
+FUZZY_CUTOFF = 0.8          # Similarité minimale (difflib) pour rapprocher deux noms
+
+# Colonnes de métadonnées ajoutées à la table `units` (nom -> type)
+METADATA_COLUMNS = {
+    'nominal': 'REAL',
+    'reactor_type': 'TEXT',
+    'reference_version': 'TEXT',
+}
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_name(name):
+    """
+    Forme canonique d'un nom d'unité : majuscules sans accents, ponctuation
+    remplacée par des espaces, « SAINT » abrégé en « ST ».
+    """
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').upper()
+    name = re.sub(r'[^A-Z0-9]+', ' ', name).strip()
+    return re.sub(r'\bSAINT\b', 'ST', name)
+
+
+def _unit_number(name):
+    # Numéro de tranche en fin de nom (ex. 'CHINON B1' -> '1'), None pour les sites à une tranche
+    match = re.search(r'(\d+)$', name)
+    return match.group(1) if match else None
+
+
+def ensure_metadata_columns(cursor):
+    """
+    Ajoute à la table `units` les colonnes de métadonnées absentes.
+    """
+    existing = {c[1] for c in cursor.execute('PRAGMA table_info(units)').fetchall()}
+    for column, column_type in METADATA_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE units ADD COLUMN {column} {column_type}')
+
+
+def read_reference(path=REFERENCE_FILE):
+    """
+    Lit le fichier de référence et retourne (version, liste des unités).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reference = json.load(f)
+    return reference['version'], reference['units']
+
+
+def _reference_names(unit):
+    # Noms sous lesquels une unité du référentiel peut figurer en base : nom de référence et alias
+    return {normalize_name(name) for name in [unit['name']] + unit.get('aliases', [])}
+
+
+def _has_production(cursor, unit_id):
+    try:
+        cursor.execute('SELECT 1 FROM production WHERE unit_id = ? LIMIT 1', (unit_id,))
+    except sqlite3.OperationalError:
+        return False  # Table `production` pas encore créée
+    return cursor.fetchone() is not None
+
+
+def _merge_duplicates(cursor, zone, name, kept_id, duplicate_ids):
+    """
+    Supprime les doublons sans données de production d'une unité du
+    référentiel (insérés sous le nom de référence à côté d'une unité enregistrée
+    sous son nom ENTSO-E) ; leurs avis d'indisponibilité sont rattachés à l'unité conservée.
+    """
+    for unit_id in duplicate_ids:
+        if _has_production(cursor, unit_id):
+            logger.warning(f"[{zone}] Unités {kept_id} et {unit_id} rattachées à '{name}' du référentiel, "
+                           f"toutes deux avec des données : fusion à faire manuellement")
+            continue
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'unit_unavailability'")
+        if cursor.fetchone():
+            cursor.execute('UPDATE OR IGNORE unit_unavailability SET unit_id = ? WHERE unit_id = ?', (kept_id, unit_id))
+            cursor.execute('DELETE FROM unit_unavailability WHERE unit_id = ?', (unit_id,))
+        cursor.execute('DELETE FROM units WHERE id = ?', (unit_id,))
+        logger.warning(f"[{zone}] Doublon sans données de '{name}' supprimé (id {unit_id}, unité conservée : {kept_id})")
+
+
+def load_reference(cursor, path=REFERENCE_FILE):
+    """
+    Charge en masse les unités du fichier de référence : insertion des unités
+    absentes et mise à jour des seules unités dont les métadonnées ont changé
+    (les autres ne comptent donc pas comme une modification des données).
+
+    Les unités existantes sont reconnues par leur nom normalisé ou par un alias
+    du référentiel, comme dans `UnitRegistry` : une unité enregistrée sous son
+    nom ENTSO-E (ex. 'CHINON B1') est mise à jour sans être renommée ni dupliquée.
+
+    Returns:
+        str: version du fichier de référence.
+    """
+    version, units = read_reference(path)
+    cursor.execute('SELECT id, zone, name, location, installation_date, nominal, reactor_type FROM units ORDER BY id')
+    existing = {}  # (zone, nom normalisé) -> [(id, nom, métadonnées)]
+    for unit_id, zone, name, *metadata in cursor.fetchall():
+        existing.setdefault((zone, normalize_name(name)), []).append((unit_id, name, metadata))
+
+    to_insert = []
+    to_update = []
+    for u in units:
+        zone = u.get('zone', DEFAULT_ZONE)
+        metadata = [u['site'], u['commissioning_date'], u['nominal_mw'], u['reactor_type']]
+        matches = [row for normalized in sorted(_reference_names(u)) for row in existing.get((zone, normalized), [])]
+        if not matches:
+            to_insert.append((zone, u['name'], *metadata, version))
+            continue
+        if len(matches) > 1:
+            # Unité conservée : celle qui a des données, de préférence sous le nom de référence
+            matches.sort(key=lambda row: (not _has_production(cursor, row[0]), row[1] != u['name'], row[0]))
+            _merge_duplicates(cursor, zone, u['name'], matches[0][0], [row[0] for row in matches[1:]])
+        kept_id, _, kept_metadata = matches[0]
+        if kept_metadata != metadata:
+            to_update.append((*metadata, version, kept_id))
+
+    cursor.executemany('''
+    INSERT INTO units (zone, name, location, installation_date, nominal, reactor_type, reference_version,
+                       production_type, characteristics)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 'Nuclear', '{}')
+    ''', to_insert)
+    cursor.executemany('''
+    UPDATE units
+    SET location = ?, installation_date = ?, nominal = ?, reactor_type = ?, reference_version = ?,
+        production_type = 'Nuclear'
+    WHERE id = ?
+    ''', to_update)
+    if to_insert or to_update:
+        logger.info(f"Référentiel {version} : {len(to_insert)} unités ajoutées, {len(to_update)} mises à jour")
+    return version
+
+
+class UnitRegistry:
+    """
+    Correspondance nom -> id des unités d'une zone, chargée en une requête.
+
+    `nominals` donne la puissance nominale de chaque unité (None si inconnue) et
+    `low_thresholds`, pour chaque unité de puissance nominale connue, le seuil
+    de production faible en MW (LOW_PRODUCTION_RATIO x nominal).
+    """
+
+    def __init__(self, cursor, zone=DEFAULT_ZONE, reference_path=REFERENCE_FILE):
+        self.cursor = cursor
+        self.zone = zone
+        self.created = []   # Unités insérées pendant l'exécution
+        self.renamed = {}   # Nom reçu -> nom en base, rapprochés par similarité
+        self._ids = {}      # Nom normalisé (ou alias) -> id
+        self._names = {}    # id -> nom en base
+        self.nominals = {}
+        self.low_thresholds = {}
+
+        cursor.execute('SELECT id, name, nominal FROM units WHERE zone = ?', (zone,))
+        for unit_id, name, nominal in cursor.fetchall():
+            self._add(unit_id, name, nominal)
+        try:
+            _, units = read_reference(reference_path)
+        except FileNotFoundError:
+            units = []
+        for unit in units:
+            if unit.get('zone', DEFAULT_ZONE) != zone:
+                continue
+            # Unité enregistrée sous son nom de référence ou sous l'un de ses alias
+            names = _reference_names(unit)
+            unit_id = next((self._ids[name] for name in sorted(names) if name in self._ids), None)
+            if unit_id is not None:
+                for name in names:
+                    self._ids.setdefault(name, unit_id)
+
+    def _add(self, unit_id, name, nominal):
+        self._ids[normalize_name(name)] = unit_id
+        self._names[unit_id] = name
+        self.nominals[unit_id] = nominal
+        if nominal:
+            self.low_thresholds[unit_id] = LOW_PRODUCTION_RATIO * nominal
+
+    def _fuzzy_match(self, name, claimed):
+        # Candidats : unités de même numéro de tranche, pas encore associées à une colonne
+        number = _unit_number(name)
+        candidates = {normalize_name(n): unit_id for unit_id, n in self._names.items()
+                      if unit_id not in claimed and _unit_number(normalize_name(n)) == number}
+        matches = difflib.get_close_matches(name, list(candidates), n=1, cutoff=FUZZY_CUTOFF)
+        return candidates[matches[0]] if matches else None
+
+    def lookup(self, name):
+        """
+        Retourne l'id de l'unité de ce nom (ou d'un alias), None si elle est
+        inconnue. Contrairement à `resolve()`, aucune unité n'est insérée.
+        """
+        return self._ids.get(normalize_name(name))
+
+    def resolve(self, names):
+        """
+        Retourne {nom: id} pour les noms de colonnes donnés, en insérant les
+        unités inconnues (sans métadonnées, à compléter dans le fichier de référence).
+        """
+        resolved = {}
+        unresolved = []
+        for name in names:
+            unit_id = self._ids.get(normalize_name(name))
+            if unit_id is None:
+                unresolved.append(name)
+            else:
+                resolved[name] = unit_id
+
+        claimed = set(resolved.values())
+        for name in unresolved:
+            unit_id = self._fuzzy_match(normalize_name(name), claimed)
+            if unit_id is not None:
+                self.renamed[name] = self._names[unit_id]
+                logger.warning(f"[{self.zone}] Unité '{name}' rapprochée de '{self._names[unit_id]}' (renommage ENTSO-E ?)")
+            else:
+                self.cursor.execute('''
+                INSERT INTO units (zone, name, production_type, characteristics)
+                VALUES (?, ?, 'Nuclear', '{}')
+                ''', (self.zone, name))
+                unit_id = self.cursor.lastrowid
+                self._add(unit_id, name, None)
+                self.created.append(name)
+                logger.warning(f"[{self.zone}] Unité '{name}' absente du référentiel, insérée sans métadonnées (id {unit_id})")
+            self._ids[normalize_name(name)] = unit_id
+            claimed.add(unit_id)
+            resolved[name] = unit_id
+        return resolved
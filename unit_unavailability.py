@@ -0,0 +1,144 @@
+"""
+Avis d'indisponibilité des unités de production publiés sur ENTSO-E.
+
+`_1_getTransparencyAPI.py` récupère, en parallèle des données de production
+et sur la même période, les avis d'indisponibilité des unités de la zone
+(documentType A80 : arrêts programmés et arrêts fortuits) et les écrit dans un
+fichier `..._unavailability.csv`, une ligne par période de disponibilité d'un avis.
+
+`_3_import_csv.py` regroupe ces lignes par avis (identifiant mRID, révision et
+unité) et les enregistre dans la table indexée `unit_unavailability`, rattachée
+à la table `units` : seuls les avis des unités connues sont conservés. Un avis
+révisé par ENTSO-E est enregistré sous une nouvelle révision ; le rapport ne
+retient que la dernière révision de chaque avis, hors avis annulés ou retirés.
+
+Les timestamps sont en heure locale de Paris, sans fuseau horaire, comme dans
+la table `production`.
+"""
+import csv
+
+UNAVAILABILITY_SUFFIX = '_unavailability.csv'
+
+# Types d'indisponibilité (libellés `entsoe-py` des codes businessType A53 et A54)
+PLANNED_OUTAGE = 'Planned maintenance'
+FORCED_OUTAGE = 'Unplanned outage'
+
+# Colonnes du fichier des avis (nom -> colonne du DataFrame `entsoe-py`, None pour l'index)
+NOTICE_COLUMNS = {
+    'mrid': 'mrid',
+    'revision': 'revision',
+    'docstatus': 'docstatus',
+    'business_type': 'businesstype',
+    'resource_name': 'production_resource_name',
+    'unit_name': 'production_resource_psr_name',
+    'nominal_power': 'nominal_power',
+    'start': 'start',
+    'end': 'end',
+    'avail_qty': 'avail_qty',
+    'created_at': None,
+}
+
+
+def _local_text(values):
+    # Horodatages avec fuseau -> texte en heure locale de Paris, sans fuseau
+    import pandas as pd
+    return pd.to_datetime(pd.Series(values), utc=True).dt.tz_convert('Europe/Paris').dt.strftime('%Y-%m-%dT%H:%M:%S').values
+
+
+def write_notices(df, path_prefix):
+    """
+    Écrit les avis retournés par `query_unavailability_of_generation_units`
+    dans `path_prefix` suivi de UNAVAILABILITY_SUFFIX. Retourne le chemin écrit.
+    """
+    notices = df.reset_index(drop=True)[[column for column in NOTICE_COLUMNS.values() if column]]
+    notices.columns = [name for name, column in NOTICE_COLUMNS.items() if column]
+    notices['start'] = _local_text(notices['start'])
+    notices['end'] = _local_text(notices['end'])
+    notices['created_at'] = _local_text(df.index)
+    path = path_prefix + UNAVAILABILITY_SUFFIX
+    notices.to_csv(path, index=False)
+    return path
+
+
+def ensure_unavailability_table(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS unit_unavailability (
+        mrid TEXT,
+        revision INTEGER,
+        unit_id INTEGER,
+        business_type TEXT,
+        docstatus TEXT,
+        start_timestamp TEXT,
+        end_timestamp TEXT,       -- Retour prévu de l'unité
+        avail_qty REAL,           -- Puissance disponible minimale pendant l'indisponibilité (MW)
+        nominal_power REAL,
+        created_at TEXT,
+        PRIMARY KEY (mrid, revision, unit_id)
+    ) WITHOUT ROWID
+    ''')
+    # Avis en cours d'une unité à une date (rapport)
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_unit_unavailability_unit_end
+    ON unit_unavailability(unit_id, end_timestamp, start_timestamp)
+    ''')
+
+
+def read_notices(path):
+    """
+    Lit un fichier d'avis et regroupe ses périodes par (mRID, révision, unité).
+
+    Returns:
+        list[dict]: un avis par groupe ; `start` et `end` couvrent toutes ses
+        périodes, `avail_qty` est la puissance disponible minimale.
+    """
+    notices = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            unit_name = row['unit_name'] or row['resource_name']
+            key = (row['mrid'], int(row['revision']), unit_name)
+            avail_qty = float(row['avail_qty']) if row['avail_qty'] else None
+            notice = notices.get(key)
+            if notice is None:
+                notices[key] = dict(row, unit_name=unit_name, revision=key[1], avail_qty=avail_qty,
+                                    nominal_power=float(row['nominal_power']) if row['nominal_power'] else None)
+                continue
+            notice['start'] = min(notice['start'], row['start'])
+            notice['end'] = max(notice['end'], row['end'])
+            if avail_qty is not None:
+                notice['avail_qty'] = avail_qty if notice['avail_qty'] is None else min(notice['avail_qty'], avail_qty)
+    return list(notices.values())
+
+
+def import_notices(cursor, path, registry):
+    """
+    Enregistre les avis d'un fichier pour les unités connues du référentiel.
+
+    Args:
+        cursor: curseur SQLite.
+        path (str): fichier écrit par `write_notices()`.
+        registry (UnitRegistry): unités de la zone du fichier.
+
+    Returns:
+        tuple: (avis lus, avis nouveaux, avis d'unités inconnues ignorés).
+    """
+    notices = read_notices(path)
+    rows = []
+    unmatched = 0
+    for notice in notices:
+        unit_id = registry.lookup(notice['unit_name'])
+        if unit_id is None and notice['resource_name']:
+            unit_id = registry.lookup(notice['resource_name'])
+        if unit_id is None:
+            unmatched += 1
+            continue
+        rows.append((notice['mrid'], notice['revision'], unit_id, notice['business_type'],
+                     notice['docstatus'] or None, notice['start'], notice['end'], notice['avail_qty'],
+                     notice['nominal_power'], notice['created_at']))
+    changes_before = cursor.connection.total_changes
+    # Une révision publiée n'est jamais modifiée : les avis déjà enregistrés sont ignorés
+    cursor.executemany('''
+    INSERT OR IGNORE INTO unit_unavailability (mrid, revision, unit_id, business_type, docstatus,
+                                               start_timestamp, end_timestamp, avail_qty, nominal_power, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return len(notices), cursor.connection.total_changes - changes_before, unmatched
@@ -0,0 +1,60 @@
+"""
+Zones de dépôt des offres (bidding zones) suivies par le pipeline.
+
+Les zones sont configurées par la variable d'environnement ENTSOE_ZONES
+(liste séparée par des virgules de codes `entsoe-py`, ex. "FR,BE,CH,ES,FI,SE_3").
+Le code de zone est inscrit dans le nom des fichiers produits par
+`_1_getTransparencyAPI.py` et sert d'espace de noms aux unités en base.
+"""
+import glob
+import os
+import re
+
+DEFAULT_ZONE = 'FR'
+
+# Ex. _1_getTransparencyAPI_SE_3_HIST_202501010000_to_202501110000_output.csv
+_ZONE_IN_FILENAME = re.compile(r'_(?P<zone>[A-Z]{2}(?:_[A-Z0-9]+)*)_(?:HIST|NORM)_\d{12}_to_\d{12}')
+
+
+def configured_zones():
+    """
+    Retourne la liste des zones configurées (FR par défaut), sans doublons.
+    """
+    raw = os.getenv('ENTSOE_ZONES', DEFAULT_ZONE)
+    zones = []
+    for zone in raw.split(','):
+        zone = zone.strip().upper()
+        if zone and zone not in zones:
+            zones.append(zone)
+    return zones or [DEFAULT_ZONE]
+
+
+def zone_from_filename(filename):
+    """
+    Extrait le code de zone du nom d'un fichier du pipeline. Les fichiers
+    antérieurs au multi-zones, sans code de zone, sont rattachés à la France.
+    """
+    match = _ZONE_IN_FILENAME.search(os.path.basename(filename))
+    return match.group('zone') if match else DEFAULT_ZONE
+
+
+def files_for_zone(directory, suffix, zone):
+    """
+    Liste les fichiers du répertoire se terminant par `suffix` et appartenant à la zone.
+    """
+    return [f for f in glob.glob(os.path.join(directory, f'*{suffix}')) if zone_from_filename(f) == zone]
+
+
+def most_recent_file_per_zone(directory, suffix, zones=None):
+    """
+    Retourne {zone: chemin} du fichier le plus récent (date de modification)
+    de chaque zone parmi les fichiers se terminant par `suffix`.
+    """
+    latest = {}
+    for path in glob.glob(os.path.join(directory, f'*{suffix}')):
+        zone = zone_from_filename(path)
+        if zones is not None and zone not in zones:
+            continue
+        if zone not in latest or os.path.getmtime(path) > os.path.getmtime(latest[zone]):
+            latest[zone] = path
+    return latest